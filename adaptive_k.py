@@ -0,0 +1,75 @@
+# adaptive_k.py — choose how many retrieved chunks go into the prompt, per query
+
+from __future__ import annotations
+from typing import Any, Dict, List, Sequence, Tuple
+import os
+
+# "fixed" keeps all k; "adaptive" (opt-in) treats k as an upper bound and
+# trims the top-k by score
+K_MODES = ("adaptive", "fixed")
+K_MODE = os.getenv("APEXMIND_K_MODE", "fixed")
+
+# Scores are cosine similarities (normalized inner product)
+ADAPTIVE_MIN_K = int(os.getenv("APEXMIND_ADAPTIVE_MIN_K", "2"))
+ADAPTIVE_MIN_SCORE = float(os.getenv("APEXMIND_ADAPTIVE_MIN_SCORE", "0.25"))
+# Stop at the first drop between neighbours larger than this
+ADAPTIVE_MAX_GAP = float(os.getenv("APEXMIND_ADAPTIVE_MAX_GAP", "0.08"))
+# Chunks scoring below this share of the best one are dropped too
+ADAPTIVE_REL_SCORE = float(os.getenv("APEXMIND_ADAPTIVE_REL_SCORE", "0.75"))
+
+# Rough prompt-token estimate for reporting (no tokenizer dependency)
+CHARS_PER_TOKEN = 4
+
+
+def choose_k(
+    scores: Sequence[float],
+    max_k: int,
+    min_k: int = ADAPTIVE_MIN_K,
+    min_score: float = ADAPTIVE_MIN_SCORE,
+    max_gap: float = ADAPTIVE_MAX_GAP,
+    rel_score: float = ADAPTIVE_REL_SCORE,
+) -> int:
+    """
+    How many of `scores` (sorted best first) to keep: at most max_k, never
+    one below min_score; at least min_k of the rest, then cut at the first
+    chunk below rel_score * best or after a gap larger than max_gap.
+    """
+    n = min(len(scores), max_k)
+    if n == 0:
+        return 0
+    floor = max(min_score, rel_score * float(scores[0]))
+    keep = 0
+    while keep < n:
+        s = float(scores[keep])
+        if s < min_score:
+            break
+        if keep >= min_k and (s < floor or float(scores[keep - 1]) - s > max_gap):
+            break
+        keep += 1
+    return keep
+
+
+def estimate_tokens(items: List[Dict[str, Any]]) -> int:
+    return sum(len(item.get("content", "")) for item in items) // CHARS_PER_TOKEN
+
+
+def trim(
+    items: List[Dict[str, Any]],
+    max_k: int,
+    mode: str = K_MODE,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Split score-sorted retrieved items into (kept, stats).
+    """
+    if mode not in K_MODES:
+        raise ValueError(f"Unknown k mode {mode!r}; expected one of {K_MODES}")
+    k = len(items) if mode == "fixed" else choose_k([i["score"] for i in items], max_k)
+    kept, dropped = items[:k], items[k:]
+    return kept, {
+        "mode": mode,
+        "k": len(kept),
+        "max_k": max_k,
+        "dropped": len(dropped),
+        "tokens_est": estimate_tokens(kept),
+        "tokens_saved_est": estimate_tokens(dropped),
+    }
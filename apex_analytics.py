@@ -0,0 +1,238 @@
+# apex_analytics.py
+
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Tuple
+import time
+
+import numpy as np
+
+from apex_engine import (
+    TRAITS,
+    USER_DIR,
+    DOMINANCE_WEIGHTS,
+    MOMENTUM_WINDOW,
+    MOMENTUM_SCALE,
+    load_session_array,
+)
+
+PERCENTILES = [10, 25, 50, 75, 90, 99]
+
+# Points per trajectory chart, however many sessions are stored
+TRAJECTORY_POINTS = 400
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+
+# ----------------------------
+# Loading
+# ----------------------------
+def list_user_ids() -> List[str]:
+    """
+    Every user that has recorded at least one Apex session.
+    """
+    # Legacy CSV stores are read in place until migrated, so count them too
+    user_ids = set()
+    for suffix in ("_sessions.bin", "_sessions.csv"):
+        user_ids.update(p.name[: -len(suffix)] for p in USER_DIR.glob(f"*{suffix}"))
+    return sorted(user_ids)
+
+
+def load_session_tensor(
+    user_ids: Optional[List[str]] = None,
+    window: int = MOMENTUM_WINDOW,
+) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Load each user's last `window` sessions into a (users x window x traits)
+    float array, so memory does not grow with the longest history.
+
+    Rows are right-aligned: a user's latest session is always at
+    [:, -1, :] and missing earlier sessions are NaN padding on the left.
+    Metrics over the whole history are reduced per user while loading:
+    avg_var is the variance of the per-session average score.
+    Returns (user_ids, scores, lengths, avg_var).
+    """
+    if user_ids is None:
+        user_ids = list_user_ids()
+
+    scores = np.full((len(user_ids), window, len(TRAITS)), np.nan, dtype=np.float64)
+    lengths = np.zeros(len(user_ids), dtype=np.int64)
+    avg_var = np.zeros(len(user_ids), dtype=np.float64)
+    for row, user_id in enumerate(user_ids):
+        traits = load_session_array(user_id)["traits"]
+        lengths[row] = len(traits)
+        if len(traits):
+            tail = traits[-window:]
+            scores[row, window - len(tail):, :] = tail
+            avg_var[row] = traits.mean(axis=1, dtype=np.float64).var()
+
+    return user_ids, scores, lengths, avg_var
+
+
+# ----------------------------
+# Vectorized metrics
+# ----------------------------
+# Each function mirrors its scalar counterpart in apex_engine and returns
+# one value per user.
+def batch_momentum(scores: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Vectorized compute_momentum.
+    """
+    recent = scores[:, -MOMENTUM_WINDOW:, :]
+    deltas = np.diff(recent, axis=1)
+    valid = ~np.isnan(deltas)
+
+    count = valid.sum(axis=(1, 2))
+    total = np.where(valid, deltas, 0.0).sum(axis=(1, 2))
+    avg_delta = np.divide(total, count, out=np.zeros(len(scores)), where=count > 0)
+
+    momentum = np.clip(avg_delta / MOMENTUM_SCALE, -1.0, 1.0)
+    momentum[lengths < 2] = 0.0
+    return momentum
+
+
+def batch_volatility(avg_var: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Vectorized compute_volatility, from load_session_tensor's avg_var.
+    """
+    vol = np.clip(np.sqrt(avg_var) / 100.0, 0.0, 1.0)
+    vol[lengths < 2] = 0.0
+    return vol
+
+
+def batch_dominance_index(scores: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Vectorized compute_dominance_index over each user's latest session.
+    """
+    if scores.shape[1] == 0:
+        return np.zeros(len(scores))
+
+    weights = np.array([DOMINANCE_WEIGHTS[t] for t in TRAITS], dtype=np.float64)
+    latest = np.nan_to_num(scores[:, -1, :], nan=0.0)
+    raw = latest @ weights / (weights.sum() * 100.0)
+
+    dominance = np.clip(raw, 0.0, 1.0)
+    dominance[lengths == 0] = 0.0
+    return dominance
+
+
+# ----------------------------
+# Fleet-wide summaries
+# ----------------------------
+def _distribution(values: np.ndarray) -> Dict[str, Any]:
+    if not len(values):
+        return {"mean": 0.0, "percentiles": {}}
+
+    pct = np.percentile(values, PERCENTILES)
+    return {
+        "mean": float(values.mean()),
+        "percentiles": {f"p{p}": float(v) for p, v in zip(PERCENTILES, pct)},
+    }
+
+
+def compute_fleet_metrics(
+    user_ids: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Momentum, volatility and dominance for every user in one pass.
+    Returns per-user arrays plus distribution summaries for dashboards.
+    """
+    user_ids, scores, lengths, avg_var = load_session_tensor(user_ids)
+
+    momentum = batch_momentum(scores, lengths)
+    volatility = batch_volatility(avg_var, lengths)
+    dominance = batch_dominance_index(scores, lengths)
+
+    return {
+        "user_ids": user_ids,
+        "sessions": lengths,
+        "momentum": momentum,
+        "volatility": volatility,
+        "dominance_index": dominance,
+        "summary": {
+            "users": len(user_ids),
+            "momentum": _distribution(momentum),
+            "volatility": _distribution(volatility),
+            "dominance_index": _distribution(dominance),
+        },
+    }
+
+
+# ----------------------------
+# Trajectory downsampling
+# ----------------------------
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of n_out points that keep the
+    visual shape of the series (first and last always kept).
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # n_out - 2 buckets between the fixed endpoints
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        # Average of the next bucket (or the last point) is the third vertex
+        nlo, nhi = hi, edges[b + 2] if b + 2 < len(edges) else n
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        out[b + 1] = a
+    return out
+
+
+def minmax_buckets(y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Indices of the min and max of each of n_out // 2 equal buckets, in
+    order, so spikes survive downsampling.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=np.float64)
+    bucket = np.arange(n) * (n_out // 2) // n
+    # Within each bucket, sorted by value: first = min, last = max
+    order = np.lexsort((y, bucket))
+    starts = np.flatnonzero(np.r_[True, bucket[order][1:] != bucket[order][:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    return np.unique(np.concatenate([order[starts], order[ends]]))
+
+
+def downsample_trajectory(
+    user_id: str,
+    trait: str,
+    max_points: int = TRAJECTORY_POINTS,
+    method: str = "lttb",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (session indices, scores) of one trait over the user's whole session
+    store, reduced to at most max_points.
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unknown downsampling method {method!r}; expected one of {DOWNSAMPLE_METHODS}")
+
+    records = load_session_array(user_id)
+    x = records["session"].astype(np.int64)
+    y = records["traits"][:, TRAITS.index(trait)].astype(np.float64)
+
+    keep = lttb(x, y, max_points) if method == "lttb" else minmax_buckets(y, max_points)
+    return x[keep], y[keep]
+
+
+if __name__ == "__main__":
+    t0 = time.perf_counter()
+    fleet = compute_fleet_metrics()
+    elapsed = time.perf_counter() - t0
+
+    print(f"Users analysed: {fleet['summary']['users']} in {elapsed:.2f}s")
+    for metric in ["dominance_index", "momentum", "volatility"]:
+        print(f"\n--- {metric} ---")
+        print(fleet["summary"][metric])
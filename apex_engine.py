@@ -2,11 +2,18 @@
 
 from __future__ import annotations
 from pathlib import Path
-from typing import Dict, Any, List
-from datetime import datetime
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timezone
 import csv
 import json
 import math
+import os
+import time
+
+import numpy as np
+
+from persistence import FileLock, UnitOfWork, append_bytes, delete_file, put_bytes, write_json
+from telemetry import span
 
 # Traits we track
 TRAITS = [
@@ -18,6 +25,27 @@ TRAITS = [
     "clarity",
 ]
 
+# Weights behind the dominance index (shared with apex_analytics)
+DOMINANCE_WEIGHTS = {
+    "discipline": 1.2,
+    "consistency": 1.3,
+    "execution": 1.3,
+    "adaptability": 1.0,
+    "ego_strength": 1.4,
+    "clarity": 1.0,
+}
+
+# Momentum looks at the last few sessions and scales deltas into [-1, 1]
+MOMENTUM_WINDOW = 5
+MOMENTUM_SCALE = 25.0
+
+# Fixed-width binary session record: 4 + 8 + 6 * 4 = 36 bytes
+SESSION_DTYPE = np.dtype([
+    ("session", "<u4"),
+    ("timestamp", "<f8"),   # unix epoch seconds, UTC
+    ("traits", "<f4", (len(TRAITS),)),
+])
+
 BASE_DIR = Path(__file__).resolve().parent
 USER_DIR = BASE_DIR / "user_data"
 USER_DIR.mkdir(exist_ok=True)
@@ -27,9 +55,15 @@ USER_DIR.mkdir(exist_ok=True)
 # Helpers
 # ----------------------------
 def _sessions_csv_path(user_id: str) -> Path:
+    # Legacy text format, read in place until the next session append
+    # converts it to the binary store
     return USER_DIR / f"{user_id}_sessions.csv"
 
 
+def _sessions_bin_path(user_id: str) -> Path:
+    return USER_DIR / f"{user_id}_sessions.bin"
+
+
 def _apex_meta_path(user_id: str) -> Path:
     return USER_DIR / f"{user_id}_apex_meta.json"
 
@@ -38,11 +72,64 @@ def _now_iso() -> str:
     return datetime.utcnow().isoformat() + "Z"
 
 
-def _ensure_sessions_header(path: Path):
-    if not path.exists():
-        with open(path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(["session", "timestamp"] + TRAITS)
+def _iso_to_epoch(ts: str) -> float:
+    try:
+        return datetime.fromisoformat(ts.rstrip("Z")).replace(tzinfo=timezone.utc).timestamp()
+    except Exception:
+        return 0.0
+
+
+def _sessions_lock(user_id: str) -> FileLock:
+    # Serializes the CSV -> binary migration against other appenders
+    return FileLock(USER_DIR / f"{user_id}_sessions.lock")
+
+
+def _read_sessions_csv(user_id: str) -> np.ndarray:
+    """
+    Parse an old `<user>_sessions.csv` into SESSION_DTYPE records, sorted
+    by session index. Read-only.
+    """
+    rows = []
+    with open(_sessions_csv_path(user_id), "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            traits = []
+            for t in TRAITS:
+                try:
+                    traits.append(float(row.get(t, 0.0)))
+                except Exception:
+                    traits.append(0.0)
+            rows.append((int(row["session"]), _iso_to_epoch(row["timestamp"]), traits))
+
+    records = np.array(rows, dtype=SESSION_DTYPE)
+    return records[np.argsort(records["session"], kind="stable")]
+
+
+def _legacy_sessions(user_id: str) -> Optional[np.ndarray]:
+    """
+    Records from a not yet migrated CSV, or None once (or if never) there
+    is one. Reads never migrate: that is a write, done by the next append.
+    """
+    if _sessions_bin_path(user_id).exists():
+        return None
+    try:
+        return _read_sessions_csv(user_id)
+    except FileNotFoundError:
+        # No legacy file, or a writer has just migrated it
+        return None
+
+
+def _migrate_sessions_csv(user_id: str, uow: UnitOfWork) -> None:
+    """
+    Stage the conversion of an old CSV into the binary session store on
+    `uow`; call with the user's sessions lock held.
+    """
+    csv_path = _sessions_csv_path(user_id)
+    bin_path = _sessions_bin_path(user_id)
+    if bin_path.exists() or not csv_path.exists():
+        return
+    put_bytes(bin_path, _read_sessions_csv(user_id).tobytes(), uow=uow)
+    delete_file(csv_path, uow=uow)
 
 
 # ----------------------------
@@ -52,45 +139,93 @@ def append_session_row(
     user_id: str,
     session_idx: int,
     scores: Dict[str, float],
-) -> None:
-    csv_path = _sessions_csv_path(user_id)
-    _ensure_sessions_header(csv_path)
+    uow: Optional[UnitOfWork] = None,
+) -> Dict[str, Any]:
+    """
+    Append one session record and return it in load_sessions() form.
+    A legacy CSV is migrated in the same unit of work, under the user's
+    sessions lock.
+    """
+    if uow is None:
+        with UnitOfWork(durable=False) as own:
+            return append_session_row(user_id, session_idx, scores, uow=own)
 
-    row = [session_idx, _now_iso()]
-    for t in TRAITS:
-        row.append(float(scores.get(t, 0.0)))
+    if _sessions_csv_path(user_id).exists():
+        # Re-checked under the lock: another writer may have migrated it
+        _sessions_lock(user_id).hold(uow)
+        _migrate_sessions_csv(user_id, uow)
 
-    with open(csv_path, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(row)
+    record = np.zeros(1, dtype=SESSION_DTYPE)
+    record["session"] = session_idx
+    record["timestamp"] = time.time()
+    record["traits"] = [float(scores.get(t, 0.0)) for t in TRAITS]
 
+    with span("write.session"):
+        # Aligned to whole records: a torn record left by a crash is
+        # overwritten rather than shifting every later one
+        append_bytes(_sessions_bin_path(user_id), record.tobytes(), uow=uow,
+                     align=SESSION_DTYPE.itemsize)
+    return _records_to_sessions(record)[0]
+
+
+def session_count(user_id: str) -> int:
+    """
+    Number of stored sessions, read from the file size alone.
+    """
+    legacy = _legacy_sessions(user_id)
+    if legacy is not None:
+        return len(legacy)
+    path = _sessions_bin_path(user_id)
+    if not path.exists():
+        return 0
+    return path.stat().st_size // SESSION_DTYPE.itemsize
+
+
+def load_session_array(user_id: str) -> np.ndarray:
+    """
+    The user's sessions as a structured array of SESSION_DTYPE, sorted by
+    session index. No text parsing involved once migrated. One read, not a
+    memory map: at 36 bytes a session even years of history are a few KB,
+    and mapping costs several times more per user (see bench_analytics).
+    """
+    legacy = _legacy_sessions(user_id)
+    if legacy is not None:
+        return legacy
+
+    try:
+        with open(_sessions_bin_path(user_id), "rb") as f:
+            # A torn trailing record (crash mid-append) is left out of `count`
+            count = os.fstat(f.fileno()).st_size // SESSION_DTYPE.itemsize
+            records = np.fromfile(f, dtype=SESSION_DTYPE, count=count)
+    except FileNotFoundError:
+        return np.zeros(0, dtype=SESSION_DTYPE)
+
+    if count > 1 and np.any(np.diff(records["session"].astype(np.int64)) < 0):
+        records = records[np.argsort(records["session"], kind="stable")]
+    return records
 
-def load_sessions(user_id: str) -> List[Dict[str, Any]]:
-    csv_path = _sessions_csv_path(user_id)
-    if not csv_path.exists():
-        return []
 
+def _records_to_sessions(records: np.ndarray) -> List[Dict[str, Any]]:
     sessions: List[Dict[str, Any]] = []
-    with open(csv_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            # Convert numeric fields
-            s: Dict[str, Any] = {
-                "session": int(row["session"]),
-                "timestamp": row["timestamp"],
-            }
-            for t in TRAITS:
-                try:
-                    s[t] = float(row.get(t, 0.0))
-                except Exception:
-                    s[t] = 0.0
-            sessions.append(s)
+    for session, ts, traits in zip(
+        records["session"].tolist(),
+        records["timestamp"].tolist(),
+        records["traits"].tolist(),
+    ):
+        s: Dict[str, Any] = {
+            "session": session,
+            "timestamp": datetime.utcfromtimestamp(ts).isoformat() + "Z",
+        }
+        s.update(zip(TRAITS, traits))
+        sessions.append(s)
 
-    # Ensure sorted by session index
-    sessions.sort(key=lambda x: x["session"])
     return sessions
 
 
+def load_sessions(user_id: str) -> List[Dict[str, Any]]:
+    return _records_to_sessions(load_session_array(user_id))
+
+
 # ----------------------------
 # Metrics Calculations
 # ----------------------------
@@ -103,7 +238,7 @@ def compute_momentum(sessions: List[Dict[str, Any]]) -> float:
         return 0.0
 
     # Use last up to 5 sessions
-    recent = sessions[-5:]
+    recent = sessions[-MOMENTUM_WINDOW:]
     deltas = []
 
     for i in range(1, len(recent)):
@@ -117,7 +252,7 @@ def compute_momentum(sessions: List[Dict[str, Any]]) -> float:
 
     avg_delta = sum(deltas) / len(deltas)
     # Scale down: assume 0–100 scale, normalize to [-1, 1] approx
-    momentum = max(-1.0, min(1.0, avg_delta / 25.0))
+    momentum = max(-1.0, min(1.0, avg_delta / MOMENTUM_SCALE))
     return momentum
 
 
@@ -146,14 +281,7 @@ def compute_dominance_index(scores: Dict[str, float]) -> float:
     Dominance index ~ how close you are to "top 1% competitor".
     Weighted combination of traits, 0.0–1.0.
     """
-    weights = {
-        "discipline": 1.2,
-        "consistency": 1.3,
-        "execution": 1.3,
-        "adaptability": 1.0,
-        "ego_strength": 1.4,
-        "clarity": 1.0,
-    }
+    weights = DOMINANCE_WEIGHTS
     total_w = sum(weights.values())
     num = 0.0
     for t, w in weights.items():
@@ -209,29 +337,44 @@ def determine_focus_arc(scores: Dict[str, float]) -> Dict[str, Any]:
     }
 
 
+def load_apex_state(user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Last saved Apex state for the user, or None before their first session.
+    """
+    meta_path = _apex_meta_path(user_id)
+    if not meta_path.exists():
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
 # ----------------------------
 # APEX STATE UPDATE
 # ----------------------------
-def update_apex_state(user_id: str, scores: Dict[str, float]) -> Dict[str, Any]:
+def update_apex_state(
+    user_id: str,
+    scores: Dict[str, float],
+    uow: Optional[UnitOfWork] = None,
+) -> Dict[str, Any]:
     """
     Called each session after scores are updated.
-    - Append new row to CSV
+    With `uow`, the session append and meta write are staged on it.
+    - Append new row to the binary session store
     - Recompute metrics (momentum, volatility, dominance)
     - Determine modes + focus arc
     - Save to JSON meta
     - Return all metrics
     """
+    import cohort_stats   # imports this module for TRAITS/dominance
+
     # 1. Load existing sessions to infer current session index
     sessions = load_sessions(user_id)
     next_session_idx = (sessions[-1]["session"] + 1) if sessions else 1
 
-    # 2. Append new session row
-    append_session_row(user_id, next_session_idx, scores)
-
-    # 3. Reload with the new row included
-    sessions = load_sessions(user_id)
+    # 2. Append new session row (kept in memory too, so no reload needed)
+    sessions.append(append_session_row(user_id, next_session_idx, scores, uow=uow))
 
-    # 4. Compute metrics
+    # 3. Compute metrics
     momentum = compute_momentum(sessions)
     volatility = compute_volatility(sessions)
     dominance_index = compute_dominance_index(scores)
@@ -246,12 +389,14 @@ def update_apex_state(user_id: str, scores: Dict[str, float]) -> Dict[str, Any]:
         "dominance_index": dominance_index,
         "modes": modes,
         "focus_arc": focus_arc,
+        # Where these scores rank among all users ("top X%"), from the
+        # incrementally maintained cohort histograms; no profile scan
+        "cohort": cohort_stats.rank(scores, uow=uow),
         "updated_at": _now_iso(),
     }
 
-    # 5. Save meta for later inspection / dashboards
-    meta_path = _apex_meta_path(user_id)
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(apex, f, ensure_ascii=False, indent=2)
+    # 4. Save meta for later inspection / dashboards
+    with span("write.apex_meta"):
+        write_json(_apex_meta_path(user_id), apex, uow=uow, indent=2)
 
     return apex
@@ -0,0 +1,274 @@
+# api_server.py — headless HTTP API for ApexMind
+
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+import argparse
+import json
+import os
+import re
+import threading
+import traceback
+
+from memory_system import load_user_profile, estimate_progress_level
+from apex_engine import load_apex_state
+from kb_registry import NAMESPACE_RE, UnknownKnowledgeBase
+import telemetry
+
+# ========================================
+#              CONFIG
+# ========================================
+API_WORKERS = int(os.getenv("APEXMIND_API_WORKERS", "8"))
+# Asks allowed to wait for a worker before new ones get 503
+API_QUEUE_LIMIT = int(os.getenv("APEXMIND_API_QUEUE_LIMIT", "32"))
+API_ASK_TIMEOUT = float(os.getenv("APEXMIND_API_ASK_TIMEOUT", "120"))
+MAX_BODY_BYTES = 64 * 1024
+
+# User ids become file names under user_data/
+USER_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+# ========================================
+#        SHARED AGENT (one per process)
+# ========================================
+# rag_step4_agent loads the FAISS index, metadata and embedder at import,
+# so importing it once in the background shares them across all requests.
+_agent = None
+_agent_ready = threading.Event()
+_agent_error: Optional[str] = None
+
+_pool = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="apexmind-ask")
+_slots = threading.BoundedSemaphore(API_WORKERS + API_QUEUE_LIMIT)
+
+
+def _load_agent() -> None:
+    global _agent, _agent_error
+    try:
+        import rag_step4_agent
+        _agent = rag_step4_agent
+    except Exception as e:
+        _agent_error = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    finally:
+        _agent_ready.set()
+
+
+def start_loading() -> None:
+    threading.Thread(target=_load_agent, name="apexmind-load", daemon=True).start()
+
+
+# ========================================
+#              HANDLERS
+# ========================================
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _require_agent():
+    if _agent is None:
+        raise ApiError(503, _agent_error or "agent is still loading")
+    return _agent
+
+
+def _require_user_id(value: Any) -> str:
+    if not isinstance(value, str) or not USER_ID_RE.match(value):
+        raise ApiError(400, "invalid user_id")
+    return value
+
+
+def _optional_namespace(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if not isinstance(value, str) or not NAMESPACE_RE.match(value):
+        raise ApiError(400, "invalid namespace")
+    return value
+
+
+def _int_param(value: Any, name: str, lo: int, hi: int) -> int:
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ApiError(400, f"invalid {name}")
+    try:
+        n = int(value)
+    except ValueError:
+        raise ApiError(400, f"invalid {name}")
+    return max(lo, min(n, hi))
+
+
+def _optional_filters(value: Any) -> Optional[Dict[str, Any]]:
+    # {"field": "value" | ["value", ...]} over chunk metadata, e.g. "source"
+    if value is None:
+        return None
+    if not isinstance(value, dict) or len(value) > 8:
+        raise ApiError(400, "invalid filters")
+    for field, wanted in value.items():
+        values = [wanted] if isinstance(wanted, str) else wanted
+        if (not isinstance(field, str) or not isinstance(values, list) or not values
+                or len(values) > 64 or not all(isinstance(v, str) for v in values)):
+            raise ApiError(400, "invalid filters")
+    return value
+
+
+def handle_ask(body: Dict[str, Any]) -> Dict[str, Any]:
+    agent = _require_agent()
+    user_id = _require_user_id(body.get("user_id"))
+    query = str(body.get("query", "")).strip()
+    if not query:
+        raise ApiError(400, "query is required")
+    namespace = _optional_namespace(body.get("namespace"))
+    filters = _optional_filters(body.get("filters"))
+
+    # Bounded pool: refuse instead of queueing without limit
+    if not _slots.acquire(blocking=False):
+        raise ApiError(503, "server busy, retry later")
+    try:
+        future = _pool.submit(agent.ask_agent, user_id, query, namespace, filters)
+    except BaseException:
+        _slots.release()
+        raise
+    # The slot belongs to the task, not the request: a timed-out ask keeps
+    # its worker busy until it finishes
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result(timeout=API_ASK_TIMEOUT)
+
+
+def handle_retrieve(body: Dict[str, Any]) -> Dict[str, Any]:
+    agent = _require_agent()
+    query = str(body.get("query", "")).strip()
+    if not query:
+        raise ApiError(400, "query is required")
+    k = _int_param(body.get("k", 5), "k", 1, 50)
+
+    user_id = body.get("user_id")
+    if user_id is not None:
+        user_id = _require_user_id(user_id)
+
+    namespace = _optional_namespace(body.get("namespace"))
+    filters = _optional_filters(body.get("filters"))
+    # Always exactly k when available: adaptive trimming is for prompts only
+    return {"results": agent.retrieve_context(query, k=k, user_id=user_id, namespace=namespace,
+                                              filters=filters, k_mode="fixed")}
+
+
+def handle_profile(user_id: str) -> Dict[str, Any]:
+    profile = load_user_profile(_require_user_id(user_id))
+    if profile is None:
+        raise ApiError(404, "unknown user")
+    return {"profile": profile, "progress": estimate_progress_level(profile)}
+
+
+def handle_apex(user_id: str) -> Dict[str, Any]:
+    apex = load_apex_state(_require_user_id(user_id))
+    if apex is None:
+        raise ApiError(404, "no apex state for user")
+    return apex
+
+
+def handle_ready() -> Tuple[int, Dict[str, Any]]:
+    if _agent is not None:
+        return 200, {"status": "ready"}
+    if _agent_error is not None:
+        return 503, {"status": "error", "error": _agent_error}
+    return 503, {"status": "loading"}
+
+
+# ========================================
+#              HTTP LAYER
+# ========================================
+class ApexRequestHandler(BaseHTTPRequestHandler):
+    server_version = "ApexMind/1.0"
+
+    def _send(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self._send_bytes(status, data, "application/json; charset=utf-8")
+
+    def _send_bytes(self, status: int, data: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        if status == 503:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise ApiError(413, "request body too large")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise ApiError(400, "body must be JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "body must be a JSON object")
+        return body
+
+    def _dispatch(self, method: str) -> None:
+        path = self.path.split("?", 1)[0].rstrip("/")
+        try:
+            if method == "GET" and path == "/healthz":
+                self._send(200, {"status": "ok"})
+            elif method == "GET" and path == "/readyz":
+                self._send(*handle_ready())
+            elif method == "GET" and path == "/metrics":
+                self._send_bytes(
+                    200,
+                    telemetry.prometheus_text().encode("utf-8"),
+                    "text/plain; version=0.0.4; charset=utf-8",
+                )
+            elif method == "GET" and path.startswith("/profile/"):
+                self._send(200, handle_profile(path[len("/profile/"):]))
+            elif method == "GET" and path.startswith("/apex/"):
+                self._send(200, handle_apex(path[len("/apex/"):]))
+            elif method == "POST" and path == "/ask":
+                self._send(200, handle_ask(self._read_json()))
+            elif method == "POST" and path == "/retrieve":
+                self._send(200, handle_retrieve(self._read_json()))
+            else:
+                raise ApiError(404, "not found")
+        except ApiError as e:
+            self._send(e.status, {"error": e.message})
+        except UnknownKnowledgeBase as e:
+            self._send(404, {"error": str(e)})
+        except TimeoutError:
+            self._send(504, {"error": "ask timed out"})
+        except Exception as e:
+            traceback.print_exc()
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def do_GET(self) -> None:
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:
+        self._dispatch("POST")
+
+    def log_message(self, format: str, *args) -> None:
+        # Keep request logs off stderr unless asked for
+        if os.getenv("APEXMIND_API_ACCESS_LOG"):
+            super().log_message(format, *args)
+
+
+def serve(host: str = "127.0.0.1", port: int = 8080) -> None:
+    start_loading()
+    httpd = ThreadingHTTPServer((host, port), ApexRequestHandler)
+    httpd.daemon_threads = True
+    print(f"ApexMind API listening on http://{host}:{port} ({API_WORKERS} workers)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        _pool.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ApexMind headless HTTP API")
+    parser.add_argument("--host", default=os.getenv("APEXMIND_API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("APEXMIND_API_PORT", "8080")))
+    args = parser.parse_args()
+
+    serve(args.host, args.port)
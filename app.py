@@ -5,7 +5,10 @@ import pandas as pd
 import html
 from typing import List, Dict, Any
 
-from rag_step4_agent import ask_agent, retrieve_context
+from rag_step4_agent import ask_agent
+from apex_engine import TRAITS, session_count
+from apex_analytics import DOWNSAMPLE_METHODS, TRAJECTORY_POINTS, downsample_trajectory
+import telemetry
 
 
 # ==========================================================
@@ -107,12 +110,106 @@ html, body, [class*="css"] {
 """, unsafe_allow_html=True)
 
 
+# ==========================================================
+# RENDER HELPERS
+# ==========================================================
+# Chat history shows the latest CHAT_PAGE_SIZE messages; older ones are
+# paged in on demand so rerun cost does not grow with the conversation.
+CHAT_PAGE_SIZE = 20
+
+# Fragments rerun on their own when their widgets change (Streamlit >= 1.37)
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", lambda f: f)
+
+
+def _message_html(role: str, content: str) -> str:
+    text = html.escape(content).replace("\n", "<br>")
+    if role == "user":
+        return f"<div class='user-msg'>🧍 <b>You:</b> {text}</div>"
+    return f"<div class='agent-msg'>🤖 <b>ApexMind:</b> {text}</div>"
+
+
+def _chunk_cards_html(docs: List[Dict[str, Any]]) -> str:
+    cards = []
+    for i, doc in enumerate(docs, 1):
+
+        score = float(doc["score"])
+        heat = max(0.0, min(score, 1.0))
+        bar_color = f"rgba(127, 90, 240, {0.35 + heat/2})"
+
+        safe_text = html.escape(doc["content"]).replace("\\n", "\n")
+        source = html.escape(doc["source"])
+
+        cards.append(f"""
+        <div style="padding: 16px; margin-bottom: 15px; border-radius: 14px;
+            background: rgba(255,255,255,0.05); border: 1px solid rgba(255,255,255,0.12);">
+
+            <div style="display:flex; justify-content:space-between; align-items:center;">
+                <div style="font-size:17px; font-weight:600;">#{i} • {source}</div>
+                <div style="font-size:13px; opacity:0.8;">Similarity: {score:.3f}</div>
+            </div>
+
+            <div style="height:8px; background:rgba(255,255,255,0.08);
+                        border-radius:4px; margin-top:8px;">
+                <div style="height:100%; width:{heat*100}%; background:{bar_color};"></div>
+            </div>
+
+            <details style="margin-top:14px;">
+                <summary style="font-size:14px; cursor:pointer;">📄 View full chunk</summary>
+                <pre style="white-space:pre-wrap; margin-top:12px; opacity:0.88;">{safe_text}</pre>
+            </details>
+
+        </div>
+        """)
+    return "".join(cards)
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _scores_frame(scores: tuple) -> pd.DataFrame:
+    return pd.DataFrame(list(scores), columns=["Trait", "Score"]).set_index("Trait")
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _trajectory_frame(user_id: str, n_sessions: int, trait: str, method: str) -> pd.DataFrame:
+    # n_sessions is part of the cache key: a new session invalidates it.
+    # Downsampled to TRAJECTORY_POINTS, so chart size is independent of history length
+    traits = TRAITS if trait == "All traits" else [trait]
+    series = []
+    for t in traits:
+        x, y = downsample_trajectory(user_id, t, TRAJECTORY_POINTS, method)
+        series.append(pd.Series(y, index=x, name=t))
+    # Traits keep different sessions; fill the gaps so every line is continuous
+    return pd.concat(series, axis=1).sort_index().interpolate(method="index", limit_area="inside")
+
+
+REASONING_TRACE = """
+ApexMind retrieves the most relevant psychological principles for your situation using FAISS vector search.
+Each retrieved chunk influences the final coaching output through:
+
+• Relevance to your weekly report  
+• Psychological category (discipline, clarity, strategy, ego, adaptability)  
+• Actionable value of the chunk  
+• Your Apex performance profile  
+• Your mindset score patterns  
+
+ApexMind then blends:
+- Retrieved knowledge (RAG)
+- Mindset metrics analysis
+- Apex Engine mode logic
+- Cognitive-behavioral coaching methodology
+
+This produces a precise, practical, and personalized coaching response.
+"""
+
+
 # ==========================================================
 # SESSION STATE
 # ==========================================================
 if "chat" not in st.session_state:
     st.session_state.chat: List[Dict[str, Any]] = []
 
+if "chat_pages" not in st.session_state:
+    st.session_state.chat_pages = 1
+
 if "scores_history" not in st.session_state:
     st.session_state.scores_history = []
 
@@ -122,6 +219,9 @@ if "apex_history" not in st.session_state:
 if "last_query_context" not in st.session_state:
     st.session_state.last_query_context = []
 
+if "last_query_html" not in st.session_state:
+    st.session_state.last_query_html = ""
+
 
 # ==========================================================
 # HEADER
@@ -145,40 +245,55 @@ user_id = st.sidebar.text_input("User ID", value="test_user")
 
 if st.sidebar.button("🔁 Reset session"):
     st.session_state.chat = []
+    st.session_state.chat_pages = 1
     st.session_state.scores_history = []
     st.session_state.apex_history = []
     st.session_state.last_query_context = []
+    st.session_state.last_query_html = ""
     st.sidebar.success("Session reset successfully!")
 
 st.sidebar.markdown("---")
 st.sidebar.info("Mode: RAG + Gemini Flash + Apex Engine")
 
-
-# ==========================================================
-# MAIN LAYOUT — CHAT (LEFT) + METRICS (RIGHT)
-# ==========================================================
-col_chat, col_right = st.columns([1.8, 1.2])
+if st.sidebar.checkbox("⏱ Show latency panel"):
+    stats = telemetry.snapshot()
+    if stats["spans"]:
+        latency_df = pd.DataFrame(stats["spans"]).T[["count", "p50_ms", "p95_ms", "p99_ms", "errors"]]
+        st.sidebar.dataframe(latency_df.round(1), use_container_width=True)
+    else:
+        st.sidebar.caption("No requests traced yet.")
+    if stats["counters"]:
+        st.sidebar.json(stats["counters"])
 
 
 # ==========================================================
-# CHAT COLUMN
+# CHAT PANEL
 # ==========================================================
-with col_chat:
+@fragment
+def render_chat(user_id: str) -> None:
 
     st.markdown("<div class='section-header'>💬 Mindset Coaching Chat</div>", unsafe_allow_html=True)
 
-    st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
-
-    if st.session_state.chat:
-        for msg in st.session_state.chat:
-            if msg["role"] == "user":
-                st.markdown(f"<div class='user-msg'>🧍 <b>You:</b> {msg['content']}</div>", unsafe_allow_html=True)
-            else:
-                st.markdown(f"<div class='agent-msg'>🤖 <b>ApexMind:</b> {msg['content']}</div>", unsafe_allow_html=True)
+    chat = st.session_state.chat
+    if chat:
+        window = CHAT_PAGE_SIZE * st.session_state.chat_pages
+        hidden = max(0, len(chat) - window)
+        if hidden and st.button(f"⬆ Show earlier messages ({hidden} hidden)"):
+            st.session_state.chat_pages += 1
+            hidden = max(0, hidden - CHAT_PAGE_SIZE)
+
+        # One markdown call for the whole window, using pre-rendered HTML
+        messages = "".join(
+            msg.get("html") or _message_html(msg["role"], msg["content"])
+            for msg in chat[hidden:]
+        )
+        st.markdown(f"<div class='glass-card'>{messages}</div>", unsafe_allow_html=True)
     else:
-        st.markdown("<div style='opacity:0.6;'>No messages yet. Start by entering your weekly report.</div>", unsafe_allow_html=True)
-
-    st.markdown("</div>", unsafe_allow_html=True)
+        st.markdown(
+            "<div class='glass-card'><div style='opacity:0.6;'>No messages yet. "
+            "Start by entering your weekly report.</div></div>",
+            unsafe_allow_html=True,
+        )
 
     st.markdown("### Enter your weekly report or question")
 
@@ -192,35 +307,64 @@ with col_chat:
         if user_input.strip():
 
             with st.spinner("Analyzing your mindset..."):
-                context_docs = retrieve_context(user_input, k=5)
-                st.session_state.last_query_context = context_docs
-
                 result = ask_agent(user_id, user_input)
 
-            st.session_state.chat.append({"role": "user", "content": user_input})
-            st.session_state.chat.append({"role": "agent", "content": result["answer"]})
+            # A double click is coalesced into the first ask; if that run
+            # already rendered its answer, there is nothing new to add
+            chat = st.session_state.chat
+            if result.get("coalesced") and chat and chat[-1]["content"] == result["answer"]:
+                st.rerun()
+
+            st.session_state.chat.append({
+                "role": "user",
+                "content": user_input,
+                "html": _message_html("user", user_input),
+            })
+            st.session_state.chat.append({
+                "role": "agent",
+                "content": result["answer"],
+                "html": _message_html("agent", result["answer"]),
+            })
 
             st.session_state.scores_history.append(result["scores"])
             st.session_state.apex_history.append(result["apex"])
 
-            st.success("Response generated! Scroll to see analysis.")
+            # ask_agent already retrieved the context; render its cards once
+            st.session_state.last_query_context = result["context"]
+            st.session_state.last_query_html = _chunk_cards_html(result["context"])
+
+            # Metrics, Apex and RAG panels depend on the new result
+            st.rerun()
 
 
 # ==========================================================
-# METRICS COLUMN
+# METRICS + APEX PANEL
 # ==========================================================
-with col_right:
+@fragment
+def render_metrics(user_id: str) -> None:
 
     st.markdown("<div class='section-header'>📊 Mindset Metrics</div>", unsafe_allow_html=True)
     st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
 
     if st.session_state.scores_history:
-        df = pd.DataFrame(st.session_state.scores_history[-1].items(), columns=["Trait", "Score"]).set_index("Trait")
+        df = _scores_frame(tuple(st.session_state.scores_history[-1].items()))
         st.dataframe(df, use_container_width=True)
         st.bar_chart(df)
     else:
         st.info("Metrics will appear after your first interaction.")
 
+    # Full trajectory from the session store, rebuilt only on new sessions
+    count = session_count(user_id)
+    if count:
+        st.markdown("**📈 Trait History**")
+        col_trait, col_method = st.columns([2, 1])
+        trait = col_trait.selectbox("Trait", ["All traits"] + TRAITS, key="trajectory_trait")
+        method = col_method.selectbox("Sampling", DOWNSAMPLE_METHODS, key="trajectory_method",
+                                      help="lttb keeps the shape, minmax keeps every spike")
+        st.line_chart(_trajectory_frame(user_id, count, trait, method))
+        if count > TRAJECTORY_POINTS:
+            st.caption(f"{count:,} sessions, downsampled to {TRAJECTORY_POINTS} points")
+
     st.markdown("</div>", unsafe_allow_html=True)
 
     # APEX STATE
@@ -231,13 +375,13 @@ with col_right:
         apex = st.session_state.apex_history[-1]
         modes = apex.get("modes", [])
         if modes:
-            st.markdown("**Active Modes:**")
-            for m in modes:
-                st.markdown(f"""
-                <span style='padding:4px 10px; border-radius:999px; 
+            chips = "".join(
+                f"""<span style='padding:4px 10px; border-radius:999px;
                 background:rgba(127,90,240,0.2); border:1px solid rgba(127,90,240,0.6);
-                font-size:12px; margin-right:6px;'>{m}</span>
-                """, unsafe_allow_html=True)
+                font-size:12px; margin-right:6px;'>{html.escape(m)}</span>"""
+                for m in modes
+            )
+            st.markdown(f"**Active Modes:**<br>{chips}", unsafe_allow_html=True)
 
         st.json(apex)
     else:
@@ -246,93 +390,62 @@ with col_right:
     st.markdown("</div>", unsafe_allow_html=True)
 
 
-
 # ==========================================================
 # MODEL ANALYSIS ZONE (RAG)
 # ==========================================================
-st.markdown("<br>", unsafe_allow_html=True)
-st.markdown("<div class='section-header' style='font-size:30px;'>🧠 Model Analysis Zone — RAG Context & Reasoning</div>", unsafe_allow_html=True)
-
-st.markdown("""
-<div style="
-    background: rgba(255,255,255,0.04);
-    padding: 25px;
-    border-radius: 16px;
-    border: 1px solid rgba(255,255,255,0.08);
-    backdrop-filter: blur(10px);
-    margin-top: 6px;
-    margin-bottom: 25px;">
-""", unsafe_allow_html=True)
-
+@fragment
+def render_rag_panel() -> None:
+
+    st.markdown("<br>", unsafe_allow_html=True)
+    st.markdown("<div class='section-header' style='font-size:30px;'>🧠 Model Analysis Zone — RAG Context & Reasoning</div>", unsafe_allow_html=True)
+
+    st.markdown("""
+    <div style="
+        background: rgba(255,255,255,0.04);
+        padding: 25px;
+        border-radius: 16px;
+        border: 1px solid rgba(255,255,255,0.08);
+        backdrop-filter: blur(10px);
+        margin-top: 6px;
+        margin-bottom: 25px;">
+    """, unsafe_allow_html=True)
 
-if st.session_state.last_query_context:
+    if st.session_state.last_query_context:
 
-    st.markdown("## 🔍 Top Retrieved Knowledge Chunks")
+        st.markdown("## 🔍 Top Retrieved Knowledge Chunks")
 
-    for i, doc in enumerate(st.session_state.last_query_context, 1):
+        # Cards were rendered to HTML once, when the answer arrived
+        st.markdown(st.session_state.last_query_html, unsafe_allow_html=True)
 
-        score = float(doc["score"])
-        heat = max(0.0, min(score, 1.0))
-        bar_color = f"rgba(127, 90, 240, {0.35 + heat/2})"
+        st.markdown("<hr class='custom-divider'>", unsafe_allow_html=True)
 
-        safe_text = html.escape(doc["content"]).replace("\\n", "\n")
+        st.markdown("## 🧩 Reasoning Trace — How ApexMind Used These Chunks")
 
         st.markdown(f"""
-        <div style="padding: 16px; margin-bottom: 15px; border-radius: 14px;
-            background: rgba(255,255,255,0.05); border: 1px solid rgba(255,255,255,0.12);">
-
-            <div style="display:flex; justify-content:space-between; align-items:center;">
-                <div style="font-size:17px; font-weight:600;">#{i} • {doc['source']}</div>
-                <div style="font-size:13px; opacity:0.8;">Similarity: {score:.3f}</div>
-            </div>
-
-            <div style="height:8px; background:rgba(255,255,255,0.08);
-                        border-radius:4px; margin-top:8px;">
-                <div style="height:100%; width:{heat*100}%; background:{bar_color};"></div>
-            </div>
-
-            <details style="margin-top:14px;">
-                <summary style="font-size:14px; cursor:pointer;">📄 View full chunk</summary>
-                <pre style="white-space:pre-wrap; margin-top:12px; opacity:0.88;">{safe_text}</pre>
-            </details>
-
+        <div style="padding:18px; border-radius:12px; background:rgba(255,255,255,0.03);
+                    border:1px solid rgba(255,255,255,0.12);">
+            <pre style="white-space:pre-wrap; font-size:14px; opacity:0.9;">{REASONING_TRACE}</pre>
         </div>
         """, unsafe_allow_html=True)
 
-    st.markdown("<hr class='custom-divider'>", unsafe_allow_html=True)
-
-    st.markdown("## 🧩 Reasoning Trace — How ApexMind Used These Chunks")
-
-    reasoning = """
-ApexMind retrieves the most relevant psychological principles for your situation using FAISS vector search.
-Each retrieved chunk influences the final coaching output through:
+    else:
+        st.info("Ask a question to view retrieved knowledge and reasoning.")
 
-• Relevance to your weekly report  
-• Psychological category (discipline, clarity, strategy, ego, adaptability)  
-• Actionable value of the chunk  
-• Your Apex performance profile  
-• Your mindset score patterns  
+    st.markdown("</div>", unsafe_allow_html=True)
 
-ApexMind then blends:
-- Retrieved knowledge (RAG)
-- Mindset metrics analysis
-- Apex Engine mode logic
-- Cognitive-behavioral coaching methodology
 
-This produces a precise, practical, and personalized coaching response.
-"""
+# ==========================================================
+# MAIN LAYOUT — CHAT (LEFT) + METRICS (RIGHT)
+# ==========================================================
+col_chat, col_right = st.columns([1.8, 1.2])
 
-    st.markdown(f"""
-    <div style="padding:18px; border-radius:12px; background:rgba(255,255,255,0.03);
-                border:1px solid rgba(255,255,255,0.12);">
-        <pre style="white-space:pre-wrap; font-size:14px; opacity:0.9;">{reasoning}</pre>
-    </div>
-    """, unsafe_allow_html=True)
+with col_chat:
+    render_chat(user_id)
 
-else:
-    st.info("Ask a question to view retrieved knowledge and reasoning.")
+with col_right:
+    render_metrics(user_id)
 
-st.markdown("</div>", unsafe_allow_html=True)
+render_rag_panel()
 
 
 # ==========================================================
@@ -0,0 +1,124 @@
+# bench_analytics.py — fleet-wide Apex metrics, vectorized vs per-user scalar
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict
+import argparse
+import shutil
+import time
+
+import numpy as np
+
+from bench_common import BASE_DIR, current_rss_mb, peak_rss_mb, write_report
+import apex_analytics
+import apex_engine
+from apex_engine import SESSION_DTYPE, TRAITS
+
+SYNTH_DIR = BASE_DIR / "benchmarks" / "synth_users"
+
+
+def synthetic_fleet(user_dir: Path, n_users: int, max_sessions: int, seed: int) -> int:
+    """
+    Write n_users binary session stores with 1..max_sessions sessions each.
+    Returns the total number of sessions written.
+    """
+    user_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, max_sessions + 1, n_users)
+    for i, n in enumerate(lengths):
+        records = np.zeros(n, dtype=SESSION_DTYPE)
+        records["session"] = np.arange(1, n + 1)
+        records["timestamp"] = time.time() - (n - records["session"]) * 7 * 86400
+        # A random walk per trait, like scores drifting week to week
+        walk = rng.uniform(20, 80, len(TRAITS)) + rng.normal(0, 4, (n, len(TRAITS))).cumsum(axis=0)
+        records["traits"] = np.clip(walk, 0, 100)
+        records.tofile(user_dir / f"synth_u{i:06d}_sessions.bin")
+    return int(lengths.sum())
+
+
+def scalar_metrics(user_id: str) -> None:
+    sessions = apex_engine.load_sessions(user_id)
+    apex_engine.compute_momentum(sessions)
+    apex_engine.compute_volatility(sessions)
+    if sessions:
+        apex_engine.compute_dominance_index(sessions[-1])
+
+
+def main(args) -> Dict[str, Any]:
+    user_dir = Path(args.dir)
+    shutil.rmtree(user_dir, ignore_errors=True)
+    t0 = time.perf_counter()
+    total_sessions = synthetic_fleet(user_dir, args.users, args.max_sessions, args.seed)
+    print(f"Generated {args.users:,} users / {total_sessions:,} sessions "
+          f"in {time.perf_counter() - t0:.1f}s")
+
+    # Both modules read USER_DIR at call time
+    apex_engine.USER_DIR = user_dir
+    apex_analytics.USER_DIR = user_dir
+    try:
+        rss0 = current_rss_mb()
+        t0 = time.perf_counter()
+        user_ids, scores, lengths, avg_var = apex_analytics.load_session_tensor()
+        load_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        apex_analytics.batch_momentum(scores, lengths)
+        apex_analytics.batch_volatility(avg_var, lengths)
+        apex_analytics.batch_dominance_index(scores, lengths)
+        metrics_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        apex_analytics.compute_fleet_metrics(user_ids)
+        fleet_s = time.perf_counter() - t0
+
+        # The per-user path on a sample, extrapolated to the whole fleet
+        sample = user_ids[: args.scalar_sample]
+        t0 = time.perf_counter()
+        for user_id in sample:
+            scalar_metrics(user_id)
+        scalar_per_user = (time.perf_counter() - t0) / max(len(sample), 1)
+    finally:
+        if not args.keep_data:
+            shutil.rmtree(user_dir, ignore_errors=True)
+
+    return {
+        "config": vars(args),
+        "users": len(user_ids),
+        "sessions": total_sessions,
+        "vectorized": {
+            "load_s": load_s,
+            "metrics_s": metrics_s,
+            "fleet_metrics_s": fleet_s,
+            "users_per_s": len(user_ids) / fleet_s if fleet_s else 0.0,
+        },
+        "scalar": {
+            "sample_users": len(sample),
+            "per_user_ms": scalar_per_user * 1000,
+            "fleet_estimate_s": scalar_per_user * len(user_ids),
+        },
+        "rss_mb": {"before": rss0, "after": current_rss_mb(), "peak": peak_rss_mb()},
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark compute_fleet_metrics on a synthetic fleet")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--max-sessions", type=int, default=104, help="up to two years of weekly sessions")
+    parser.add_argument("--scalar-sample", type=int, default=2_000, help="users timed on the scalar path")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--dir", default=str(SYNTH_DIR), help="where to write the synthetic user_data")
+    parser.add_argument("--keep-data", action="store_true", help="keep the synthetic session stores")
+    parser.add_argument("--out", default=None, help="report path (default benchmarks/results/)")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    report = main(args)
+    path = write_report("analytics", report, args.out)
+
+    v, s = report["vectorized"], report["scalar"]
+    print(f"\nVectorized: load {v['load_s']:.2f}s + metrics {v['metrics_s'] * 1000:.1f}ms "
+          f"(compute_fleet_metrics {v['fleet_metrics_s']:.2f}s, {v['users_per_s']:,.0f} users/s)")
+    print(f"Scalar:     {s['per_user_ms']:.3f}ms/user -> ~{s['fleet_estimate_s']:.1f}s for the fleet")
+    print("\n✅ Report saved to:", path)
@@ -0,0 +1,147 @@
+# bench_arcs.py — focus-arc retrieval (bias / restrict) vs a second full search
+
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Tuple
+import argparse
+import time
+
+import numpy as np
+import faiss
+
+from apex_engine import TRAITS
+from bench_common import latency_summary, write_report
+from focus_arcs import ARC_BIAS, _unit, arc_search, build_arcs
+
+
+# ======================================
+#              INPUTS
+# ======================================
+def synthetic_inputs(n: int, dim: int, n_queries: int, seed: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Clustered chunk vectors, one description vector per trait, and
+    queries drawn near random chunks.
+    """
+    rng = np.random.default_rng(seed)
+    centres = _unit(rng.standard_normal((64, dim), dtype=np.float32))
+    chunks = _unit(centres[rng.integers(0, 64, n)] + 0.4 * rng.standard_normal((n, dim), dtype=np.float32))
+    desc = _unit(centres[:len(TRAITS)] + 0.2 * rng.standard_normal((len(TRAITS), dim), dtype=np.float32))
+    queries = _unit(chunks[rng.integers(0, n, n_queries)] + 0.3 * rng.standard_normal((n_queries, dim), dtype=np.float32))
+    return chunks.astype("float32"), desc.astype("float32"), queries.astype("float32")
+
+
+def kb_inputs(n_queries: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    from embedders import load_embedder
+    from bench_retrieval import load_queries
+    from focus_arcs import ARC_DESCRIPTIONS
+    from rag_step3_build_index import load_embeddings
+
+    chunks, _ = load_embeddings()
+    embedder = load_embedder()
+    desc = embedder.encode([ARC_DESCRIPTIONS[t] for t in TRAITS])
+    queries = embedder.encode([q["query"] for q in load_queries()][:n_queries])
+    return chunks, _unit(desc).astype("float32"), _unit(queries).astype("float32")
+
+
+# ======================================
+#            STRATEGIES
+# ======================================
+def second_search(index, desc: np.ndarray, q: np.ndarray, k: int, row: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The approach arcs replace: search again with an arc-augmented query and
+    merge both result lists by score.
+    """
+    d1, i1 = index.search(q, k)
+    d2, i2 = index.search(_unit(q + desc[row][None, :]).astype("float32"), k)
+    best: Dict[int, float] = {}
+    for d, i in zip(np.concatenate([d1[0], d2[0]]), np.concatenate([i1[0], i2[0]])):
+        if i >= 0 and d > best.get(int(i), -np.inf):
+            best[int(i)] = float(d)
+    top = sorted(best.items(), key=lambda x: -x[1])[:k]
+    return np.array([[d for _, d in top]]), np.array([[i for i, _ in top]])
+
+
+def time_strategy(fn: Callable[[np.ndarray, int], Tuple[np.ndarray, np.ndarray]], queries: np.ndarray,
+                  repeats: int) -> Tuple[Dict[str, float], List[np.ndarray]]:
+    samples, results = [], []
+    for r in range(repeats):
+        for i, q in enumerate(queries):
+            row = i % len(TRAITS)
+            t0 = time.perf_counter()
+            _, ids = fn(q[None, :], row)
+            samples.append(time.perf_counter() - t0)
+            if r == 0:
+                results.append(ids[0])
+    return latency_summary(samples), results
+
+
+# ======================================
+#              DRIVER
+# ======================================
+def main(args) -> Dict[str, Any]:
+    if args.synthetic:
+        chunks, desc, queries = synthetic_inputs(args.synthetic, args.dim, args.queries, args.seed)
+    else:
+        chunks, desc, queries = kb_inputs(args.queries)
+
+    t0 = time.perf_counter()
+    arcs = build_arcs(chunks, desc, n_candidates=args.candidates)
+    arcs["row"] = {t: i for i, t in enumerate(TRAITS)}
+    build_s = time.perf_counter() - t0
+
+    index = faiss.IndexFlatIP(chunks.shape[1])
+    index.add(chunks)
+    k = args.k
+
+    strategies = {
+        "plain": lambda q, row: index.search(q, k),
+        "second_search": lambda q, row: second_search(index, desc, q, k, row),
+        "bias": lambda q, row: arc_search(index, arcs, q, k, TRAITS[row], "bias", args.bias),
+        "restrict": lambda q, row: arc_search(index, arcs, q, k, TRAITS[row], "restrict"),
+    }
+
+    results = {}
+    ids_by = {}
+    for name, fn in strategies.items():
+        results[name], ids_by[name] = time_strategy(fn, queries, args.repeats)
+
+    # How arc-focused each strategy's results are, and how much of the plain
+    # top-k it keeps
+    for name, ids in ids_by.items():
+        in_arc = [np.isin(r, arcs["candidates"][i % len(TRAITS)]).mean() for i, r in enumerate(ids)]
+        kept = [len(set(r) & set(p)) / k for r, p in zip(ids, ids_by["plain"])]
+        results[name]["arc_candidate_share"] = float(np.mean(in_arc))
+        results[name]["plain_overlap"] = float(np.mean(kept))
+
+    print(f"{len(chunks):,} chunks, {len(queries)} queries, arcs built in {build_s * 1000:.1f}ms")
+    for name, r in results.items():
+        print(f"  {name:<14} p50={r['p50_ms']:8.3f}ms  p95={r['p95_ms']:8.3f}ms  "
+              f"in-arc={r['arc_candidate_share']:.2f}  overlap-with-plain={r['plain_overlap']:.2f}")
+
+    return {
+        "config": vars(args),
+        "n_chunks": len(chunks),
+        "arc_build_s": build_s,
+        "strategies": results,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark focus-arc retrieval against a second full search")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="use N synthetic chunks instead of the knowledge base (no model needed)")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=60)
+    parser.add_argument("--candidates", type=int, default=64)
+    parser.add_argument("--bias", type=float, default=ARC_BIAS)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", default=None, help="report path (default benchmarks/results/)")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    report = main(args)
+    path = write_report("arcs", report, args.out)
+    print("\n✅ Report saved to:", path)
@@ -0,0 +1,103 @@
+# bench_common.py — shared helpers for the benchmark scripts
+
+from __future__ import annotations
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+import json
+import math
+import platform
+import resource
+import subprocess
+import sys
+
+BASE_DIR = Path(__file__).resolve().parent
+BENCH_DIR = BASE_DIR / "benchmarks" / "results"
+
+
+def percentiles(samples: Iterable[float], ps=(50, 95, 99)) -> Dict[str, float]:
+    """
+    Linear-interpolated percentiles (same convention as numpy's default).
+    """
+    values = sorted(samples)
+    out: Dict[str, float] = {}
+    if not values:
+        return {f"p{p}": 0.0 for p in ps}
+
+    for p in ps:
+        pos = (len(values) - 1) * p / 100.0
+        lo, hi = math.floor(pos), math.ceil(pos)
+        out[f"p{p}"] = values[lo] + (values[hi] - values[lo]) * (pos - lo)
+    return out
+
+
+def latency_summary(samples_s: Iterable[float]) -> Dict[str, float]:
+    """
+    count / mean / p50 / p95 / p99 / max of durations, reported in ms.
+    """
+    ms = [x * 1000.0 for x in samples_s]
+    summary: Dict[str, float] = {
+        "count": len(ms),
+        "mean_ms": sum(ms) / len(ms) if ms else 0.0,
+        "max_ms": max(ms) if ms else 0.0,
+    }
+    for key, val in percentiles(ms).items():
+        summary[f"{key}_ms"] = val
+    return summary
+
+
+def current_rss_mb() -> float:
+    """
+    Resident set size of this process right now (Linux), else peak RSS.
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BASE_DIR, capture_output=True, text=True, timeout=5,
+        )
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def write_report(name: str, report: Dict[str, Any], out: Optional[str] = None) -> Path:
+    """
+    Save a benchmark report as JSON, stamped with commit and host info so
+    runs can be compared across commits.
+    """
+    report = {
+        "benchmark": name,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        **report,
+    }
+
+    if out:
+        path = Path(out)
+    else:
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        path = BENCH_DIR / f"{name}-{stamp}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
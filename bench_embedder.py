@@ -0,0 +1,186 @@
+# bench_embedder.py — accuracy, latency and RSS of the embedder backends
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+import faiss
+
+from bench_common import current_rss_mb, latency_summary, peak_rss_mb, write_report
+from bench_retrieval import QUERY_FILE, load_queries, recall_at_k
+from embedders import BACKENDS, EMBED_MODEL
+
+
+# ======================================
+#        PER-BACKEND RUN (child)
+# ======================================
+def concurrent_qps(embedder, queries: List[str], threads: int, per_thread: int) -> float:
+    """
+    Single-query encodes per second with `threads` callers at once, the
+    way concurrent retrieve_context calls hit the embedder.
+    """
+    def worker(i: int) -> None:
+        for j in range(per_thread):
+            embedder.encode([queries[(i + j) % len(queries)]])
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(threads)))
+    elapsed = time.perf_counter() - t0
+    return threads * per_thread / elapsed if elapsed else 0.0
+
+
+# Each backend loads in a fresh process so RSS numbers are not shared.
+def measure_backend(
+    backend: str,
+    model_name: str,
+    chunks: List[str],
+    queries: List[str],
+    repeats: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    from embedders import load_embedder
+
+    rss0 = current_rss_mb()
+    t0 = time.perf_counter()
+    embedder = load_embedder(backend, model_name)
+    load_s = time.perf_counter() - t0
+    rss_loaded = current_rss_mb()
+
+    # Warm-up so lazy allocations do not land in the first sample
+    embedder.encode(queries[:1])
+
+    samples = []
+    for _ in range(repeats):
+        for q in queries:
+            t = time.perf_counter()
+            embedder.encode([q])
+            samples.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    chunk_vecs = embedder.encode(chunks)
+    batch_s = time.perf_counter() - t
+
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "rss_mb": {"start": rss0, "loaded": rss_loaded, "peak": peak_rss_mb()},
+        "query_latency": latency_summary(samples),
+        "chunks_per_s": len(chunks) / batch_s if batch_s else 0.0,
+        "concurrent_qps": {
+            str(n): concurrent_qps(embedder, queries, n, repeats * 2)
+            for n in sorted({1, concurrency})
+        },
+        "chunk_vecs": np.asarray(chunk_vecs, dtype="float32"),
+        "query_vecs": np.asarray(embedder.encode(queries), dtype="float32"),
+    }
+
+
+# ======================================
+#              ACCURACY
+# ======================================
+def _unit(v: np.ndarray) -> np.ndarray:
+    return v / (np.linalg.norm(v, axis=1, keepdims=True) + 1e-12)
+
+
+def compare(ref: Dict[str, Any], run: Dict[str, Any], k: int) -> Dict[str, float]:
+    """
+    Cosine agreement with the float model, and how often retrieval picks the
+    same chunks: backend query vectors against the float-built index (what
+    the agent does when only the query encoder changes) and fully re-embedded.
+    """
+    cos = np.sum(_unit(ref["chunk_vecs"]) * _unit(run["chunk_vecs"]), axis=1)
+
+    ref_index = faiss.IndexFlatIP(ref["chunk_vecs"].shape[1])
+    ref_index.add(_unit(ref["chunk_vecs"]))
+    k = min(k, ref_index.ntotal)
+    _, truth = ref_index.search(_unit(ref["query_vecs"]), k)
+    _, mixed = ref_index.search(_unit(run["query_vecs"]), k)
+
+    own_index = faiss.IndexFlatIP(run["chunk_vecs"].shape[1])
+    own_index.add(_unit(run["chunk_vecs"]))
+    _, own = own_index.search(_unit(run["query_vecs"]), k)
+
+    return {
+        "cosine_mean": float(cos.mean()),
+        "cosine_min": float(cos.min()),
+        "cosine_p5": float(np.percentile(cos, 5)),
+        f"recall_at_{k}_float_index": recall_at_k(mixed, truth),
+        f"recall_at_{k}_reembedded": recall_at_k(own, truth),
+        "top1_agreement": float(np.mean(own[:, 0] == truth[:, 0])),
+    }
+
+
+# ======================================
+#              DRIVER
+# ======================================
+def main(args) -> Dict[str, Any]:
+    from rag_step1_load_data import load_knowledge_base
+
+    chunks = [c["content"] for c in load_knowledge_base(verbose=False)]
+    queries = [q["query"] for q in load_queries(QUERY_FILE)]
+    backends = args.backends or list(BACKENDS)
+    if "torch" not in backends:
+        backends = ["torch"] + backends   # float reference
+
+    ctx = multiprocessing.get_context("spawn")
+    runs: Dict[str, Dict[str, Any]] = {}
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            try:
+                runs[backend] = pool.submit(
+                    measure_backend, backend, args.model, chunks, queries, args.repeats, args.concurrency
+                ).result()
+            except Exception as e:
+                runs[backend] = {"backend": backend, "error": f"{type(e).__name__}: {e}"}
+
+    ref = runs["torch"]
+    results = []
+    for backend, run in runs.items():
+        if "error" in run:
+            print(f"{backend:<11} ERROR {run['error']}")
+            results.append(run)
+            continue
+
+        summary = {k: v for k, v in run.items() if k not in ("chunk_vecs", "query_vecs")}
+        if "error" not in ref and backend != "torch":
+            summary["accuracy"] = compare(ref, run, args.k)
+        results.append(summary)
+
+        lat = summary["query_latency"]
+        acc = summary.get("accuracy", {})
+        print(f"{backend:<11} load={summary['load_s']:5.1f}s  RSS={summary['rss_mb']['loaded']:7.1f}MB  "
+              f"query p50={lat['p50_ms']:6.2f}ms p95={lat['p95_ms']:6.2f}ms  "
+              f"{summary['chunks_per_s']:7.1f} chunks/s  "
+              f"{summary['concurrent_qps'][str(args.concurrency)]:7.1f} q/s @{args.concurrency}"
+              + (f"  cos={acc['cosine_mean']:.4f} (min {acc['cosine_min']:.4f})" if acc else ""))
+
+    return {
+        "config": vars(args),
+        "n_chunks": len(chunks),
+        "n_queries": len(queries),
+        "results": results,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Compare embedder backends against the float model")
+    parser.add_argument("--backends", nargs="*", choices=list(BACKENDS))
+    parser.add_argument("--model", default=EMBED_MODEL)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=10, help="latency passes over the query set")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="concurrent callers for the throughput test (service backend needs embed_service.py running)")
+    parser.add_argument("--out", default=None, help="report path (default benchmarks/results/)")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    report = main(args)
+    path = write_report("embedder", report, args.out)
+    print("\n✅ Report saved to:", path)
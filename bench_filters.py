@@ -0,0 +1,118 @@
+# bench_filters.py — filters pushed into the FAISS search vs search-then-filter
+
+from __future__ import annotations
+from typing import Any, Dict, List
+import argparse
+import time
+
+import numpy as np
+import faiss
+
+from bench_common import latency_summary, write_report
+from bench_retrieval import recall_at_k
+from vector_filters import MetadataPostings, filtered_search
+
+
+def synthetic_kb(n: int, dim: int, n_sources: int, seed: int):
+    """
+    Clustered vectors with a Zipf-like source distribution, so filters range
+    from a large share of the corpus down to a handful of chunks.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((64, dim), dtype=np.float32)
+    vecs = centres[rng.integers(0, 64, n)] + 0.5 * rng.standard_normal((n, dim), dtype=np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    weights = 1.0 / np.arange(1, n_sources + 1)
+    sources = rng.choice(n_sources, n, p=weights / weights.sum())
+    metadata = [{"source": f"source_{s:03d}.txt"} for s in sources]
+    return vecs.astype("float32"), metadata
+
+
+def post_filter(index, q: np.ndarray, k: int, allowed: np.ndarray, overfetch: int):
+    """
+    The approach the selector replaces: fetch k*overfetch, drop the rest.
+    """
+    _, idx = index.search(q, k * overfetch)
+    hits = idx[0][np.isin(idx[0], allowed)][:k]
+    return hits
+
+
+def main(args) -> Dict[str, Any]:
+    vecs, metadata = synthetic_kb(args.synthetic, args.dim, args.sources, args.seed)
+    index = faiss.index_factory(args.dim, args.factory, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        index.train(vecs)
+    index.add(vecs)
+    postings = MetadataPostings(metadata)
+
+    rng = np.random.default_rng(args.seed + 1)
+    queries = vecs[rng.integers(0, len(vecs), args.queries)]
+    k = args.k
+
+    results: List[Dict[str, Any]] = []
+    values = postings.values("source")
+    # Most common source, a mid-frequency one, and the rarest
+    for source in (values[0], values[len(values) // 2], values[-1]):
+        allowed = postings.select({"source": source})
+        exact = faiss.IndexFlatIP(args.dim)
+        exact.add(vecs[allowed])
+
+        pushed_t, post_t, pushed_ids, post_ids, truth = [], [], [], [], []
+        for q in queries:
+            q = q[None, :]
+            t0 = time.perf_counter()
+            _, idx = filtered_search(index, q, k, allowed)
+            pushed_t.append(time.perf_counter() - t0)
+            pushed_ids.append(idx[0])
+
+            t0 = time.perf_counter()
+            post_ids.append(post_filter(index, q, k, allowed, args.overfetch))
+            post_t.append(time.perf_counter() - t0)
+
+            _, t = exact.search(q, k)
+            truth.append(allowed[t[0][t[0] >= 0]])
+
+        want = min(k, len(allowed))
+
+        def pad(rows):
+            return np.array([np.pad(r, (0, want - len(r)), constant_values=-1)[:want] for r in rows])
+
+        row = {
+            "source": source,
+            "subset": int(len(allowed)),
+            "selectivity": len(allowed) / len(vecs),
+            "pushed": {**latency_summary(pushed_t),
+                       "full_k_share": float(np.mean([len(r) == want for r in pushed_ids])),
+                       "recall": recall_at_k(pad(pushed_ids), pad(truth))},
+            "post_filter": {**latency_summary(post_t),
+                            "full_k_share": float(np.mean([len(r) == want for r in post_ids])),
+                            "recall": recall_at_k(pad(post_ids), pad(truth))},
+        }
+        results.append(row)
+        print(f"{source} ({row['subset']:,} chunks, {row['selectivity']:.2%})")
+        for name in ("pushed", "post_filter"):
+            r = row[name]
+            print(f"  {name:<12} p50={r['p50_ms']:7.3f}ms  full-k={r['full_k_share']:.2f}  recall={r['recall']:.3f}")
+
+    return {"config": vars(args), "n_chunks": len(vecs), "filters": results}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark metadata filters inside the FAISS search")
+    parser.add_argument("--synthetic", type=int, default=100_000, help="synthetic chunks")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--sources", type=int, default=200)
+    parser.add_argument("--factory", default="Flat", help="faiss index_factory string")
+    parser.add_argument("--overfetch", type=int, default=10, help="post-filter fetches k * this")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", default=None, help="report path (default benchmarks/results/)")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    report = main(args)
+    path = write_report("filters", report, args.out)
+    print("\n✅ Report saved to:", path)
@@ -0,0 +1,243 @@
+# bench_loadtest.py — end-to-end load test of ask_agent with a fake LLM
+
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import threading
+import time
+
+from bench_common import latency_summary, current_rss_mb, peak_rss_mb, write_report
+import telemetry
+
+LOADTEST_PREFIX = "loadtest_u"
+
+# ask_agent stages and the module-level function behind each one; these
+# must be the names _ask_agent calls, or the wrapper never sees a call
+STAGES = {
+    "retrieval": "_retrieve",
+    "generation": "generate_answer",
+    "scoring": "infer_scores",
+    "profile_update": "update_scores",
+    "apex_update": "update_apex_state",
+    "logging": "log_interaction",
+}
+
+
+# ======================================
+#        SYNTHETIC USERS + REPORTS
+# ======================================
+ACTIVITIES = [
+    "coded", "trained", "studied", "wrote", "practised piano", "ran",
+    "worked on my startup", "solved LeetCode problems", "read research papers",
+]
+FEELINGS = [
+    "I still feel slow and not good enough.",
+    "my focus dropped quickly after lunch.",
+    "I skipped two days because I felt tired.",
+    "I felt unstoppable by Friday.",
+    "I keep comparing myself to others.",
+    "I procrastinated on the hardest task all week.",
+]
+
+
+def synthetic_report(rng: random.Random) -> str:
+    days = rng.randint(1, 7)
+    hours = rng.randint(1, 6)
+    return (
+        f"This week I {rng.choice(ACTIVITIES)} {days} days, {hours} hours each, "
+        f"and {rng.choice(ACTIVITIES)} on the side, but {rng.choice(FEELINGS)}"
+    )
+
+
+# ======================================
+#            FAKE LLM BACKEND
+# ======================================
+class FakeModel:
+    """
+    Stands in for genai.GenerativeModel: sleeps for a configurable latency
+    and returns a canned coaching answer or a scores JSON.
+    """
+
+    def __init__(self, latency: float, jitter: float, scoring: bool, seed: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.scoring = scoring
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt: str):
+        with self._lock:
+            delay = max(0.0, self._rng.gauss(self.latency, self.latency * self.jitter))
+        time.sleep(delay)
+
+        if not self.scoring:
+            return SimpleNamespace(text="Stop negotiating with yourself. " * 40)
+
+        digest = hashlib.sha1(prompt.encode("utf-8")).digest()
+        traits = ["discipline", "consistency", "execution", "adaptability", "ego_strength", "clarity"]
+        scores = {t: 20 + digest[i] % 70 for i, t in enumerate(traits)}
+        return SimpleNamespace(text=json.dumps({"scores": scores, "notes": {}}))
+
+
+# ======================================
+#            STAGE TIMING
+# ======================================
+class StageTimer:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage: str, fn: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - t0)
+        return timed
+
+
+def instrument(agent, timer: StageTimer) -> None:
+    """
+    Swap ask_agent's collaborators for timed wrappers. ask_agent looks
+    these names up in its module globals, so wrapping them there is enough.
+    """
+    for stage, attr in STAGES.items():
+        setattr(agent, attr, timer.wrap(stage, getattr(agent, attr)))
+
+    # Staged writes hit the disk when the unit of work commits
+    uow_cls = agent.UnitOfWork
+    uow_cls.commit = timer.wrap("commit", uow_cls.commit)
+
+
+def check_stages(timer: StageTimer) -> None:
+    """
+    Every completed ask goes through every stage; a stage without samples
+    means ask_agent stopped calling the wrapped name.
+    """
+    missing = [stage for stage in STAGES if not timer.samples.get(stage)]
+    if missing:
+        raise RuntimeError(
+            f"No samples for stages {missing}; update STAGES to the names ask_agent calls"
+        )
+
+
+def cleanup_users() -> None:
+    from memory_system import USER_DIR
+    for path in USER_DIR.glob(f"{LOADTEST_PREFIX}*"):
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+
+
+# ======================================
+#              DRIVER
+# ======================================
+def run(args) -> Dict[str, Any]:
+    # The fake backend never calls Gemini, but importing the agent needs a key
+    os.environ.setdefault("GEMINI_API_KEY", "loadtest-offline")
+
+    import rag_step4_agent as agent
+    import scoring_engine
+
+    agent.model = FakeModel(args.gen_latency, args.jitter, scoring=False, seed=args.seed)
+    scoring_engine.model = FakeModel(args.score_latency, args.jitter, scoring=True, seed=args.seed + 1)
+
+    timer = StageTimer()
+    instrument(agent, timer)
+
+    rng = random.Random(args.seed)
+    users = [f"{LOADTEST_PREFIX}{i:05d}" for i in range(args.users)]
+    work = [(rng.choice(users), synthetic_report(rng)) for _ in range(args.requests)]
+
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def one(user_id: str, report: str, scheduled: float) -> None:
+        try:
+            agent.ask_agent(user_id, report)
+            ok = True
+        except Exception as e:
+            ok = False
+            with lock:
+                name = type(e).__name__
+                errors[name] = errors.get(name, 0) + 1
+        # Measured from the scheduled start so queueing delay is included
+        elapsed = time.perf_counter() - scheduled
+        if ok:
+            with lock:
+                latencies.append(elapsed)
+
+    rss_before = current_rss_mb()
+    interval = 1.0 / args.rps
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        t0 = time.perf_counter()
+        for i, (user_id, report) in enumerate(work):
+            scheduled = t0 + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(one, user_id, report, scheduled)
+    wall = time.perf_counter() - t0
+    if latencies:
+        check_stages(timer)
+
+    return {
+        "config": vars(args),
+        "wall_time_s": wall,
+        "completed": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "end_to_end": latency_summary(latencies),
+        "stages": {name: latency_summary(s) for name, s in sorted(timer.samples.items())},
+        # Finer-grained spans (embed, FAISS search, fsyncs, ...) from telemetry
+        "telemetry": telemetry.snapshot(),
+        "rss_mb": {"before": rss_before, "after": current_rss_mb(), "peak": peak_rss_mb()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay synthetic weekly reports through ask_agent")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rps", type=float, default=10.0, help="target request rate")
+    parser.add_argument("--concurrency", type=int, default=32, help="max in-flight asks")
+    parser.add_argument("--gen-latency", type=float, default=0.8, help="fake answer latency (s)")
+    parser.add_argument("--score-latency", type=float, default=0.4, help="fake scoring latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency stddev as a fraction")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", default=None, help="report path (default benchmarks/results/)")
+    parser.add_argument("--keep-data", action="store_true", help="keep synthetic user files")
+    args = parser.parse_args()
+
+    cleanup_users()
+    try:
+        report = run(args)
+    finally:
+        if not args.keep_data:
+            cleanup_users()
+
+    path = write_report("loadtest", report, args.out)
+
+    print(f"\nCompleted {report['completed']}/{args.requests} in {report['wall_time_s']:.1f}s "
+          f"({report['throughput_rps']:.2f} req/s, target {args.rps})")
+    e2e = report["end_to_end"]
+    print(f"End-to-end p50={e2e['p50_ms']:.0f}ms p95={e2e['p95_ms']:.0f}ms p99={e2e['p99_ms']:.0f}ms")
+    for name, s in report["stages"].items():
+        print(f"  {name:<15} p50={s['p50_ms']:8.1f}ms  p95={s['p95_ms']:8.1f}ms  p99={s['p99_ms']:8.1f}ms")
+    if report["errors"]:
+        print("Errors:", report["errors"])
+    print("\n✅ Report saved to:", path)
@@ -0,0 +1,331 @@
+# bench_retrieval.py — retrieval benchmark across chunking settings and FAISS index types
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+import argparse
+import json
+import time
+
+import numpy as np
+import faiss
+
+from bench_common import BASE_DIR, current_rss_mb, latency_summary, write_report
+
+QUERY_FILE = BASE_DIR / "benchmarks" / "retrieval_queries.jsonl"
+
+# (max_chars, overlap) settings for chunk_text
+CHUNKINGS = [(400, 75), (800, 150), (1200, 200)]
+
+# FAISS factory strings; {nlist} and {m} are filled from the corpus size
+INDEX_TYPES = {
+    "Flat": "Flat",
+    "HNSW32": "HNSW32,Flat",
+    "IVF-Flat": "IVF{nlist},Flat",
+    "IVF-PQ": "IVF{nlist},PQ{m}x{nbits}",
+    "SQ8": "SQ8",
+    "PQ": "PQ{m}x{nbits}",
+}
+
+BATCH_SIZES = [1, 8, 32, 128]
+
+# Target dimensions for the --dims recall-vs-dimension sweep
+DIMS = [16, 32, 64, 96, 128, 192, 256]
+
+
+# ======================================
+#              INPUTS
+# ======================================
+def load_queries(path: Path = QUERY_FILE) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def embed(model, texts: List[str]) -> np.ndarray:
+    vecs = model.encode(texts, batch_size=64, show_progress_bar=False)
+    vecs = np.asarray(vecs, dtype="float32")
+    return vecs / (np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12)
+
+
+def factory_string(kind: str, n: int, dim: int) -> str:
+    # Keep IVF/PQ trainable on small corpora: faiss k-means wants about
+    # 39 training points per centroid (nlist for IVF, 2**nbits for PQ)
+    nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+    nbits = max(1, min(8, int(np.log2(max(n / 39, 2)))))
+    m = next(m for m in (48, 32, 24, 16, 12, 8, 4, 2, 1) if dim % m == 0 and m <= dim)
+    return INDEX_TYPES[kind].format(nlist=nlist, m=m, nbits=nbits)
+
+
+# ======================================
+#            MEASUREMENTS
+# ======================================
+def build_index(factory: str, vecs: np.ndarray) -> Tuple[Any, Dict[str, Any]]:
+    rss_before = current_rss_mb()
+    t0 = time.perf_counter()
+
+    index = faiss.index_factory(vecs.shape[1], factory, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        index.train(vecs)
+    index.add(vecs)
+
+    stats = {
+        "factory": factory,
+        "build_s": time.perf_counter() - t0,
+        "index_bytes": int(len(faiss.serialize_index(index))),
+        "rss_delta_mb": current_rss_mb() - rss_before,
+    }
+    return index, stats
+
+
+def set_search_params(index, nprobe: int, ef_search: int) -> None:
+    ps = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        try:
+            ps.set_index_parameter(index, name, value)
+        except Exception:
+            pass  # parameter does not apply to this index type
+
+
+def query_latency(index, q: np.ndarray, k: int, repeats: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeats):
+        for row in q:
+            t0 = time.perf_counter()
+            index.search(row.reshape(1, -1), k)
+            samples.append(time.perf_counter() - t0)
+    return latency_summary(samples)
+
+
+def throughput(index, q: np.ndarray, k: int, min_queries: int = 512) -> Dict[str, float]:
+    out = {}
+    for bs in BATCH_SIZES:
+        reps = int(np.ceil(max(min_queries, bs) / len(q)))
+        pool = np.tile(q, (reps, 1))
+        n_batches = len(pool) // bs
+        t0 = time.perf_counter()
+        for i in range(n_batches):
+            index.search(pool[i * bs:(i + 1) * bs], k)
+        elapsed = time.perf_counter() - t0
+        out[str(bs)] = n_batches * bs / elapsed if elapsed else 0.0
+    return out
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t[t >= 0])) for f, t in zip(found, truth))
+    total = sum(len(t[t >= 0]) for t in truth)
+    return hits / total if total else 0.0
+
+
+def label_metrics(found: np.ndarray, metas: List[Dict], queries: List[Dict]) -> Dict[str, float]:
+    """
+    Source hit rate and MRR of the first chunk from a labeled source.
+    """
+    hits, rr = 0, 0.0
+    for ids, q in zip(found, queries):
+        relevant = set(q["relevant_sources"])
+        for rank, idx in enumerate(ids, 1):
+            if idx >= 0 and metas[idx]["source"] in relevant:
+                hits += 1
+                rr += 1.0 / rank
+                break
+    n = len(queries) or 1
+    return {"source_hit_at_k": hits / n, "mrr": rr / n}
+
+
+# ======================================
+#              DRIVER
+# ======================================
+def run_setting(
+    chunks: List[Dict],
+    vecs: np.ndarray,
+    q: np.ndarray,
+    queries: List[Dict],
+    kinds: List[str],
+    k: int,
+    repeats: int,
+    nprobe: int,
+    ef_search: int,
+) -> List[Dict[str, Any]]:
+    # Exact search on the same vectors is the recall reference
+    exact = faiss.IndexFlatIP(vecs.shape[1])
+    exact.add(vecs)
+    _, truth = exact.search(q, k)
+
+    runs = []
+    for kind in kinds:
+        factory = factory_string(kind, len(vecs), vecs.shape[1])
+        try:
+            index, stats = build_index(factory, vecs)
+        except Exception as e:
+            runs.append({"index": kind, "factory": factory, "error": str(e)})
+            continue
+
+        set_search_params(index, nprobe, ef_search)
+        _, found = index.search(q, k)
+
+        runs.append({
+            "index": kind,
+            **stats,
+            "latency": query_latency(index, q, k, repeats),
+            "qps": throughput(index, q, k),
+            f"recall_at_{k}": recall_at_k(found, truth),
+            **label_metrics(found, chunks, queries),
+        })
+    return runs
+
+
+def run_dims(
+    chunks: List[Dict],
+    vecs: np.ndarray,
+    q: np.ndarray,
+    queries: List[Dict],
+    dims: List[int],
+    method: str,
+    k: int,
+    repeats: int,
+) -> List[Dict[str, Any]]:
+    """
+    Recall and footprint of the rag_step3 reduction stage per target dim,
+    against exact full-dimension search.
+    """
+    from rag_step3_build_index import build_index as build_reduced
+
+    exact = faiss.IndexFlatIP(vecs.shape[1])
+    exact.add(vecs)
+    _, truth = exact.search(q, k)
+
+    runs = []
+    for dim in [vecs.shape[1]] + sorted(d for d in dims if d < vecs.shape[1]):
+        t0 = time.perf_counter()
+        try:
+            index = build_reduced(vecs, dim, method)
+        except Exception as e:
+            runs.append({"dim": dim, "error": str(e)})
+            continue
+        build_s = time.perf_counter() - t0
+
+        _, found = index.search(q, k)
+        runs.append({
+            "dim": dim,
+            "build_s": build_s,
+            "index_bytes": int(len(faiss.serialize_index(index))),
+            # The stored projection is a fixed cost; this part scales with the corpus
+            "vector_bytes": len(vecs) * dim * 4,
+            "latency": query_latency(index, q, k, repeats),
+            f"recall_at_{k}": recall_at_k(found, truth),
+            **label_metrics(found, chunks, queries),
+        })
+    return runs
+
+
+def run_adaptive(chunks: List[Dict], vecs: np.ndarray, q: np.ndarray, queries: List[Dict],
+                 max_k: int) -> Dict[str, Any]:
+    """
+    Fixed k vs adaptive_k trimming on exact search: chunks and estimated
+    prompt tokens per query, and whether a labeled source is still hit.
+    """
+    from adaptive_k import estimate_tokens, trim
+
+    index = faiss.IndexFlatIP(vecs.shape[1])
+    index.add(vecs)
+    scores, found = index.search(q, max_k)
+
+    out: Dict[str, Any] = {}
+    for mode in ("fixed", "adaptive"):
+        kept_ids, ks, tokens = [], [], []
+        for row_scores, row_ids in zip(scores, found):
+            items = [dict(chunks[i], score=float(s), idx=int(i)) for s, i in zip(row_scores, row_ids) if i >= 0]
+            kept, stats = trim(items, max_k, mode)
+            ks.append(stats["k"])
+            tokens.append(estimate_tokens(kept))
+            kept_ids.append([it["idx"] for it in kept] + [-1] * (max_k - len(kept)))
+        out[mode] = {
+            "mean_k": float(np.mean(ks)),
+            "mean_tokens_est": float(np.mean(tokens)),
+            **label_metrics(np.array(kept_ids), chunks, queries),
+        }
+    return out
+
+
+def main(args) -> Dict[str, Any]:
+    from rag_step1_load_data import load_knowledge_base
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(args.model)
+    queries = load_queries(Path(args.queries))
+    q = embed(model, [x["query"] for x in queries])
+
+    chunkings = [tuple(map(int, c.split(":"))) for c in args.chunkings] if args.chunkings else CHUNKINGS
+    kinds = args.index_types or list(INDEX_TYPES)
+
+    results = []
+    for max_chars, overlap in chunkings:
+        chunks = load_knowledge_base(max_chars=max_chars, overlap=overlap)
+        t0 = time.perf_counter()
+        vecs = embed(model, [c["content"] for c in chunks])
+        embed_s = time.perf_counter() - t0
+
+        print(f"\n=== chunking max_chars={max_chars} overlap={overlap}: {len(chunks)} chunks ===")
+        runs = run_setting(chunks, vecs, q, queries, kinds, args.k, args.repeats, args.nprobe, args.ef_search)
+        for r in runs:
+            if "error" in r:
+                print(f"  {r['index']:<9} ERROR {r['error']}")
+            else:
+                print(f"  {r['index']:<9} build={r['build_s']*1000:7.1f}ms  size={r['index_bytes']:>9}B  "
+                      f"p50={r['latency']['p50_ms']:.3f}ms  recall@{args.k}={r[f'recall_at_{args.k}']:.3f}  "
+                      f"hit={r['source_hit_at_k']:.2f}")
+
+        setting = {
+            "chunking": {"max_chars": max_chars, "overlap": overlap, "n_chunks": len(chunks)},
+            "embed_s": embed_s,
+            "runs": runs,
+        }
+
+        if args.dims is not None:
+            dims = run_dims(chunks, vecs, q, queries, args.dims or DIMS, args.reduction, args.k, args.repeats)
+            print(f"  --- {args.reduction} reduction ---")
+            for r in dims:
+                if "error" in r:
+                    print(f"  dim={r['dim']:<4} ERROR {r['error']}")
+                else:
+                    print(f"  dim={r['dim']:<4} size={r['index_bytes']:>9}B  "
+                          f"recall@{args.k}={r[f'recall_at_{args.k}']:.3f}  hit={r['source_hit_at_k']:.2f}")
+            setting["dims"] = dims
+
+        if args.adaptive:
+            adaptive = run_adaptive(chunks, vecs, q, queries, args.k)
+            print("  --- adaptive k ---")
+            for mode, r in adaptive.items():
+                print(f"  {mode:<9} mean k={r['mean_k']:.2f}  ~{r['mean_tokens_est']:.0f} tokens  "
+                      f"hit={r['source_hit_at_k']:.2f}  mrr={r['mrr']:.3f}")
+            setting["adaptive"] = adaptive
+
+        results.append(setting)
+
+    return {"config": vars(args), "n_queries": len(queries), "results": results}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark retrieval across chunking settings and index types")
+    parser.add_argument("--queries", default=str(QUERY_FILE), help="labeled query JSONL")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--chunkings", nargs="*", help="max_chars:overlap pairs, e.g. 800:150")
+    parser.add_argument("--index-types", nargs="*", choices=list(INDEX_TYPES))
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=20, help="latency passes over the query set")
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--dims", type=int, nargs="*",
+                        help="also report recall vs reduced dimension (no values = default sweep)")
+    parser.add_argument("--reduction", choices=["pca", "pcar", "random"], default="pca")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="also compare fixed k with adaptive_k trimming (k is the upper bound)")
+    parser.add_argument("--out", default=None, help="report path (default benchmarks/results/)")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    report = main(args)
+    path = write_report("retrieval", report, args.out)
+    print("\n✅ Report saved to:", path)
@@ -0,0 +1,228 @@
+# bench_scale.py — synthetic large knowledge bases for scale testing RAG steps 1–3
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Dict, List
+import argparse
+import multiprocessing
+import re
+import shutil
+import time
+
+import numpy as np
+
+from bench_common import BASE_DIR, current_rss_mb, peak_rss_mb, write_report
+
+SYNTH_DIR = BASE_DIR / "benchmarks" / "synth_kb"
+SOURCE_KB = BASE_DIR / "Knowledge_base"
+
+SCALES = [10_000, 100_000, 1_000_000, 10_000_000]
+CHUNKS_PER_FILE = 1_000
+EMBED_DIM = 384
+# Synthetic vectors are drawn around this many topic centres so the index
+# sees clustered data rather than uniform noise
+N_TOPICS = 64
+WRITE_BLOCK = 10_000
+
+
+# ======================================
+#          CORPUS GENERATION
+# ======================================
+def _vocabulary() -> np.ndarray:
+    words = set()
+    for txt in SOURCE_KB.glob("*.txt"):
+        words.update(re.findall(r"[A-Za-z']+", txt.read_text(encoding="utf-8")))
+    return np.array(sorted(words) or ["apex"], dtype=object)
+
+
+def generate_corpus(
+    kb_dir: Path,
+    n_chunks: int,
+    max_chars: int = 800,
+    overlap: int = 150,
+    chunks_per_file: int = CHUNKS_PER_FILE,
+    seed: int = 7,
+) -> Dict[str, Any]:
+    """
+    Write .txt files that chunk_text() splits into exactly n_chunks chunks.
+    Text is random words from the real knowledge base.
+    """
+    kb_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    vocab = _vocabulary()
+    overlap = min(overlap, max_chars - 1)
+    stride = max_chars - overlap
+
+    t0 = time.perf_counter()
+    files, total_bytes, remaining = 0, 0, n_chunks
+    while remaining > 0:
+        count = min(chunks_per_file, remaining)
+        # chunk_text starts a chunk every `stride` chars and always ends on
+        # an overlap-sized tail, so this length yields exactly `count` chunks
+        length = (count - 1) * stride + max(overlap, 1)
+
+        # ~6 chars per word incl. the space; oversample then trim
+        words = rng.choice(vocab, size=length // 4 + 16)
+        text = " ".join(words)[:length].rstrip()
+        text = text + "x" * (length - len(text))
+
+        path = kb_dir / f"synth_{files:06d}.txt"
+        path.write_text(text, encoding="utf-8")
+        files += 1
+        total_bytes += length
+        remaining -= count
+
+    return {"files": files, "text_bytes": total_bytes, "generate_s": time.perf_counter() - t0}
+
+
+def synthetic_vectors(n: int, dim: int, rng: np.random.Generator, centres: np.ndarray) -> np.ndarray:
+    topics = rng.integers(0, len(centres), size=n)
+    vecs = centres[topics] + 0.35 * rng.standard_normal((n, dim), dtype=np.float32)
+    return vecs / (np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12)
+
+
+# ======================================
+#         PIPELINE STEPS (child)
+# ======================================
+# Each step runs in a fresh process so its peak RSS is its own.
+def _step_result(t0: float, rss0: float, **extra: Any) -> Dict[str, Any]:
+    return {
+        "seconds": time.perf_counter() - t0,
+        "rss_start_mb": rss0,
+        "rss_peak_mb": peak_rss_mb(),
+        **extra,
+    }
+
+
+def step_load(kb_dir: str, max_chars: int, overlap: int) -> Dict[str, Any]:
+    from rag_step1_load_data import load_knowledge_base
+
+    rss0, t0 = current_rss_mb(), time.perf_counter()
+    chunks = load_knowledge_base(max_chars, overlap, kb_dir=Path(kb_dir), verbose=False)
+    return _step_result(t0, rss0, chunks=len(chunks))
+
+
+def step_embed(kb_dir: str, max_chars: int, overlap: int, synthetic: bool, seed: int) -> Dict[str, Any]:
+    from rag_step1_load_data import load_knowledge_base
+    from rag_step2_embed import embed_chunks, write_embeddings
+
+    embed_file = Path(kb_dir) / "embeddings.jsonl"
+    rss0 = current_rss_mb()
+    chunks = load_knowledge_base(max_chars, overlap, kb_dir=Path(kb_dir), verbose=False)
+
+    t0 = time.perf_counter()
+    if synthetic:
+        rng = np.random.default_rng(seed)
+        centres = rng.standard_normal((N_TOPICS, EMBED_DIM), dtype=np.float32)
+        for start in range(0, len(chunks), WRITE_BLOCK):
+            block = chunks[start:start + WRITE_BLOCK]
+            vecs = synthetic_vectors(len(block), EMBED_DIM, rng, centres)
+            write_embeddings(block, vecs, embed_file, start_id=start + 1, mode="w" if start == 0 else "a")
+    else:
+        embed_chunks(chunks, embed_file=embed_file, verbose=False)
+
+    return _step_result(t0, rss0, file_bytes=embed_file.stat().st_size)
+
+
+def step_index(kb_dir: str) -> Dict[str, Any]:
+    from rag_step3_build_index import build_index, load_embeddings, save_index
+
+    kb = Path(kb_dir)
+    rss0, t0 = current_rss_mb(), time.perf_counter()
+
+    emb_array, metas = load_embeddings(kb / "embeddings.jsonl")
+    t_load = time.perf_counter()
+    index = build_index(emb_array)
+    t_build = time.perf_counter()
+    save_index(index, metas, kb / "faiss_index.bin", kb / "faiss_meta.jsonl")
+
+    return _step_result(
+        t0, rss0,
+        load_s=t_load - t0,
+        build_s=t_build - t_load,
+        save_s=time.perf_counter() - t_build,
+        index_bytes=(kb / "faiss_index.bin").stat().st_size,
+        meta_bytes=(kb / "faiss_meta.jsonl").stat().st_size,
+    )
+
+
+def _run_isolated(fn, *args) -> Dict[str, Any]:
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # Typically the OOM killer
+            return {"error": "worker process died"}
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+
+
+# ======================================
+#              DRIVER
+# ======================================
+def run_scale(n_chunks: int, args) -> Dict[str, Any]:
+    kb_dir = SYNTH_DIR / f"{n_chunks}"
+    if kb_dir.exists():
+        shutil.rmtree(kb_dir)
+
+    print(f"\n=== {n_chunks:,} chunks ===")
+    result: Dict[str, Any] = {"n_chunks": n_chunks}
+    result["generate"] = generate_corpus(kb_dir, n_chunks, args.max_chars, args.overlap, seed=args.seed)
+    print(f"  generate  {result['generate']['generate_s']:8.1f}s  {result['generate']['text_bytes'] / 1e6:10.1f} MB text")
+
+    steps = [
+        ("step1_load", step_load, (str(kb_dir), args.max_chars, args.overlap)),
+        ("step2_embed", step_embed, (str(kb_dir), args.max_chars, args.overlap, not args.real_embeddings, args.seed)),
+        ("step3_index", step_index, (str(kb_dir),)),
+    ]
+    for name, fn, fn_args in steps:
+        res = _run_isolated(fn, *fn_args)
+        result[name] = res
+        if "error" in res:
+            print(f"  {name:<12} FAILED: {res['error']}")
+            result["failed_at"] = name
+            break
+        print(f"  {name:<12} {res['seconds']:8.1f}s  peak RSS {res['rss_peak_mb']:9.1f} MB")
+
+    if not args.keep_data:
+        shutil.rmtree(kb_dir, ignore_errors=True)
+    return result
+
+
+def main(args) -> Dict[str, Any]:
+    scales = args.scales or SCALES
+    for n in scales:
+        text_gb = n * (args.max_chars - args.overlap) / 1e9
+        json_gb = n * EMBED_DIM * 21 / 1e9
+        print(f"{n:>12,} chunks ≈ {text_gb:.1f} GB text + {json_gb:.1f} GB embeddings.jsonl on disk")
+
+    results: List[Dict[str, Any]] = []
+    for n in scales:
+        results.append(run_scale(n, args))
+        if "failed_at" in results[-1] and not args.continue_on_failure:
+            break
+    return {"config": vars(args), "results": results}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Scale-test RAG steps 1–3 on synthetic knowledge bases")
+    parser.add_argument("--scales", type=int, nargs="*", help="chunk counts (default 10k..10M)")
+    parser.add_argument("--max-chars", type=int, default=800)
+    parser.add_argument("--overlap", type=int, default=150)
+    parser.add_argument("--real-embeddings", action="store_true",
+                        help="embed with SentenceTransformer instead of synthetic vectors")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--keep-data", action="store_true", help="keep generated corpora")
+    parser.add_argument("--continue-on-failure", action="store_true")
+    parser.add_argument("--out", default=None, help="report path (default benchmarks/results/)")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    report = main(args)
+    path = write_report("scale", report, args.out)
+    print("\n✅ Report saved to:", path)
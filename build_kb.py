@@ -0,0 +1,268 @@
+# build_kb.py — one resumable pass: load → chunk → embed → index → publish
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from rag_step1_load_data import chunk_text, read_text
+from rag_step3_build_index import (
+    DEDUP_THRESHOLD,
+    INDEX_DIM,
+    INDEX_FILE,
+    INDEX_REDUCTION,
+    META_FILE,
+    REDUCE_METHODS,
+    _file_sig,
+    build_index,
+    dedup_chunks,
+    save_index,
+)
+
+# Work files live next to the knowledge base until the build is published
+BUILD_DIR_NAME = ".build"
+CHECKPOINT_NAME = "checkpoint.json"
+VECTORS_NAME = "vectors.f32"
+CHUNKS_NAME = "chunks.jsonl"
+
+BUILD_BATCH = int(os.getenv("APEXMIND_BUILD_BATCH", "64"))
+
+
+# ======================================
+#         STREAMING CHUNK SOURCE
+# ======================================
+def source_files(kb_dir: Path) -> List[Path]:
+    return sorted(Path(kb_dir).glob("*.txt"))
+
+
+def iter_chunks(files: List[Path], max_chars: int, overlap: int) -> Iterator[Dict[str, str]]:
+    """
+    Chunks in build order, one file in memory at a time.
+    """
+    for path in files:
+        yield from chunk_text(read_text(path), path.name, max_chars=max_chars, overlap=overlap)
+
+
+def count_chunks(files: List[Path], max_chars: int, overlap: int) -> int:
+    return sum(1 for _ in iter_chunks(files, max_chars, overlap))
+
+
+def fingerprint(files: List[Path], config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    What a checkpoint was built from; any change restarts the build.
+    """
+    return {
+        "files": [[p.name] + _file_sig(p) for p in files],
+        **config,
+    }
+
+
+# ======================================
+#             CHECKPOINT
+# ======================================
+class Checkpoint:
+    """
+    Append-only vectors (raw float32) + chunk metadata, with a small JSON
+    file naming how many rows are committed. A batch counts only once the
+    checkpoint says so; anything past it is truncated on resume.
+    """
+
+    def __init__(self, build_dir: Path, fp: Dict[str, Any]):
+        self.dir = build_dir
+        self.fp = fp
+        self.rows = 0
+        self.dim: Optional[int] = None
+        self.chunk_bytes = 0
+
+    @property
+    def _path(self) -> Path:
+        return self.dir / CHECKPOINT_NAME
+
+    def open(self) -> "Checkpoint":
+        state = None
+        if self._path.exists():
+            try:
+                with open(self._path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except Exception:
+                state = None
+
+        if state and state.get("fingerprint") == self.fp:
+            self.rows, self.dim, self.chunk_bytes = state["rows"], state["dim"], state["chunk_bytes"]
+            # Drop any partially written batch after the last commit
+            with open(self.dir / VECTORS_NAME, "r+b") as f:
+                f.truncate(self.rows * (self.dim or 0) * 4)
+            with open(self.dir / CHUNKS_NAME, "r+b") as f:
+                f.truncate(self.chunk_bytes)
+        else:
+            shutil.rmtree(self.dir, ignore_errors=True)
+            self.dir.mkdir(parents=True)
+            (self.dir / VECTORS_NAME).touch()
+            (self.dir / CHUNKS_NAME).touch()
+            self._commit()
+        return self
+
+    def append(self, chunks: List[Dict[str, str]], vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        self.dim = self.dim or int(vectors.shape[1])
+
+        lines = "".join(json.dumps(c, ensure_ascii=False) + "\n" for c in chunks).encode("utf-8")
+        for name, data in ((VECTORS_NAME, vectors.tobytes()), (CHUNKS_NAME, lines)):
+            with open(self.dir / name, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.rows += len(chunks)
+        self.chunk_bytes += len(lines)
+        self._commit()
+
+    def _commit(self) -> None:
+        tmp = self._path.with_name(CHECKPOINT_NAME + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fp, "rows": self.rows, "dim": self.dim,
+                       "chunk_bytes": self.chunk_bytes}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path)
+
+    def load(self) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        vectors = np.fromfile(self.dir / VECTORS_NAME, dtype="float32").reshape(self.rows, self.dim)
+        with open(self.dir / CHUNKS_NAME, "r", encoding="utf-8") as f:
+            metas = [dict(id=i, **json.loads(line)) for i, line in enumerate(f, start=1)]
+        return vectors, metas
+
+
+# ======================================
+#               BUILD
+# ======================================
+def _fmt_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def embed_stream(ckpt: Checkpoint, files: List[Path], embedder, total: int,
+                 max_chars: int, overlap: int, batch_size: int) -> None:
+    """
+    Embed every chunk past the checkpoint, committing after each batch.
+    """
+    chunks = iter_chunks(files, max_chars, overlap)
+    for _ in range(ckpt.rows):
+        next(chunks)
+
+    resumed, t0 = ckpt.rows, time.perf_counter()
+    batch: List[Dict[str, str]] = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) < batch_size and ckpt.rows + len(batch) < total:
+            continue
+
+        ckpt.append(batch, embedder.encode([c["content"] for c in batch]))
+        batch = []
+
+        rate = (ckpt.rows - resumed) / max(time.perf_counter() - t0, 1e-9)
+        eta = (total - ckpt.rows) / rate if rate else 0.0
+        print(f"\rEmbedded {ckpt.rows}/{total} chunks  {rate:7.1f}/s  ETA {_fmt_eta(eta)}", end="", flush=True)
+    if batch:
+        ckpt.append(batch, embedder.encode([c["content"] for c in batch]))
+    print()
+
+
+def publish(
+    ckpt: Checkpoint,
+    kb_dir: Path,
+    dim: Optional[int],
+    reduction: str,
+    dedup: float,
+    embedder=None,
+) -> str:
+    """
+    Build the index from the checkpoint and publish index, metadata, arcs
+    and manifest as one reload (the manifest is written last).
+    """
+    vectors, metas = ckpt.load()
+    vectors = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+    vectors, metas, dedup_stats = dedup_chunks(vectors, metas, dedup)
+    if dedup_stats["removed"]:
+        print(f"Dedup: {dedup_stats['chunks_before']} -> {dedup_stats['chunks_after']} chunks")
+
+    index = build_index(vectors, dim, reduction)
+    index_file, meta_file = kb_dir / INDEX_FILE.name, kb_dir / META_FILE.name
+
+    before_publish = None
+    if embedder is not None:
+        from apex_engine import TRAITS
+        from focus_arcs import ARC_DESCRIPTIONS, build_arcs, save_arcs
+
+        arcs = build_arcs(vectors, embedder.encode([ARC_DESCRIPTIONS[t] for t in TRAITS]))
+        before_publish = lambda: save_arcs(arcs, kb_dir, _file_sig(index_file))
+
+    return save_index(index, metas, index_file, meta_file,
+                      extra={"dedup": dedup_stats, "builder": "build_kb"},
+                      before_publish=before_publish)
+
+
+def build(
+    kb_dir: Path,
+    max_chars: int = 800,
+    overlap: int = 150,
+    batch_size: int = BUILD_BATCH,
+    dim: Optional[int] = INDEX_DIM,
+    reduction: str = INDEX_REDUCTION,
+    dedup: float = DEDUP_THRESHOLD,
+    arcs: bool = False,
+    backend: Optional[str] = None,
+) -> Dict[str, Any]:
+    from embedders import EMBED_BACKEND, EMBED_MODEL, load_embedder
+
+    files = source_files(kb_dir)
+    if not files:
+        raise ValueError(f"❌ No .txt files found in {kb_dir}")
+
+    backend = backend or EMBED_BACKEND
+    fp = fingerprint(files, {"max_chars": max_chars, "overlap": overlap,
+                             "model": EMBED_MODEL, "backend": backend})
+    ckpt = Checkpoint(Path(kb_dir) / BUILD_DIR_NAME, fp).open()
+    total = count_chunks(files, max_chars, overlap)
+    print(f"{len(files)} files, {total} chunks"
+          + (f" (resuming after {ckpt.rows})" if ckpt.rows else ""))
+
+    embedder = None
+    if ckpt.rows < total or arcs:
+        embedder = load_embedder(backend)
+    if ckpt.rows < total:
+        embed_stream(ckpt, files, embedder, total, max_chars, overlap, batch_size)
+
+    build_id = publish(ckpt, Path(kb_dir), dim, reduction, dedup, embedder if arcs else None)
+    shutil.rmtree(ckpt.dir, ignore_errors=True)
+    return {"build_id": build_id, "chunks": total}
+
+
+if __name__ == "__main__":
+    from embedders import BACKENDS
+    from kb_registry import DEFAULT_NAMESPACE, namespace_dir
+
+    parser = argparse.ArgumentParser(description="Build a knowledge base index in one resumable pass")
+    parser.add_argument("--namespace", default=DEFAULT_NAMESPACE)
+    parser.add_argument("--max-chars", type=int, default=800)
+    parser.add_argument("--overlap", type=int, default=150)
+    parser.add_argument("--batch", type=int, default=BUILD_BATCH, help="chunks per embed batch / checkpoint")
+    parser.add_argument("--backend", choices=list(BACKENDS), default=None)
+    parser.add_argument("--dim", type=int, default=INDEX_DIM, help="reduce vectors to this many dimensions")
+    parser.add_argument("--reduction", choices=list(REDUCE_METHODS), default=INDEX_REDUCTION)
+    parser.add_argument("--dedup", type=float, default=DEDUP_THRESHOLD)
+    parser.add_argument("--arcs", action="store_true", help="also build focus-arc centroids/candidates")
+    args = parser.parse_args()
+
+    kb_dir = namespace_dir(args.namespace)
+    t0 = time.perf_counter()
+    result = build(kb_dir, args.max_chars, args.overlap, args.batch, args.dim,
+                   args.reduction, args.dedup, args.arcs, args.backend)
+    print(f"\n✅ Published build {result['build_id']} ({result['chunks']} chunks) "
+          f"to {kb_dir} in {time.perf_counter() - t0:.1f}s")
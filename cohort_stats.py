@@ -0,0 +1,348 @@
+# cohort_stats.py — incrementally maintained cohort histograms for percentile ranks
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import atexit
+import json
+import os
+import threading
+import time
+import weakref
+
+from apex_engine import TRAITS, compute_dominance_index
+from persistence import FileLock, UnitOfWork, write_json
+from telemetry import span
+
+BASE_DIR = Path(__file__).resolve().parent
+USER_DIR = BASE_DIR / "user_data"
+USER_DIR.mkdir(exist_ok=True)
+
+COHORT_PATH = USER_DIR / "_cohort.json"
+COHORT_LOCK_PATH = USER_DIR / "_cohort.lock"
+
+# Every metric lives on 0–100 (dominance is scaled up from 0–1), binned at
+# 0.1, so a rank is a prefix sum over at most COHORT_BINS counts
+COHORT_BIN_WIDTH = 0.1
+COHORT_BINS = int(round(100 / COHORT_BIN_WIDTH)) + 1
+METRICS = TRAITS + ["avg_score", "dominance"]
+
+# Cohort snapshots are derived data (rebuild() recreates them), so they are
+# synced with the shared file at most this often rather than on every request
+COHORT_FLUSH_INTERVAL = 2.0
+
+
+# ----------------------------
+# Fenwick tree over bin counts
+# ----------------------------
+class _Histogram:
+    """
+    Counts per bin plus a Fenwick tree, so adding/removing a user and
+    asking "how many are below v" both cost O(log bins).
+    """
+
+    def __init__(self, counts: Optional[List[int]] = None):
+        self.counts = list(counts) if counts else [0] * COHORT_BINS
+        self.total = sum(self.counts)
+        self._tree = [0] * (COHORT_BINS + 1)
+        for i, c in enumerate(self.counts):
+            if c:
+                self._tree_add(i, c)
+
+    def _tree_add(self, i: int, delta: int) -> None:
+        i += 1
+        while i <= COHORT_BINS:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _below(self, i: int) -> int:
+        # Users in bins [0, i)
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def add(self, b: int, delta: int) -> None:
+        self.counts[b] += delta
+        self.total += delta
+        self._tree_add(b, delta)
+
+    def percentile(self, b: int) -> float:
+        """
+        Share of users strictly below bin b, plus half of those tied with it.
+        """
+        if self.total <= 0:
+            return 0.0
+        return 100.0 * (self._below(b) + 0.5 * self.counts[b]) / self.total
+
+
+def _bin(value: float) -> int:
+    return max(0, min(COHORT_BINS - 1, int(round(float(value) / COHORT_BIN_WIDTH))))
+
+
+def _metric_values(scores: Dict[str, float]) -> Dict[str, float]:
+    values = {t: float(scores.get(t, 0.0)) for t in TRAITS}
+    values["avg_score"] = sum(values.values()) / len(TRAITS)
+    values["dominance"] = compute_dominance_index(scores) * 100.0
+    return values
+
+
+# ----------------------------
+# Cohort state
+# ----------------------------
+# _cohort.json is shared by every process (app, API server, ...). Each one
+# keeps the merged histograms in memory plus the moves it applied since its
+# last sync; a sync merges those into the file under COHORT_LOCK_PATH and
+# adopts the result, picking up the other processes' moves. Processes that
+# record moves are listed in "writers" until they exit cleanly: if one of
+# them died, its unsynced moves are gone and the next sync rebuilds the
+# file from the committed profiles.
+_lock = threading.Lock()
+_hists: Optional[Dict[str, _Histogram]] = None
+_pending: List[Tuple[float, Optional[Dict[str, float]], Dict[str, float]]] = []
+_generation = 0
+_registered = False
+_last_sync = 0.0
+
+# Moves staged on a unit of work that has not committed yet (for rank())
+_staged: "weakref.WeakKeyDictionary[UnitOfWork, List[Tuple[Optional[Dict[str, float]], Dict[str, float]]]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows; assume alive
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_file() -> Optional[Dict[str, Any]]:
+    if not COHORT_PATH.exists():
+        return None
+    try:
+        with open(COHORT_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return None
+    if data.get("bins") != COHORT_BINS or set(data.get("metrics", {})) != set(METRICS):
+        return None
+    return data
+
+
+def _rebuilt(data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    # Taken before the scan: moves applied after this are not in it
+    rebuilt_at = time.time()
+    hists = _scan_profiles()
+    return {
+        "generation": (data or {}).get("generation", 0) + 1,
+        "rebuilt_at": rebuilt_at,
+        "writers": [],
+        "metrics": {m: h.counts for m, h in hists.items()},
+    }
+
+
+def _sync_locked(force: bool = False) -> None:
+    """
+    Merge this process's moves into the shared file and adopt its counts.
+    Rate limited to COHORT_FLUSH_INTERVAL unless forced.
+    """
+    global _hists, _pending, _generation, _registered, _last_sync
+    now = time.monotonic()
+    if _hists is not None and not force and now - _last_sync < COHORT_FLUSH_INTERVAL:
+        return
+
+    with FileLock(COHORT_LOCK_PATH):
+        data = _read_file()
+        writers = [int(p) for p in (data or {}).get("writers", [])]
+        if data is None or not all(_pid_alive(p) for p in writers):
+            data = _rebuilt(data)
+            writers = [p for p in writers if _pid_alive(p)]
+
+        pending = _pending
+        if _hists is not None and data.get("generation") != _generation:
+            # Rebuilt since our last sync: moves from before the rebuild
+            # started are already in the scanned profiles
+            pending = [m for m in pending if m[0] >= data.get("rebuilt_at", 0.0)]
+
+        hists = {m: _Histogram(data["metrics"][m]) for m in METRICS}
+        for _, old, new in pending:
+            for m, v in new.items():
+                if old is not None:
+                    hists[m].add(_bin(old[m]), -1)
+                hists[m].add(_bin(v), 1)
+
+        pid = os.getpid()
+        if _registered and pid not in writers:
+            writers.append(pid)
+        if not _registered and pid in writers:
+            writers.remove(pid)
+        snapshot = {
+            "bins": COHORT_BINS,
+            "bin_width": COHORT_BIN_WIDTH,
+            "users": hists[METRICS[0]].total,
+            "generation": data["generation"],
+            "rebuilt_at": data.get("rebuilt_at", 0.0),
+            "writers": sorted(writers),
+            "metrics": {m: h.counts for m, h in hists.items()},
+        }
+        if pending or snapshot["writers"] != data.get("writers") or "users" not in data:
+            write_json(COHORT_PATH, snapshot)
+
+    _hists, _pending, _generation, _last_sync = hists, [], data["generation"], now
+
+
+def _load_locked() -> Dict[str, _Histogram]:
+    if _hists is None:
+        _sync_locked(force=True)
+    return _hists
+
+
+def _scan_profiles() -> Dict[str, _Histogram]:
+    hists = {m: _Histogram() for m in METRICS}
+    with span("cohort.rebuild"):
+        for path in USER_DIR.glob("*_profile.json"):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    profile = json.load(f)
+            except Exception:
+                continue
+            if profile.get("sessions", 0) <= 0:
+                continue
+            for m, v in _metric_values(profile.get("scores", {})).items():
+                hists[m].add(_bin(v), 1)
+    return hists
+
+
+def _apply(old: Optional[Dict[str, float]], new: Dict[str, float]) -> None:
+    global _registered
+    with _lock:
+        if not _registered:
+            # Listed as a writer before holding moves the file lacks
+            _registered = True
+            _sync_locked(force=True)
+        hists = _load_locked()
+        for m, v in new.items():
+            if old is not None:
+                hists[m].add(_bin(old[m]), -1)
+            hists[m].add(_bin(v), 1)
+        _pending.append((time.time(), old, new))
+        _sync_locked()
+
+
+# ----------------------------
+# Public API
+# ----------------------------
+def record_scores(
+    old_scores: Optional[Dict[str, float]],
+    new_scores: Dict[str, float],
+    uow: Optional[UnitOfWork] = None,
+) -> None:
+    """
+    Move one user from their old scores to their new ones (old_scores=None
+    for a user joining the cohort). With `uow`, applied once it commits;
+    rank(..., uow=uow) already counts it.
+    """
+    old = _metric_values(old_scores) if old_scores is not None else None
+    new = _metric_values(new_scores)
+    # Load (or rebuild from profiles) before this request's profile write
+    # lands, so a rebuild cannot count the new scores twice
+    with _lock:
+        _load_locked()
+    if uow is not None:
+        _staged.setdefault(uow, []).append((old, new))
+        uow.after_commit(lambda: _apply(old, new))
+    else:
+        _apply(old, new)
+
+
+def rank(scores: Dict[str, float], uow: Optional[UnitOfWork] = None) -> Dict[str, Any]:
+    """
+    Percentile of each metric within the cohort, and "top X%" by dominance.
+    Moves staged on `uow` (this request's own update) are counted as if
+    already committed.
+    """
+    values = _metric_values(scores)
+    staged = _staged.get(uow, []) if uow is not None else []
+    with _lock:
+        _sync_locked()
+        hists = _load_locked()
+        pct: Dict[str, float] = {}
+        size = hists["dominance"].total
+        for m, v in values.items():
+            b = _bin(v)
+            below, tied, total = hists[m]._below(b), hists[m].counts[b], hists[m].total
+            for old, new in staged:
+                if old is not None:
+                    ob = _bin(old[m])
+                    below -= ob < b
+                    tied -= ob == b
+                    total -= 1
+                nb = _bin(new[m])
+                below += nb < b
+                tied += nb == b
+                total += 1
+            pct[m] = 100.0 * (below + 0.5 * tied) / total if total > 0 else 0.0
+        if staged:
+            size = size + sum(1 for old, _ in staged if old is None)
+
+    return {
+        "cohort_size": size,
+        "dominance_percentile": pct["dominance"],
+        "top_percent": max(0.1, 100.0 - pct["dominance"]) if size else None,
+        "avg_score_percentile": pct["avg_score"],
+        "traits": {t: pct[t] for t in TRAITS},
+    }
+
+
+def rebuild() -> int:
+    """
+    Recompute the cohort from every profile (repair / first run).
+    Returns the cohort size.
+    """
+    global _hists, _pending, _generation, _last_sync
+    with _lock:
+        with FileLock(COHORT_LOCK_PATH):
+            current = _read_file()
+            data = _rebuilt(current)
+            writers = [p for p in (current or {}).get("writers", []) if _pid_alive(p)]
+            hists = {m: _Histogram(data["metrics"][m]) for m in METRICS}
+            write_json(COHORT_PATH, {
+                "bins": COHORT_BINS,
+                "bin_width": COHORT_BIN_WIDTH,
+                "users": hists[METRICS[0]].total,
+                "generation": data["generation"],
+                "rebuilt_at": data["rebuilt_at"],
+                "writers": sorted(writers),
+                "metrics": data["metrics"],
+            })
+        _hists, _pending, _generation, _last_sync = hists, [], data["generation"], time.monotonic()
+        return hists["dominance"].total
+
+
+def flush() -> None:
+    """
+    Merge any unsynced moves and drop this process from the writers.
+    """
+    global _registered
+    with _lock:
+        if _hists is None:
+            return
+        _registered = False
+        _sync_locked(force=True)
+
+
+atexit.register(flush)
+
+
+if __name__ == "__main__":
+    print("Cohort size:", rebuild())
@@ -0,0 +1,260 @@
+# conversation_memory.py
+
+from __future__ import annotations
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable
+import json
+import threading
+
+import numpy as np
+import faiss
+
+from persistence import UnitOfWork, append_bytes, delete_file, put_bytes
+from telemetry import span, incr
+
+BASE_DIR = Path(__file__).resolve().parent
+USER_DIR = BASE_DIR / "user_data"
+USER_DIR.mkdir(exist_ok=True)
+
+# How many per-user indexes stay in RAM before the least recently used goes
+MEMORY_MAX_LOADED = 64
+# Retrieved memories are clipped so history costs a fixed number of tokens
+MEMORY_K = 2
+MEMORY_SNIPPET_CHARS = 400
+MEMORY_MIN_SCORE = 0.3
+# Part of the file names: a user without files in the current format is
+# re-embedded from their interaction log on their next interaction
+MEMORY_FORMAT = "v2"
+BACKFILL_BATCH = 64
+
+Encoder = Callable[[List[str]], np.ndarray]
+_encoder: Optional[Encoder] = None
+
+
+# -----------------------------
+# Helpers
+# -----------------------------
+def _vectors_path(user_id: str) -> Path:
+    return USER_DIR / f"{user_id}_memory.{MEMORY_FORMAT}.f32"
+
+
+def _entries_path(user_id: str) -> Path:
+    return USER_DIR / f"{user_id}_memory.{MEMORY_FORMAT}.jsonl"
+
+
+def _legacy_paths(user_id: str) -> List[Path]:
+    # First format: only the user's input was embedded
+    return [USER_DIR / f"{user_id}_memory.f32", USER_DIR / f"{user_id}_memory.jsonl"]
+
+
+def _normalize(vecs: np.ndarray) -> np.ndarray:
+    vecs = np.asarray(vecs, dtype="float32").reshape(len(vecs), -1)
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12
+    return vecs / norms
+
+
+def _embed_text(user_input: str, agent_response: str) -> str:
+    # Question and answer together, so a later question can match either
+    return f"{user_input.strip()}\n{agent_response.strip()}"
+
+
+def _snippet(user_input: str, agent_response: str) -> str:
+    text = f"User: {user_input.strip()}\nApexMind: {agent_response.strip()}"
+    if len(text) > MEMORY_SNIPPET_CHARS:
+        text = text[: MEMORY_SNIPPET_CHARS - 1] + "…"
+    return text
+
+
+def configure_encoder(encoder: Encoder) -> None:
+    """
+    Register the text -> vector function used to index interactions.
+    Until this is called, add_interaction is a no-op.
+    """
+    global _encoder
+    _encoder = encoder
+
+
+# -----------------------------
+# Per-user index cache (LRU)
+# -----------------------------
+class _UserMemory:
+    def __init__(self, dim: int):
+        self.index = faiss.IndexFlatIP(dim)
+        self.entries: List[Dict[str, Any]] = []
+
+
+_cache: "OrderedDict[str, _UserMemory]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _load(user_id: str, dim: int) -> _UserMemory:
+    with _lock:
+        mem = _cache.get(user_id)
+        if mem is not None:
+            _cache.move_to_end(user_id)
+            incr("cache_hits_total", cache="conversation_memory")
+            return mem
+
+    incr("cache_misses_total", cache="conversation_memory")
+    mem = _UserMemory(dim)
+    vec_path = _vectors_path(user_id)
+    entries_path = _entries_path(user_id)
+    if vec_path.exists() and entries_path.exists():
+        vecs = np.fromfile(vec_path, dtype="float32")
+        vecs = vecs[: len(vecs) // dim * dim].reshape(-1, dim)
+        with open(entries_path, "r", encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+
+        # A crash between the two appends can leave them uneven
+        n = min(len(vecs), len(entries))
+        if n:
+            mem.index.add(np.ascontiguousarray(vecs[:n]))
+            mem.entries = entries[:n]
+
+    with _lock:
+        _cache[user_id] = mem
+        _cache.move_to_end(user_id)
+        while len(_cache) > MEMORY_MAX_LOADED:
+            _cache.popitem(last=False)
+    return mem
+
+
+# -----------------------------
+# Public API
+# -----------------------------
+def backfill(user_id: str, uow: Optional[UnitOfWork] = None) -> int:
+    """
+    Rebuild the user's memory from their interaction log (users from
+    before memory existed, or from an older MEMORY_FORMAT). Replaces any
+    existing memory files; returns how many interactions were embedded.
+    """
+    from memory_system import _log_lock, iter_history   # memory_system imports this module
+
+    if _encoder is None:
+        return 0
+
+    if uow is None:
+        with UnitOfWork(durable=False) as own:
+            return backfill(user_id, uow=own)
+    # Re-entrant: log_interaction already holds it when backfilling inline
+    _log_lock(user_id).hold(uow)
+
+    records = [r for r in iter_history(user_id) if r.get("user_input")]
+    vecs, lines = [], []
+    with span("memory.backfill", interactions=len(records)):
+        for i in range(0, len(records), BACKFILL_BATCH):
+            batch = records[i : i + BACKFILL_BATCH]
+            vecs.append(_normalize(_encoder(
+                [_embed_text(r["user_input"], r.get("agent_response", "")) for r in batch]
+            )))
+            for r in batch:
+                entry = {
+                    "timestamp": r.get("timestamp") or "",
+                    "content": _snippet(r["user_input"], r.get("agent_response", "")),
+                }
+                lines.append((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    if records:
+        put_bytes(_vectors_path(user_id), np.concatenate(vecs).tobytes(), uow=uow)
+        put_bytes(_entries_path(user_id), b"".join(lines), uow=uow)
+    for path in _legacy_paths(user_id):
+        if path.exists():
+            delete_file(path, uow=uow)
+
+    def _drop_cache() -> None:
+        with _lock:
+            _cache.pop(user_id, None)
+
+    uow.after_commit(_drop_cache)
+    return len(records)
+
+
+def add_interaction(
+    user_id: str,
+    user_input: str,
+    agent_response: str,
+    timestamp: str,
+    uow: Optional[UnitOfWork] = None,
+) -> None:
+    """
+    Embed one interaction and append it to the user's memory index.
+    With `uow`, the appends are staged and the cache updated on commit.
+    Callers hold the user's log lock (memory_system.log_interaction).
+    """
+    if _encoder is None:
+        return
+
+    if not _entries_path(user_id).exists():
+        # The new interaction is not in the committed log yet
+        backfill(user_id, uow=uow)
+
+    with span("memory.embed"):
+        vec = _normalize(_encoder([_embed_text(user_input, agent_response)]))
+    entry = {
+        "timestamp": timestamp,
+        "content": _snippet(user_input, agent_response),
+    }
+
+    line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+    with span("write.memory"):
+        append_bytes(_vectors_path(user_id), vec.tobytes(), uow=uow, align=vec.nbytes)
+        append_bytes(_entries_path(user_id), line, uow=uow)
+
+    # Keep an already-loaded index in sync instead of reloading it
+    def _update_cache() -> None:
+        with _lock:
+            mem = _cache.get(user_id)
+            if mem is not None:
+                mem.index.add(vec)
+                mem.entries.append(entry)
+
+    if uow is not None:
+        uow.after_commit(_update_cache)
+    else:
+        _update_cache()
+
+
+def search_memory(
+    user_id: str,
+    query_vec: np.ndarray,
+    k: int = MEMORY_K,
+) -> List[Dict[str, Any]]:
+    """
+    Return up to k past interactions most similar to the query vector.
+    """
+    q = _normalize(query_vec)
+    mem = _load(user_id, q.shape[1])
+    if mem.index.ntotal == 0 or k <= 0:
+        return []
+
+    scores, indices = mem.index.search(q, min(k, mem.index.ntotal))
+
+    results = []
+    for score, idx in zip(scores[0], indices[0]):
+        if idx == -1 or score < MEMORY_MIN_SCORE:
+            continue
+        entry = mem.entries[idx]
+        results.append({
+            "kind": "memory",
+            "source": f"memory:{entry['timestamp'][:10]}",
+            "content": entry["content"],
+            "score": float(score),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from embedders import load_embedder
+
+    parser = argparse.ArgumentParser(description="Re-embed conversation memory from interaction logs")
+    parser.add_argument("user_ids", nargs="*", help="default: every user with a profile")
+    parser.add_argument("--backend", default=None)
+    args = parser.parse_args()
+
+    configure_encoder(load_embedder(args.backend).encode)
+    user_ids = args.user_ids or sorted(p.name[: -len("_profile.json")] for p in USER_DIR.glob("*_profile.json"))
+    for user_id in user_ids:
+        print(f"{user_id}: {backfill(user_id)} interactions")
@@ -0,0 +1,251 @@
+# embed_service.py — one shared embedder behind a Unix socket, with micro-batching
+
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+
+from telemetry import span, incr
+
+EMBED_SOCKET = os.getenv("APEXMIND_EMBED_SOCKET", "/tmp/apexmind-embed.sock")
+# A batch is encoded once it holds MAX_BATCH texts or the oldest request
+# has waited MAX_WAIT_MS, whichever comes first
+MAX_BATCH = int(os.getenv("APEXMIND_EMBED_MAX_BATCH", "32"))
+MAX_WAIT_MS = float(os.getenv("APEXMIND_EMBED_MAX_WAIT_MS", "5"))
+CLIENT_TIMEOUT = float(os.getenv("APEXMIND_EMBED_TIMEOUT", "30"))
+# Local backend the service runs when APEXMIND_EMBEDDER=service (the client
+# setting) is also set in its own environment
+SERVICE_BACKEND = os.getenv("APEXMIND_EMBED_SERVICE_BACKEND", "torch")
+
+_HEADER = struct.Struct(">I")
+
+
+# ========================================
+#              FRAMING
+# ========================================
+# Every message is a 4-byte big-endian length followed by the payload.
+# Request: JSON {"texts": [...]}. Response: JSON header {"shape": [n, d]}
+# or {"error": "..."}, then (on success) the raw float32 vectors.
+def _send_frame(sock: socket.socket, payload: bytes) -> None:
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("embedding service closed the connection")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _recv_frame(sock: socket.socket) -> bytes:
+    (length,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return _recv_exact(sock, length)
+
+
+# ========================================
+#            MICRO-BATCHER
+# ========================================
+class _Request:
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.vectors: Optional[np.ndarray] = None
+        self.error: Optional[str] = None
+
+
+class MicroBatcher:
+    """
+    Single encoder thread. Requests that arrive while it is waiting or
+    encoding are merged into one model call and split back afterwards.
+    """
+
+    def __init__(self, embedder, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+        self.embedder = embedder
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="apexmind-embed-batch", daemon=True)
+        self._thread.start()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        req = _Request(texts)
+        self._queue.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise RuntimeError(req.error)
+        return req.vectors
+
+    def _gather(self) -> List[_Request]:
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = batch[0].enqueued + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                req = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(req)
+            size += len(req.texts)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._gather()
+            texts = [t for req in batch for t in req.texts]
+            try:
+                with span("embed_service.encode", requests=len(batch), texts=len(texts)):
+                    vecs = np.asarray(self.embedder.encode(texts), dtype="float32") if texts else None
+                incr("embed_batches_total")
+                incr("embed_texts_total", len(texts))
+                start = 0
+                for req in batch:
+                    n = len(req.texts)
+                    req.vectors = vecs[start:start + n] if n else np.zeros((0, 0), dtype="float32")
+                    start += n
+            except Exception as e:
+                for req in batch:
+                    req.error = f"{type(e).__name__}: {e}"
+            for req in batch:
+                req.done.set()
+
+
+# ========================================
+#               SERVER
+# ========================================
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        # One connection carries many requests from one client thread
+        while True:
+            try:
+                body = json.loads(_recv_frame(self.request))
+            except (ConnectionError, OSError):
+                return
+            except ValueError:
+                _send_frame(self.request, json.dumps({"error": "request must be JSON"}).encode("utf-8"))
+                continue
+
+            texts = body.get("texts")
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                _send_frame(self.request, json.dumps({"error": "texts must be a list of strings"}).encode("utf-8"))
+                continue
+
+            try:
+                vecs = self.server.batcher.encode(texts)
+            except Exception as e:
+                _send_frame(self.request, json.dumps({"error": str(e)}).encode("utf-8"))
+                continue
+
+            vecs = np.ascontiguousarray(vecs, dtype="<f4")
+            _send_frame(self.request, json.dumps({"shape": list(vecs.shape)}).encode("utf-8"))
+            _send_frame(self.request, vecs.tobytes())
+
+
+class EmbedServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    # Every worker thread of every client process holds a connection
+    request_queue_size = 256
+
+    def __init__(self, socket_path: str, batcher: MicroBatcher):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)   # stale socket from a previous run
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+        self.batcher = batcher
+
+
+def serve(socket_path: str = EMBED_SOCKET, backend: Optional[str] = None,
+          max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS) -> None:
+    from embedders import EMBED_BACKEND, load_embedder
+
+    if backend == "service":
+        raise ValueError("the embedding service cannot use the service backend itself")
+    backend = backend or EMBED_BACKEND
+    if backend == "service":
+        # Would hand back a client of this very socket
+        backend = SERVICE_BACKEND
+        if backend == "service":
+            raise ValueError("APEXMIND_EMBED_SERVICE_BACKEND must name a local backend")
+    embedder = load_embedder(backend)
+    server = EmbedServer(socket_path, MicroBatcher(embedder, max_batch, max_wait_ms))
+    print(f"Embedding service on {socket_path} ({embedder.name}, batch ≤ {max_batch}, wait ≤ {max_wait_ms}ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+# ========================================
+#               CLIENT
+# ========================================
+class EmbedClient:
+    """
+    Thin client with the same encode() as the in-process embedders. Each
+    thread keeps its own connection, so concurrent callers reach the
+    service concurrently and get batched together there.
+    """
+
+    def __init__(self, socket_path: str = EMBED_SOCKET, timeout: float = CLIENT_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self.name = f"embedding service at {socket_path}"
+        self.encode([])   # fail at startup, not on the first query
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self._local.sock = sock
+        return sock
+
+    def _request(self, texts: List[str]) -> np.ndarray:
+        sock = getattr(self._local, "sock", None) or self._connect()
+        _send_frame(sock, json.dumps({"texts": texts}).encode("utf-8"))
+        header: Dict[str, Any] = json.loads(_recv_frame(sock))
+        if "error" in header:
+            raise RuntimeError(f"embedding service: {header['error']}")
+        n, d = header["shape"]
+        return np.frombuffer(_recv_frame(sock), dtype="<f4").reshape(n, d)
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        try:
+            return self._request(list(texts))
+        except (ConnectionError, OSError):
+            # Service restarted since this thread connected: retry once
+            sock, self._local.sock = getattr(self._local, "sock", None), None
+            if sock is not None:
+                sock.close()
+            return self._request(list(texts))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared local embedding service")
+    parser.add_argument("--socket", default=EMBED_SOCKET)
+    parser.add_argument("--backend", default=None,
+                        help="embedder backend (default APEXMIND_EMBEDDER, or "
+                             "APEXMIND_EMBED_SERVICE_BACKEND when that is 'service')")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    serve(args.socket, args.backend, args.max_batch, args.max_wait_ms)
@@ -0,0 +1,182 @@
+# embedders.py — text embedding backends (float PyTorch, int8 PyTorch, int8 ONNX Runtime)
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, List
+import json
+import os
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent
+MODEL_DIR = BASE_DIR / "models"
+
+EMBED_MODEL = "all-MiniLM-L6-v2"
+
+# torch      — SentenceTransformer as shipped (float32)
+# torch-int8 — same model with Linear layers dynamically quantized to int8
+# onnx-int8  — exported once to ONNX, int8-quantized, served by onnxruntime
+#              (no torch import at serving time)
+# service    — client of embed_service.py, which holds the one model copy
+BACKENDS = ("torch", "torch-int8", "onnx-int8", "service")
+EMBED_BACKEND = os.getenv("APEXMIND_EMBEDDER", "torch")
+
+
+# ======================================
+#           PYTORCH BACKENDS
+# ======================================
+class TorchEmbedder:
+    def __init__(self, model_name: str = EMBED_MODEL, quantize: bool = False):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        if quantize:
+            import torch
+            self.model = torch.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.name = f"{model_name} (torch{'-int8' if quantize else ''})"
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        vecs = self.model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+        return np.asarray(vecs, dtype="float32")
+
+
+# ======================================
+#            ONNX BACKEND
+# ======================================
+def onnx_model_dir(model_name: str = EMBED_MODEL) -> Path:
+    return MODEL_DIR / f"{model_name}-onnx"
+
+
+def export_onnx(model_name: str = EMBED_MODEL, out_dir: Path | None = None) -> Path:
+    """
+    Export the SentenceTransformer's transformer to ONNX and write an int8
+    dynamically-quantized copy next to the tokenizer and pooling config.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    out_dir = Path(out_dir or onnx_model_dir(model_name))
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0].auto_model.eval()
+    st.tokenizer.save_pretrained(str(out_dir))
+
+    sample = st.tokenizer(["ApexMind export"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    axes = {n: {0: "batch", 1: "seq"} for n in input_names}
+    axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+
+    fp32_path = out_dir / "model.onnx"
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[n] for n in input_names),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=axes,
+            opset_version=14,
+        )
+    quantize_dynamic(str(fp32_path), str(out_dir / "model_int8.onnx"), weight_type=QuantType.QInt8)
+
+    pooling = st[1]
+    config = {
+        "model": model_name,
+        "dim": st.get_sentence_embedding_dimension(),
+        "max_seq_length": st.max_seq_length,
+        "pooling": "cls" if pooling.pooling_mode_cls_token else "mean",
+        "normalize": any(type(m).__name__ == "Normalize" for m in st),
+    }
+    with open(out_dir / "apexmind_embedder.json", "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    return out_dir
+
+
+class OnnxEmbedder:
+    def __init__(self, model_name: str = EMBED_MODEL, threads: int | None = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = onnx_model_dir(model_name)
+        if not (model_dir / "model_int8.onnx").exists():
+            export_onnx(model_name, model_dir)
+
+        with open(model_dir / "apexmind_embedder.json", "r", encoding="utf-8") as f:
+            self.config: Dict[str, Any] = json.load(f)
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding()
+
+        opts = ort.SessionOptions()
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            str(model_dir / "model_int8.onnx"), opts, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.name = f"{model_name} (onnx-int8)"
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        enc = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in enc], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in enc], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in enc], dtype=np.int64)
+
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+
+        if self.config["pooling"] == "cls":
+            vecs = hidden[:, 0]
+        else:
+            m = mask[..., None].astype(np.float32)
+            vecs = (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+
+        if self.config["normalize"]:
+            vecs = vecs / (np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12)
+        return vecs.astype("float32")
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts:
+            return np.zeros((0, self.config["dim"]), dtype="float32")
+        return np.concatenate(
+            [self._encode_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        )
+
+
+# ======================================
+#              FACTORY
+# ======================================
+def load_embedder(backend: str | None = None, model_name: str = EMBED_MODEL):
+    """
+    Build the configured embedder. Every backend exposes
+    encode(list_of_texts) -> float32 array of shape (n, dim).
+    """
+    backend = backend or EMBED_BACKEND
+    if backend == "torch":
+        return TorchEmbedder(model_name)
+    if backend == "torch-int8":
+        return TorchEmbedder(model_name, quantize=True)
+    if backend == "onnx-int8":
+        return OnnxEmbedder(model_name)
+    if backend == "service":
+        from embed_service import EmbedClient
+        return EmbedClient()
+    raise ValueError(f"Unknown embedder backend {backend!r}; expected one of {BACKENDS}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the int8 ONNX embedder")
+    parser.add_argument("--model", default=EMBED_MODEL)
+    args = parser.parse_args()
+
+    print("✅ Exported to:", export_onnx(args.model))
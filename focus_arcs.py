@@ -0,0 +1,174 @@
+# focus_arcs.py — per-trait arc centroids and candidate sets, built at index time
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import os
+
+import numpy as np
+
+from apex_engine import TRAITS
+from vector_filters import filtered_search
+
+ARCS_NAME = "faiss_arcs.npz"
+
+# Text each arc is seeded from (embedded once at build time)
+ARC_DESCRIPTIONS = {
+    "discipline": "Discipline: daily structure, routines and rituals, doing what must be done regardless of mood, no escape routes.",
+    "consistency": "Consistency: showing up every day, removing zero days, building streaks and habits through repetition.",
+    "execution": "Execution: more doing and less overthinking, shipping, acting under pressure, finishing what you start.",
+    "adaptability": "Adaptability: embracing chaos, adjusting faster to change, learning from setbacks, staying flexible.",
+    "ego_strength": "Ego strength: self-belief, rebuilding identity around winning, competitive ego, refusing to feel inferior.",
+    "clarity": "Clarity: sharpening goals, eliminating vagueness, strategic thinking, knowing exactly what to do next.",
+}
+
+# Chunks nearest to the description pull the centroid toward how the
+# knowledge base itself talks about the trait
+ARC_SEED_CHUNKS = 8
+ARC_CANDIDATES = 64
+
+# "bias"     — one search with the query nudged toward the arc centroid
+# "restrict" — rank only the arc's precomputed candidates (no index search)
+# "off"      — plain retrieval
+ARC_MODES = ("bias", "restrict", "off")
+ARC_MODE = os.getenv("APEXMIND_ARC_MODE", "bias")
+ARC_BIAS = float(os.getenv("APEXMIND_ARC_BIAS", "0.25"))
+
+
+def _unit(v: np.ndarray) -> np.ndarray:
+    return v / (np.linalg.norm(v, axis=-1, keepdims=True) + 1e-12)
+
+
+# ======================================
+#              BUILD
+# ======================================
+def build_arcs(
+    emb_array: np.ndarray,
+    description_vecs: np.ndarray,
+    seed_chunks: int = ARC_SEED_CHUNKS,
+    n_candidates: int = ARC_CANDIDATES,
+) -> Dict[str, np.ndarray]:
+    """
+    emb_array: (n, d) normalized chunk vectors, in index id order.
+    description_vecs: (len(TRAITS), d) embedded ARC_DESCRIPTIONS.
+    """
+    chunks = _unit(np.asarray(emb_array, dtype="float32"))
+    desc = _unit(np.asarray(description_vecs, dtype="float32"))
+
+    seed_chunks = min(seed_chunks, len(chunks))
+    n_candidates = min(n_candidates, len(chunks))
+
+    centroids = np.empty_like(desc)
+    sims = desc @ chunks.T
+    for i in range(len(TRAITS)):
+        seeds = np.argpartition(-sims[i], seed_chunks - 1)[:seed_chunks]
+        centroids[i] = desc[i] + chunks[seeds].mean(axis=0)
+    centroids = _unit(centroids)
+
+    cand_sims = centroids @ chunks.T
+    candidates = np.argsort(-cand_sims, axis=1)[:, :n_candidates].astype("int64")
+
+    return {
+        "traits": np.array(TRAITS),
+        "centroids": centroids,
+        "candidates": candidates,
+        # Full-width candidate vectors so "restrict" needs no index access
+        "candidate_vecs": chunks[candidates],
+    }
+
+
+def save_arcs(arcs: Dict[str, np.ndarray], kb_dir: Path, index_sig: List[int]) -> Path:
+    path = Path(kb_dir) / ARCS_NAME
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez(tmp, index_sig=np.array(index_sig, dtype="int64"), **arcs)
+    os.replace(tmp, path)
+    return path
+
+
+def load_arcs(kb_dir: Path, index_sig: List[int], ntotal: int) -> Optional[Dict[str, Any]]:
+    """
+    Arcs for the index they were built from, or None if missing or stale.
+    """
+    path = Path(kb_dir) / ARCS_NAME
+    if not path.exists():
+        return None
+    with np.load(path) as data:
+        if list(data["index_sig"]) != list(index_sig):
+            return None
+        arcs = {k: data[k] for k in ("centroids", "candidates", "candidate_vecs")}
+        arcs["traits"] = [str(t) for t in data["traits"]]
+    if arcs["candidates"].size and arcs["candidates"].max() >= ntotal:
+        return None
+    arcs["row"] = {t: i for i, t in enumerate(arcs["traits"])}
+    return arcs
+
+
+# ======================================
+#             RETRIEVAL
+# ======================================
+def arc_search(
+    index,
+    arcs: Optional[Dict[str, Any]],
+    query_vec: np.ndarray,
+    k: int,
+    trait: Optional[str],
+    mode: str = ARC_MODE,
+    bias: float = ARC_BIAS,
+    ids: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Drop-in for index.search(query_vec, k) that leans toward `trait`'s arc.
+    Falls back to a plain search without arcs, trait or mode.
+    `ids` (sorted, from KnowledgeBase.select) limits results to that subset.
+    """
+    row = arcs["row"].get(trait) if arcs and trait else None
+    if row is None or mode == "off":
+        return filtered_search(index, query_vec, k, ids)
+
+    if mode == "restrict":
+        candidates, vecs = arcs["candidates"][row], arcs["candidate_vecs"][row]
+        if ids is not None:
+            keep = np.isin(candidates, ids, assume_unique=True)
+            if keep.sum() < min(k, len(ids)):
+                # Too few arc candidates pass the filter: lean via bias instead
+                return arc_search(index, arcs, query_vec, k, trait, "bias", bias, ids)
+            candidates, vecs = candidates[keep], vecs[keep]
+        q = _unit(query_vec[0])
+        scores = vecs @ q
+        top = np.argsort(-scores)[:k]
+        return scores[top][None, :].astype("float32"), candidates[top][None, :]
+
+    # bias: a single search, query moved toward the arc centroid
+    shifted = _unit(query_vec + bias * arcs["centroids"][row][None, :]).astype("float32")
+    return filtered_search(index, shifted, k, ids)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from embedders import load_embedder
+    import json
+
+    from kb_registry import DEFAULT_NAMESPACE, INDEX_NAME, META_NAME, namespace_dir
+    from rag_step3_build_index import EMBED_FILE, load_embeddings
+
+    parser = argparse.ArgumentParser(description="Build focus-arc centroids and candidate sets")
+    parser.add_argument("--namespace", default=DEFAULT_NAMESPACE)
+    parser.add_argument("--candidates", type=int, default=ARC_CANDIDATES)
+    args = parser.parse_args()
+
+    kb_dir = namespace_dir(args.namespace)
+    emb_array, metas = load_embeddings(kb_dir / EMBED_FILE.name)
+    # Rows in index order (the build may have folded near-duplicates)
+    row_of = {m["id"]: i for i, m in enumerate(metas)}
+    with open(kb_dir / META_NAME, "r", encoding="utf-8") as f:
+        emb_array = emb_array[[row_of[json.loads(line)["id"]] for line in f if line.strip()]]
+    desc = load_embedder().encode([ARC_DESCRIPTIONS[t] for t in TRAITS])
+
+    arcs = build_arcs(emb_array, desc, n_candidates=args.candidates)
+    st = (kb_dir / INDEX_NAME).stat()
+    path = save_arcs(arcs, kb_dir, [st.st_size, st.st_mtime_ns])
+
+    for t, cands in zip(TRAITS, arcs["candidates"]):
+        print(f"{t:<13} {len(cands)} candidates")
+    print("\n✅ Saved arcs to:", path)
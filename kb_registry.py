@@ -0,0 +1,318 @@
+# kb_registry.py — namespaced knowledge bases, loaded on first use, LRU-evicted
+
+from __future__ import annotations
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import json
+import os
+import re
+import threading
+import time
+
+import faiss
+import numpy as np
+
+from focus_arcs import ARCS_NAME, load_arcs
+from vector_filters import Filters, MetadataPostings
+from telemetry import span, incr
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# "default" is the shipped Knowledge_base/; every other namespace lives in
+# KB_ROOT/<namespace>/ with the same layout (*.txt, faiss_index.bin,
+# faiss_meta.jsonl), so rag_step1–3 build it with --namespace.
+DEFAULT_NAMESPACE = "default"
+DEFAULT_KB_DIR = BASE_DIR / "Knowledge_base"
+KB_ROOT = Path(os.getenv("APEXMIND_KB_ROOT", str(BASE_DIR / "knowledge_bases")))
+
+# Loaded indexes + metadata are evicted least-recently-used first once
+# either limit is exceeded
+KB_CACHE_MB = float(os.getenv("APEXMIND_KB_CACHE_MB", "2048"))
+KB_MAX_LOADED = int(os.getenv("APEXMIND_KB_MAX_LOADED", "256"))
+
+NAMESPACE_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+INDEX_NAME = "faiss_index.bin"
+META_NAME = "faiss_meta.jsonl"
+# Written last by rag_step3_build_index; names the build and the exact
+# index/metadata files that belong to it
+MANIFEST_NAME = "faiss_manifest.json"
+
+# How often the watcher checks loaded knowledge bases for a new build
+KB_RELOAD_INTERVAL = float(os.getenv("APEXMIND_KB_RELOAD_INTERVAL", "5"))
+
+
+class UnknownKnowledgeBase(LookupError):
+    pass
+
+
+# -----------------------------
+# Paths
+# -----------------------------
+def namespace_dir(namespace: str) -> Path:
+    if namespace == DEFAULT_NAMESPACE:
+        return DEFAULT_KB_DIR
+    if not NAMESPACE_RE.match(namespace):
+        raise UnknownKnowledgeBase(f"invalid knowledge base namespace {namespace!r}")
+    return KB_ROOT / namespace
+
+
+def list_namespaces() -> List[str]:
+    found = [DEFAULT_NAMESPACE] if (DEFAULT_KB_DIR / INDEX_NAME).exists() else []
+    if KB_ROOT.exists():
+        found += sorted(p.parent.name for p in KB_ROOT.glob(f"*/{INDEX_NAME}"))
+    return found
+
+
+# -----------------------------
+# Loaded knowledge bases (LRU)
+# -----------------------------
+class KnowledgeBase:
+    """
+    One immutable build of a namespace. Reloads swap in a new object, so a
+    search holding this one finishes on the version it started with.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        index,
+        metadata: List[Dict[str, Any]],
+        nbytes: int,
+        version: str,
+        arcs: Optional[Dict[str, Any]] = None,
+    ):
+        self.namespace = namespace
+        self.index = index
+        self.metadata = metadata
+        # Approximate resident size: on-disk index + metadata text
+        self.nbytes = nbytes
+        self.version = version
+        # Focus-arc centroids / candidates built for this index (focus_arcs)
+        self.arcs = arcs
+        # field -> value -> ids, for filters pushed into the search
+        self.postings = MetadataPostings(metadata)
+
+    def select(self, filters: Optional[Filters]) -> Optional[np.ndarray]:
+        """
+        Index ids matching `filters`, or None for no filter.
+        """
+        if not filters:
+            return None
+        return self.postings.select(filters)
+
+
+_cache: "OrderedDict[str, KnowledgeBase]" = OrderedDict()
+_cache_bytes = 0
+_lock = threading.Lock()
+# One loader per namespace; concurrent first requests wait for it
+_load_locks: Dict[str, threading.Lock] = {}
+
+
+def _file_sig(path: Path) -> List[int]:
+    st = path.stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def current_version(namespace: str) -> Optional[str]:
+    """
+    Build id on disk: the manifest's, or for indexes built before manifests
+    existed, one derived from the files' size and mtime.
+    """
+    kb_dir = namespace_dir(namespace)
+    version = None
+    try:
+        with open(kb_dir / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            version = json.load(f)["build_id"]
+    except (OSError, ValueError, KeyError):
+        pass
+    if version is None:
+        try:
+            sig = _file_sig(kb_dir / INDEX_NAME) + _file_sig(kb_dir / META_NAME)
+        except OSError:
+            return None
+        version = "legacy-" + "-".join(map(str, sig))
+
+    # Arcs are built after the index, so a new arcs file is a new version too
+    try:
+        version += f"+arcs-{(kb_dir / ARCS_NAME).stat().st_mtime_ns}"
+    except OSError:
+        pass
+    return version
+
+
+def _read_once(namespace: str) -> Optional[KnowledgeBase]:
+    kb_dir = namespace_dir(namespace)
+    index_path, meta_path = kb_dir / INDEX_NAME, kb_dir / META_NAME
+    if not index_path.exists() or not meta_path.exists():
+        raise UnknownKnowledgeBase(f"no built index for knowledge base {namespace!r}")
+
+    manifest = None
+    if (kb_dir / MANIFEST_NAME).exists():
+        with open(kb_dir / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    version = current_version(namespace)
+    with span("kb.load", namespace=namespace):
+        index = faiss.read_index(str(index_path))
+        with open(meta_path, "r", encoding="utf-8") as f:
+            metadata = [json.loads(line) for line in f if line.strip()]
+
+    # A build replaces the two files one after the other and then the
+    # manifest; if what we read is not what the manifest describes, a build
+    # was in progress
+    if manifest and (
+        _file_sig(index_path) != manifest.get("index_sig")
+        or _file_sig(meta_path) != manifest.get("meta_sig")
+    ):
+        return None
+    if index.ntotal != len(metadata):
+        return None
+
+    arcs = load_arcs(kb_dir, _file_sig(index_path), index.ntotal)
+    nbytes = index_path.stat().st_size + meta_path.stat().st_size
+    return KnowledgeBase(namespace, index, metadata, nbytes, version, arcs)
+
+
+def _read(namespace: str, attempts: int = 5) -> KnowledgeBase:
+    for attempt in range(attempts):
+        kb = _read_once(namespace)
+        if kb is not None:
+            return kb
+        time.sleep(0.2 * (attempt + 1))
+    raise UnknownKnowledgeBase(f"knowledge base {namespace!r} is mid-build; index and metadata disagree")
+
+
+def _evict_locked(keep: str) -> None:
+    global _cache_bytes
+    cap = KB_CACHE_MB * 1024 * 1024
+    while len(_cache) > 1 and (_cache_bytes > cap or len(_cache) > KB_MAX_LOADED):
+        oldest = next(iter(_cache))
+        if oldest == keep:
+            _cache.move_to_end(oldest)
+            continue
+        # In-flight searches keep their own reference until they finish
+        _cache_bytes -= _cache.pop(oldest).nbytes
+        incr("cache_evictions_total", cache="knowledge_base")
+
+
+def get_kb(namespace: Optional[str] = None) -> KnowledgeBase:
+    """
+    Return the loaded knowledge base for `namespace`, reading it from disk
+    on first use. Raises UnknownKnowledgeBase if it has not been built.
+    """
+    global _cache_bytes
+    namespace = namespace or DEFAULT_NAMESPACE
+
+    with _lock:
+        kb = _cache.get(namespace)
+        if kb is not None:
+            _cache.move_to_end(namespace)
+            incr("cache_hits_total", cache="knowledge_base")
+            return kb
+        load_lock = _load_locks.setdefault(namespace, threading.Lock())
+
+    with load_lock:
+        with _lock:
+            kb = _cache.get(namespace)
+            if kb is not None:
+                _cache.move_to_end(namespace)
+                return kb
+
+        kb = _read(namespace)
+        incr("cache_misses_total", cache="knowledge_base")
+
+        with _lock:
+            _cache[namespace] = kb
+            _cache_bytes += kb.nbytes
+            _evict_locked(keep=namespace)
+    return kb
+
+
+def reload(namespace: str) -> bool:
+    """
+    Load the on-disk build of a cached namespace if it is newer and swap it
+    in. The old version keeps serving until the new one is fully loaded.
+    Returns True if a new version was swapped in.
+    """
+    global _cache_bytes
+    with _lock:
+        old = _cache.get(namespace)
+        load_lock = _load_locks.setdefault(namespace, threading.Lock())
+    if old is None or current_version(namespace) in (None, old.version):
+        return False
+
+    with load_lock:
+        with span("kb.reload", namespace=namespace):
+            new = _read(namespace)
+            if new.index.ntotal:
+                # Touch the index once so the first real query is not cold
+                new.index.search(np.zeros((1, new.index.d), dtype="float32"), 1)
+
+        with _lock:
+            current = _cache.get(namespace)
+            if current is None or current.version == new.version:
+                return False
+            _cache[namespace] = new
+            _cache_bytes += new.nbytes - current.nbytes
+            _evict_locked(keep=namespace)
+    incr("kb_reloads_total", namespace=namespace)
+    print(f"Reloaded knowledge base {namespace!r}: {old.version} -> {new.version}")
+    return True
+
+
+_watcher: Optional[threading.Thread] = None
+
+
+def _watch(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        with _lock:
+            namespaces = list(_cache)
+        for namespace in namespaces:
+            try:
+                reload(namespace)
+            except Exception as e:
+                incr("errors_total", stage="kb_reload")
+                print(f"⚠ Reload of knowledge base {namespace!r} failed: {e}")
+
+
+def start_watcher(interval: float = KB_RELOAD_INTERVAL) -> None:
+    """
+    Poll loaded knowledge bases for new builds in a daemon thread.
+    """
+    global _watcher
+    if interval <= 0 or (_watcher is not None and _watcher.is_alive()):
+        return
+    _watcher = threading.Thread(target=_watch, args=(interval,), name="apexmind-kb-watch", daemon=True)
+    _watcher.start()
+
+
+def evict(namespace: str) -> None:
+    global _cache_bytes
+    with _lock:
+        kb = _cache.pop(namespace, None)
+        if kb is not None:
+            _cache_bytes -= kb.nbytes
+
+
+def cache_stats() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "loaded": {ns: kb.version for ns, kb in _cache.items()},
+            "bytes": _cache_bytes,
+            "cap_bytes": int(KB_CACHE_MB * 1024 * 1024),
+            "max_loaded": KB_MAX_LOADED,
+        }
+
+
+def resolve_namespace(profile: Optional[Dict[str, Any]] = None, requested: Optional[str] = None) -> str:
+    """
+    Request override first, then the user's assigned program, then default.
+    """
+    if requested:
+        return requested
+    if profile and profile.get("kb_namespace"):
+        return profile["kb_namespace"]
+    return DEFAULT_NAMESPACE
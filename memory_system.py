@@ -2,9 +2,16 @@
 
 from __future__ import annotations
 from pathlib import Path
-from typing import Dict, Any, Optional
-from datetime import datetime
+from typing import Dict, Any, Iterator, Optional, Union
+from datetime import datetime, timezone
+import gzip
 import json
+import time
+
+import cohort_stats
+import conversation_memory
+from persistence import FileLock, UnitOfWork, append_bytes, write_json
+from telemetry import span
 
 BASE_DIR = Path(__file__).resolve().parent
 USER_DIR = BASE_DIR / "user_data"
@@ -19,9 +26,18 @@ def _user_profile_path(user_id: str) -> Path:
 
 
 def _user_log_path(user_id: str) -> Path:
+    # Legacy single-file log, migrated into segments on the next write
     return USER_DIR / f"{user_id}_log.jsonl"
 
 
+def _user_log_dir(user_id: str) -> Path:
+    return USER_DIR / f"{user_id}_log"
+
+
+def _log_index_path(user_id: str) -> Path:
+    return _user_log_dir(user_id) / "index.json"
+
+
 def _now_iso() -> str:
     return datetime.utcnow().isoformat() + "Z"
 
@@ -29,14 +45,24 @@ def _now_iso() -> str:
 # -----------------------------
 # User Profile Management
 # -----------------------------
+def load_user_profile(user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Load an existing user profile without creating one.
+    """
+    path = _user_profile_path(user_id)
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
 def load_or_create_user(user_id: str) -> Dict[str, Any]:
     """
     Load user profile if exists, else create a new one.
     """
-    path = _user_profile_path(user_id)
-    if path.exists():
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+    profile = load_user_profile(user_id)
+    if profile is not None:
+        return profile
 
     # New user skeleton
     profile = {
@@ -59,11 +85,14 @@ def load_or_create_user(user_id: str) -> Dict[str, Any]:
     return profile
 
 
-def save_user_profile(profile: Dict[str, Any]) -> None:
+def save_user_profile(
+    profile: Dict[str, Any],
+    uow: Optional[UnitOfWork] = None,
+) -> None:
     profile["updated_at"] = _now_iso()
     path = _user_profile_path(profile["user_id"])
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(profile, f, ensure_ascii=False, indent=2)
+    with span("write.profile"):
+        write_json(path, profile, uow=uow, indent=2)
 
 
 def add_goal(
@@ -95,14 +124,18 @@ def update_scores(
     user_id: str,
     new_scores: Dict[str, float],
     weight: float = 0.3,
+    uow: Optional[UnitOfWork] = None,
 ) -> Dict[str, Any]:
     """
     Update running average scores for the user.
     new_scores: e.g. {"discipline": 80, "consistency": 60, ...}
     weight: how much to weight the new scores vs old (0–1)
+    uow: stage the profile write on a unit of work instead of writing now
     """
     profile = load_or_create_user(user_id)
     scores = profile.get("scores", {})
+    # Users join the cohort with their first scored session
+    old_scores = dict(scores) if profile.get("sessions", 0) > 0 else None
 
     for key, new_val in new_scores.items():
         if key not in scores:
@@ -113,7 +146,8 @@ def update_scores(
 
     profile["scores"] = scores
     profile["sessions"] = profile.get("sessions", 0) + 1
-    save_user_profile(profile)
+    save_user_profile(profile, uow=uow)
+    cohort_stats.record_scores(old_scores, scores, uow=uow)
     return profile
 
 
@@ -145,26 +179,188 @@ def estimate_progress_level(profile: Dict[str, Any]) -> Dict[str, Any]:
 
 
 # -----------------------------
-# Interaction Logging
+# Interaction Logging (segmented)
 # -----------------------------
+# Each user's log is a directory of JSONL segments. The active segment is
+# plain text; once it exceeds LOG_SEGMENT_MAX_BYTES or LOG_SEGMENT_MAX_AGE
+# it is closed and gzip-compressed. index.json maps every segment to the
+# time range it covers so scans only open the segments they need.
+LOG_SEGMENT_MAX_BYTES = 1_000_000
+LOG_SEGMENT_MAX_AGE = 7 * 24 * 3600  # seconds
+
+
+def _new_segment(index: Dict[str, Any]) -> Dict[str, Any]:
+    seq = index.get("next_seq", 1)
+    index["next_seq"] = seq + 1
+    segment = {
+        "name": f"{seq:06d}.jsonl",
+        "start": None,
+        "end": None,
+        "count": 0,
+        "bytes": 0,
+        "opened_at": time.time(),
+        "closed": False,
+    }
+    index["segments"].append(segment)
+    return segment
+
+
+def _close_segment(log_dir: Path, segment: Dict[str, Any], uow: UnitOfWork) -> None:
+    """
+    Stage the compressed copy of a finished segment and the removal of the
+    plain one; the index marking it closed is written in the same unit.
+    """
+    src = log_dir / segment["name"]
+    dst = log_dir / (segment["name"] + ".gz")
+    if src.exists():
+        with span("write.log_rotate"):
+            uow.put(dst, gzip.compress(src.read_bytes()))
+            uow.delete(src)
+    segment["name"] = dst.name
+    segment["closed"] = True
+
+
+def _legacy_segment(user_id: str, index: Dict[str, Any]) -> None:
+    """
+    Describe an old single-file `<user>_log.jsonl` as the first segment,
+    read in place until the next write migrates it.
+    """
+    legacy = _user_log_path(user_id)
+    if not legacy.exists():
+        return
+
+    segment = _new_segment(index)
+    lines = [x for x in legacy.read_text(encoding="utf-8").splitlines() if x]
+    stamps = [ts for ts in (json.loads(x).get("timestamp") for x in lines) if ts]
+    if stamps:
+        segment["start"] = min(stamps, key=_parse_ts)
+        segment["end"] = max(stamps, key=_parse_ts)
+    segment["count"] = len(lines)
+    segment["bytes"] = legacy.stat().st_size
+    segment["legacy"] = True
+
+
+def _migrate_legacy_log(user_id: str, index: Dict[str, Any], uow: UnitOfWork) -> None:
+    """
+    Fold the legacy log into the first closed segment (staged on `uow`).
+    """
+    for segment in index["segments"]:
+        if segment.pop("legacy", False):
+            legacy = _user_log_path(user_id)
+            segment["name"] += ".gz"
+            segment["closed"] = True
+            uow.put(_user_log_dir(user_id) / segment["name"], gzip.compress(legacy.read_bytes()))
+            uow.delete(legacy)
+
+
+def _load_log_index(user_id: str) -> Dict[str, Any]:
+    """
+    Read-only: a user without an index yet gets one in memory only.
+    """
+    path = _log_index_path(user_id)
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    index: Dict[str, Any] = {"next_seq": 1, "segments": []}
+    _legacy_segment(user_id, index)
+    return index
+
+
+def _log_lock(user_id: str) -> FileLock:
+    # Serializes index read-modify-write (segment seq, rotation) per user
+    return FileLock(USER_DIR / f"{user_id}_log.lock")
+
+
+def _segment_is_full(segment: Dict[str, Any]) -> bool:
+    if segment["bytes"] >= LOG_SEGMENT_MAX_BYTES:
+        return True
+    return time.time() - segment.get("opened_at", 0.0) >= LOG_SEGMENT_MAX_AGE
+
+
+def _segment_path(user_id: str, segment: Dict[str, Any]) -> Path:
+    if segment.get("legacy"):
+        return _user_log_path(user_id)
+    return _user_log_dir(user_id) / segment["name"]
+
+
+def _read_segment(user_id: str, segment: Dict[str, Any]) -> list[str]:
+    path = _segment_path(user_id, segment)
+    if not path.exists():
+        return []
+    if segment["closed"]:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return f.read().splitlines()
+    return path.read_text(encoding="utf-8").splitlines()
+
+
+def _parse_ts(value: Any) -> datetime:
+    """
+    Timestamps as naive UTC datetimes, so "...:05Z" and "...:05.250000Z"
+    order correctly (their ISO strings do not).
+    """
+    if isinstance(value, datetime):
+        ts = value
+    else:
+        ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
 def log_interaction(
     user_id: str,
     user_input: str,
     agent_response: str,
     scores_snapshot: Optional[Dict[str, float]] = None,
+    uow: Optional[UnitOfWork] = None,
 ) -> None:
     """
     Append a log line with what happened in a coaching interaction.
+    Rotates to a fresh segment when the active one is full.
+    With `uow`, the append and index update are staged on it; the user's
+    log stays locked until it has committed.
     """
-    log_path = _user_log_path(user_id)
+    if uow is None:
+        with UnitOfWork(durable=False) as own:
+            return log_interaction(user_id, user_input, agent_response, scores_snapshot, uow=own)
+
+    _log_lock(user_id).hold(uow)
+    log_dir = _user_log_dir(user_id)
+    log_dir.mkdir(exist_ok=True)
+    index = _load_log_index(user_id)
+    _migrate_legacy_log(user_id, index, uow)
+
+    segments = index["segments"]
+    active = segments[-1] if segments and not segments[-1]["closed"] else None
+    if active is not None and _segment_is_full(active):
+        _close_segment(log_dir, active, uow)
+        active = None
+    if active is None:
+        active = _new_segment(index)
+
     record = {
         "timestamp": _now_iso(),
         "user_input": user_input,
         "agent_response": agent_response,
         "scores": scores_snapshot,
     }
-    with open(log_path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+    with span("write.log"):
+        append_bytes(log_dir / active["name"], line, uow=uow)
+
+    if active["start"] is None:
+        active["start"] = record["timestamp"]
+    active["end"] = record["timestamp"]
+    active["count"] += 1
+    active["bytes"] += len(line)
+    with span("write.log_index"):
+        write_json(_log_index_path(user_id), index, uow=uow)
+
+    # Make the interaction retrievable as history for future questions
+    conversation_memory.add_interaction(
+        user_id, user_input, agent_response, record["timestamp"], uow=uow
+    )
 
 
 def load_recent_history(
@@ -173,11 +369,55 @@ def load_recent_history(
 ) -> list[Dict[str, Any]]:
     """
     Load last N interactions for reflection or meta-coaching.
+    Walks segments newest-first and stops once `limit` lines are collected.
     """
-    log_path = _user_log_path(user_id)
-    if not log_path.exists():
+    if limit <= 0:
         return []
 
-    lines = log_path.read_text(encoding="utf-8").splitlines()
-    recent = lines[-limit:]
-    return [json.loads(x) for x in recent]
+    index = _load_log_index(user_id)
+
+    lines: list[str] = []
+    for segment in reversed(index["segments"]):
+        if not segment["count"]:
+            continue
+        lines = _read_segment(user_id, segment)[-(limit - len(lines)):] + lines
+        if len(lines) >= limit:
+            break
+
+    return [json.loads(x) for x in lines if x]
+
+
+def iter_history(
+    user_id: str,
+    start: Optional[Union[str, datetime]] = None,
+    end: Optional[Union[str, datetime]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield logged interactions with start <= timestamp <= end (ISO strings
+    or datetimes), oldest first. Segments outside the range are never
+    opened; records without a timestamp only appear in unbounded scans.
+    """
+    index = _load_log_index(user_id)
+    lo = _parse_ts(start) if start is not None else None
+    hi = _parse_ts(end) if end is not None else None
+
+    for segment in index["segments"]:
+        if not segment["count"]:
+            continue
+        if lo is not None and segment["end"] is not None and _parse_ts(segment["end"]) < lo:
+            continue
+        if hi is not None and segment["start"] is not None and _parse_ts(segment["start"]) > hi:
+            continue
+        for line in _read_segment(user_id, segment):
+            if not line:
+                continue
+            record = json.loads(line)
+            if lo is not None or hi is not None:
+                if not record.get("timestamp"):
+                    continue
+                ts = _parse_ts(record["timestamp"])
+                if lo is not None and ts < lo:
+                    continue
+                if hi is not None and ts > hi:
+                    continue
+            yield record
@@ -0,0 +1,730 @@
+# persistence.py
+
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import atexit
+import base64
+import json
+import os
+import queue
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: thread-level locking only
+    fcntl = None
+
+from telemetry import span
+
+BASE_DIR = Path(__file__).resolve().parent
+USER_DIR = BASE_DIR / "user_data"
+USER_DIR.mkdir(exist_ok=True)
+
+# One journal per process (see _GroupCommitter) plus the shared apply lock
+JOURNAL_DIR = USER_DIR / "_journal"
+APPLY_LOCK_NAME = "apply.lock"
+# Checkpoint (fsync data files + truncate journal) once the journal grows
+# past this size or this many seconds after the first uncheckpointed write.
+# Between checkpoints a commit costs one journal fsync and nothing else.
+JOURNAL_MAX_BYTES = 4_000_000
+JOURNAL_CHECKPOINT_INTERVAL = 30.0
+
+
+class PersistError(RuntimeError):
+    """
+    A journaled unit could not be applied to its data files. The journal
+    keeps it and the unit is re-applied at the next checkpoint or startup.
+    """
+
+
+# -----------------------------
+# Write operations
+# -----------------------------
+@dataclass
+class _Op:
+    kind: str            # "put" (replace whole file), "append" or "delete"
+    path: Path
+    data: bytes = b""
+    offset: Optional[int] = None   # assigned at commit time for appends
+    # Appends of fixed-size records: a torn partial record at the end of
+    # the file is overwritten instead of shifting every later record
+    align: int = 1
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "path": str(self.path),
+            "offset": self.offset,
+            "data": base64.b64encode(self.data).decode("ascii"),
+        }
+
+    @classmethod
+    def from_json(cls, obj: Dict[str, Any]) -> "_Op":
+        return cls(
+            kind=obj["kind"],
+            path=Path(obj["path"]),
+            data=base64.b64decode(obj["data"]),
+            offset=obj.get("offset"),
+        )
+
+
+def _put_file(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _append_at(path: Path, offset: int, data: bytes) -> None:
+    # Writing at a fixed offset makes journal replay idempotent
+    with open(path, "r+b" if path.exists() else "wb") as f:
+        f.seek(offset)
+        f.truncate()
+        f.write(data)
+
+
+def _apply(op: _Op) -> None:
+    if op.kind == "put":
+        _put_file(op.path, op.data)
+    elif op.kind == "delete":
+        op.path.unlink(missing_ok=True)
+    else:
+        _append_at(op.path, op.offset, op.data)
+
+
+def _json_bytes(data: Any, indent: Optional[int]) -> bytes:
+    return json.dumps(data, ensure_ascii=False, indent=indent).encode("utf-8")
+
+
+# -----------------------------
+# Unit of work
+# -----------------------------
+class UnitOfWork:
+    """
+    Collects every file mutation of one request and commits them together.
+
+    Used as a context manager: writes are applied only if the block exits
+    cleanly, so a failed request leaves no partial state behind. Commits
+    from concurrent requests are grouped into a single journal fsync.
+    durable=False units are ordered and journaled like any other but do
+    not wait for an fsync (plain writes outside a request).
+    """
+
+    def __init__(self, durable: bool = True):
+        self.ops: List[_Op] = []
+        self.durable = durable
+        self._after_commit: List[Callable[[], None]] = []
+        self._on_close: List[Callable[[], None]] = []
+        self.committed = False
+
+    def put(self, path: Path, data: bytes) -> None:
+        self.ops.append(_Op("put", Path(path), data))
+
+    def append(self, path: Path, data: bytes, align: int = 1) -> None:
+        self.ops.append(_Op("append", Path(path), data, align=align))
+
+    def delete(self, path: Path) -> None:
+        self.ops.append(_Op("delete", Path(path)))
+
+    def after_commit(self, fn: Callable[[], None]) -> None:
+        """
+        Run fn once this unit's writes are on disk (e.g. cache updates).
+        """
+        self._after_commit.append(fn)
+
+    def on_close(self, fn: Callable[[], None]) -> None:
+        """
+        Run fn when the unit ends, committed or not (e.g. releasing a lock
+        held while its writes were staged).
+        """
+        self._on_close.append(fn)
+
+    def commit(self) -> None:
+        if self.committed:
+            return
+        if self.ops:
+            with span("persist.commit", ops=len(self.ops)):
+                _get_committer().submit(self.ops, self.durable)
+        self.committed = True
+        for fn in self._after_commit:
+            fn()
+
+    def close(self) -> None:
+        fns, self._on_close = self._on_close, []
+        for fn in reversed(fns):
+            fn()
+
+    def __enter__(self) -> "UnitOfWork":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self.commit()
+        finally:
+            self.close()
+
+
+def write_json(
+    path: Path,
+    data: Any,
+    uow: Optional[UnitOfWork] = None,
+    indent: Optional[int] = None,
+) -> None:
+    """
+    Replace a JSON file atomically, or stage the write on `uow`.
+    """
+    put_bytes(path, _json_bytes(data, indent), uow=uow)
+
+
+def put_bytes(
+    path: Path,
+    data: bytes,
+    uow: Optional[UnitOfWork] = None,
+) -> None:
+    """
+    Replace a file atomically, or stage the write on `uow`.
+    """
+    if uow is not None:
+        uow.put(path, data)
+    else:
+        _write_now([_Op("put", Path(path), data)])
+
+
+def append_bytes(
+    path: Path,
+    data: bytes,
+    uow: Optional[UnitOfWork] = None,
+    align: int = 1,
+) -> None:
+    """
+    Append to a file, or stage the append on `uow`. With align, the append
+    starts at the last whole multiple of align bytes (fixed-size records).
+    """
+    if uow is not None:
+        uow.append(path, data, align=align)
+    else:
+        _write_now([_Op("append", Path(path), data, align=align)])
+
+
+def delete_file(path: Path, uow: Optional[UnitOfWork] = None) -> None:
+    """
+    Remove a file (if present), or stage the removal on `uow`.
+    """
+    if uow is not None:
+        uow.delete(path)
+    else:
+        _write_now([_Op("delete", Path(path))])
+
+
+def _write_now(ops: List[_Op]) -> None:
+    # Plain writes still go through the committer so they are ordered with
+    # journaled units (no replay can overwrite them) and append offsets are
+    # exact; they just do not wait for an fsync.
+    _get_committer().submit(ops, durable=False)
+
+
+# -----------------------------
+# Locking
+# -----------------------------
+class _LockState:
+    def __init__(self):
+        self.rlock = threading.RLock()
+        self.fd: Optional[int] = None
+        self.depth = 0
+
+
+_lock_states: Dict[Path, _LockState] = {}
+_lock_states_guard = threading.Lock()
+
+
+class FileLock:
+    """
+    Exclusive lock on a side file for read-modify-write sequences, across
+    threads (re-entrant) and processes (flock). hold(uow) keeps it until
+    the unit of work has committed or failed.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with _lock_states_guard:
+            self._state = _lock_states.setdefault(self.path, _LockState())
+
+    def acquire(self) -> None:
+        state = self._state
+        state.rlock.acquire()
+        if state.depth == 0:
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                state.rlock.release()
+                raise
+            state.fd = fd
+        state.depth += 1
+
+    def release(self) -> None:
+        state = self._state
+        state.depth -= 1
+        if state.depth == 0:
+            fd, state.fd = state.fd, None
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        state.rlock.release()
+
+    def hold(self, uow: UnitOfWork) -> None:
+        self.acquire()
+        uow.on_close(self.release)
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+
+# -----------------------------
+# Group commit
+# -----------------------------
+# Every process (app, API server, load test, ...) journals into its own
+# file under JOURNAL_DIR, flocked for the life of the process, so other
+# processes can tell a live journal from one orphaned by a crash. Offsets,
+# journaling and applying happen under one cross-process apply lock, which
+# also hands out a global unit seq (replay order across journals).
+def _boot_id() -> str:
+    try:
+        return Path("/proc/sys/kernel/random/boot_id").read_text().strip()
+    except OSError:
+        return ""
+
+
+_BOOT_ID = _boot_id()
+
+
+class _Pending:
+    def __init__(self, ops: List[_Op], durable: bool):
+        self.ops = ops
+        self.durable = durable
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class _ApplyLock:
+    """
+    flock on JOURNAL_DIR/apply.lock. The file holds the shared state:
+      seq      last unit seq handed out
+      active   journal of the committer inside the lock; finding another
+               one there means that process died mid-commit
+      journals journal name -> oldest seq it holds since its checkpoint
+      synced   path -> seq up to which a checkpoint fsynced it; replay
+               skips older units, which would revert the durable data
+    """
+
+    def __init__(self, journal_dir: Path):
+        journal_dir.mkdir(parents=True, exist_ok=True)
+        self.fd = os.open(journal_dir / APPLY_LOCK_NAME, os.O_RDWR | os.O_CREAT, 0o644)
+        self._thread_lock = threading.Lock()
+
+    def __enter__(self) -> Dict[str, Any]:
+        self._thread_lock.acquire()
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            state = json.loads(os.pread(self.fd, os.fstat(self.fd).st_size, 0) or b"{}")
+        except ValueError:
+            state = {}
+        state.setdefault("seq", 0)
+        state.setdefault("active", None)
+        state.setdefault("journals", {})
+        state.setdefault("synced", {})
+        return state
+
+    def save(self, state: Dict[str, Any]) -> None:
+        data = json.dumps(state).encode("utf-8")
+        os.pwrite(self.fd, data, 0)
+        os.ftruncate(self.fd, len(data))
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class _Journal:
+    """
+    This process's journal: a header line ({"boot", "pid"}), one line per
+    unit ({"seq", "ops"}) and, once units are applied, {"applied": [seq]}.
+    """
+
+    def __init__(self, journal_dir: Path):
+        self.path = journal_dir / f"{os.getpid()}-{time.time_ns()}.log"
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.size = 0
+        self._header()
+
+    def _header(self) -> None:
+        self.write(json.dumps({"boot": _BOOT_ID, "pid": os.getpid()}) + "\n")
+
+    def write(self, data: Union[str, bytes], fsync: bool = False) -> None:
+        buf = data.encode("utf-8") if isinstance(data, str) else data
+        view = memoryview(buf)
+        while view:
+            view = view[os.write(self.fd, view):]
+        self.size += len(buf)
+        if fsync:
+            os.fsync(self.fd)
+
+    def truncate(self) -> None:
+        os.ftruncate(self.fd, 0)
+        self.size = 0
+        self._header()
+        os.fsync(self.fd)
+
+    def close(self, remove: bool) -> None:
+        if remove:
+            self.path.unlink(missing_ok=True)
+        os.close(self.fd)
+
+
+Unit = Tuple[int, List[_Op]]
+
+
+def _read_journal(path: Path) -> Tuple[str, List[Unit], set]:
+    """
+    (boot id, units, applied seqs). A torn final line belongs to a unit
+    that was never acknowledged and ends the read.
+    """
+    boot, units, applied = "", [], set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+                if "boot" in rec:
+                    boot = rec["boot"]
+                elif "applied" in rec:
+                    applied.update(rec["applied"])
+                else:
+                    units.append((rec["seq"], [_Op.from_json(o) for o in rec["ops"]]))
+            except Exception:
+                break
+    return boot, units, applied
+
+
+def _replay(units: List[Unit], synced: Dict[str, int]) -> Dict[Path, int]:
+    touched: Dict[Path, int] = {}
+    for seq, ops in sorted(units, key=lambda u: u[0]):
+        for op in ops:
+            if seq <= synced.get(str(op.path), 0):
+                # A later unit to this file is already durable
+                continue
+            if not op.path.parent.exists():
+                # The whole directory was removed since (e.g. user cleanup)
+                continue
+            if op.kind == "append":
+                # Only finish appends whose target still ends at/inside them;
+                # rotated, already-complete or since-appended files are left alone
+                if not op.path.exists():
+                    continue
+                size = op.path.stat().st_size
+                if not (op.offset <= size < op.offset + len(op.data)):
+                    continue
+            _apply(op)
+            touched[op.path] = seq
+    return touched
+
+
+def _recover_orphans(journal_dir: Path, state: Dict[str, Any], own: Optional[Path] = None) -> int:
+    """
+    Finish and remove the journals of dead processes; call under the apply
+    lock. After a process crash only its unapplied units are replayed (the
+    rest are in the page cache, and newer writes from live processes must
+    not be reverted). After a reboot every unit since its last checkpoint
+    is replayed, across all journals in seq order.
+    """
+    if fcntl is None:
+        # No way to tell a live journal from an orphan
+        return 0
+
+    orphans, units, written = [], [], set()
+    try:
+        for path in sorted(journal_dir.glob("*.log")):
+            if path == own:
+                continue
+            fd = os.open(path, os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)   # live process
+                continue
+            orphans.append((path, fd))
+
+            boot, file_units, applied = _read_journal(path)
+            if boot != _BOOT_ID:
+                units.extend(file_units)
+            else:
+                units.extend(u for u in file_units if u[0] not in applied)
+            written.update(op.path for _, ops in file_units for op in ops)
+            state["seq"] = max([state["seq"]] + [seq for seq, _ in file_units])
+
+        _replay(units, state["synced"])
+        _fsync_paths(p for p in written if p.exists())
+        for path, _ in orphans:
+            path.unlink()
+            state["journals"].pop(path.name, None)
+    finally:
+        for _, fd in orphans:
+            os.close(fd)
+    return len(units)
+
+
+class _GroupCommitter:
+    """
+    Single writer thread; every write in the process goes through it.
+    Whatever units are queued while the previous batch commits are
+    committed together: one journal append + one fsync per batch (none if
+    no unit in it is durable), then the data files are written without
+    their own fsyncs. The journal is checkpointed (data files fsynced,
+    journal truncated) when it grows past max_bytes or `interval` seconds
+    after the first write since the last checkpoint.
+    """
+
+    def __init__(
+        self,
+        journal_dir: Path,
+        max_bytes: int = JOURNAL_MAX_BYTES,
+        interval: float = JOURNAL_CHECKPOINT_INTERVAL,
+    ):
+        self.journal_dir = journal_dir
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self._lock = _ApplyLock(journal_dir)
+        self._journal = _Journal(journal_dir)
+        self._queue: "queue.Queue[Optional[_Pending]]" = queue.Queue()
+        # path -> seq of the last unit of ours applied to it
+        self._dirty: Dict[Path, int] = {}
+        self._first_write: Optional[float] = None
+        # Journaled units that failed to apply; the journal must not be
+        # truncated until they have been re-applied
+        self._failed: List[Unit] = []
+
+        self._thread = threading.Thread(
+            target=self._run, name="apexmind-group-commit", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def journal_path(self) -> Path:
+        return self._journal.path
+
+    def submit(self, ops: List[_Op], durable: bool = True) -> None:
+        pending = _Pending(ops, durable)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+
+    def close(self) -> None:
+        """
+        Checkpoint, stop the thread and drop the journal if nothing in it
+        is still owed to a data file.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self._lock.close()
+        self._journal.close(remove=not self._failed)
+
+    def _timeout(self) -> Optional[float]:
+        if self._first_write is None:
+            return None
+        return max(0.0, self._first_write + self.interval - time.monotonic())
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=self._timeout())
+            except queue.Empty:
+                self._checkpoint()
+                continue
+            batch, stop = [], first is None
+            if first is not None:
+                batch.append(first)
+            while not stop:
+                try:
+                    pending = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if pending is None:
+                    stop = True
+                else:
+                    batch.append(pending)
+
+            if batch:
+                self._commit(batch)
+
+            timeout = self._timeout()
+            if stop or self._failed or self._journal.size >= self.max_bytes or timeout == 0.0:
+                self._checkpoint()
+            if stop:
+                return
+
+    def _commit(self, batch: List[_Pending]) -> None:
+        try:
+            with self._lock as state:
+                if state["active"] not in (None, self._journal.path.name):
+                    # Its committer died inside the lock: finish that first
+                    _recover_orphans(self.journal_dir, state, own=self._journal.path)
+                units = [(state["seq"] + i + 1, p) for i, p in enumerate(batch)]
+                state["seq"] += len(batch)
+                state["active"] = self._journal.path.name
+                state["journals"].setdefault(self._journal.path.name, units[0][0])
+                self._lock.save(state)
+
+                self._journal_and_apply(units)
+
+                state["active"] = None
+                self._lock.save(state)
+        except Exception as e:
+            for pending in batch:
+                if not pending.done.is_set() and pending.error is None:
+                    pending.error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+    def _journal_and_apply(self, units: List[Tuple[int, _Pending]]) -> None:
+        # Assign append offsets in commit order. Every process appends
+        # under the apply lock, so the sizes are exact.
+        sizes: Dict[Path, int] = {}
+        lines = []
+        for seq, pending in units:
+            for op in pending.ops:
+                if op.kind == "append":
+                    if op.path not in sizes:
+                        sizes[op.path] = op.path.stat().st_size if op.path.exists() else 0
+                    op.offset = sizes[op.path] - sizes[op.path] % op.align
+                    sizes[op.path] = op.offset + len(op.data)
+                elif op.kind == "put":
+                    sizes[op.path] = len(op.data)
+                else:
+                    sizes[op.path] = 0
+            lines.append(json.dumps({"seq": seq, "ops": [op.to_json() for op in pending.ops]}))
+
+        durable = any(p.durable for _, p in units)
+        with span("persist.journal_fsync", units=len(units), durable=durable):
+            self._journal.write("\n".join(lines) + "\n", fsync=durable)
+        if self._first_write is None:
+            self._first_write = time.monotonic()
+
+        applied = []
+        for seq, pending in units:
+            try:
+                with span("persist.apply"):
+                    for op in pending.ops:
+                        self._dirty[op.path] = seq
+                        _apply(op)
+                applied.append(seq)
+            except Exception as e:
+                # Journaled but not (fully) applied: the caller gets the
+                # error, and the journal is kept until it is re-applied
+                self._failed.append((seq, pending.ops))
+                pending.error = PersistError(f"{type(e).__name__}: {e}")
+        if applied:
+            self._journal.write(json.dumps({"applied": applied}) + "\n")
+
+    def _checkpoint(self) -> None:
+        try:
+            with span("persist.checkpoint", files=len(self._dirty)):
+                if self._failed:
+                    # Re-apply before the journal goes away; if that fails
+                    # too, the journal stays for the next try
+                    with self._lock as state:
+                        self._dirty.update(_replay(self._failed, state["synced"]))
+                    self._journal.write(json.dumps({"applied": [seq for seq, _ in self._failed]}) + "\n")
+                    self._failed = []
+                _fsync_paths(p for p in self._dirty if p.exists())
+                with self._lock as state:
+                    self._journal.truncate()
+                    # Everything up to our last unit per file is durable now;
+                    # drop marks older than any journaled unit
+                    synced = state["synced"]
+                    for path, seq in self._dirty.items():
+                        synced[str(path)] = max(seq, synced.get(str(path), 0))
+                    state["journals"].pop(self._journal.path.name, None)
+                    oldest = min(state["journals"].values(), default=None)
+                    state["synced"] = {p: seq for p, seq in synced.items()
+                                       if oldest is not None and seq >= oldest}
+                    self._lock.save(state)
+            self._dirty.clear()
+            self._first_write = None
+        except Exception:
+            # Keep the journal; retry after another interval
+            self._first_write = time.monotonic()
+
+
+def _fsync_paths(paths) -> None:
+    for path in paths:
+        if not path.exists():
+            continue
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def recover(journal_dir: Path = JOURNAL_DIR) -> int:
+    """
+    Finish units left in the journals of crashed processes and remove
+    those journals; live processes' journals are never touched. Returns
+    how many units were replayed. Raises, keeping the journals, if a unit
+    still cannot be applied.
+    """
+    lock = _ApplyLock(journal_dir)
+    try:
+        with lock as state:
+            replayed = _recover_orphans(journal_dir, state)
+            state["active"] = None
+            lock.save(state)
+    finally:
+        lock.close()
+    return replayed
+
+
+_committer: Optional[_GroupCommitter] = None
+_committer_lock = threading.Lock()
+
+
+def _get_committer() -> _GroupCommitter:
+    global _committer
+    with _committer_lock:
+        if _committer is None:
+            _committer = _GroupCommitter(JOURNAL_DIR)
+        return _committer
+
+
+def _shutdown() -> None:
+    # Registered at import, so it runs after the atexit hooks of modules
+    # importing this one (e.g. cohort_stats.flush) have written
+    global _committer
+    with _committer_lock:
+        committer, _committer = _committer, None
+    if committer is not None:
+        committer.close()
+
+
+atexit.register(_shutdown)
+
+# Finish any unit a crashed process left behind before anything reads
+# user_data: state loaded first would otherwise be written back over it
+recover(JOURNAL_DIR)
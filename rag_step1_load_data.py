@@ -1,7 +1,13 @@
 # rag_step1_load_data.py
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+import logging
+import mmap
+import os
+
+logger = logging.getLogger("apexmind.ingest")
 
 
 # ======================================
@@ -11,10 +17,9 @@ from typing import List, Dict
 BASE_DIR = Path(__file__).resolve().parent
 KB_DIR = BASE_DIR / "Knowledge_base"
 
-print("\n=== PATH DEBUG ===")
-print("BASE_DIR =", BASE_DIR)
-print("KB_DIR =", KB_DIR)
-print("Exists?", KB_DIR.exists())
+# Files at least this large are read through mmap instead of f.read()
+MMAP_MIN_BYTES = 1 << 20
+LOAD_WORKERS = int(os.getenv("APEXMIND_LOAD_WORKERS", str(min(16, (os.cpu_count() or 1) * 2))))
 
 
 # ======================================
@@ -67,35 +72,59 @@ def chunk_text(
 #      LOAD KNOWLEDGE BASE FILES
 # ======================================
 
-def load_knowledge_base() -> List[Dict]:
-    chunks: List[Dict] = []
-
-    print("\n=== FILES DETECTED IN KNOWLEDGE BASE ===")
-    files = list(KB_DIR.glob("*.txt"))
-
+def read_text(path: Path) -> str:
+    """
+    UTF-8 text of a file; large files are mapped rather than copied
+    through a read buffer.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MMAP_MIN_BYTES:
+            return f.read().decode("utf-8")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            # Decoded straight from the mapping (buffer protocol), no
+            # intermediate bytes copy
+            return str(m, "utf-8")
+
+
+def _load_file(path: Path, max_chars: int, overlap: int) -> Tuple[List[Dict], int, Optional[str]]:
+    try:
+        text = read_text(path)
+    except Exception as e:
+        return [], 0, f"{type(e).__name__}: {e}"
+    return chunk_text(text, path.name, max_chars=max_chars, overlap=overlap), len(text), None
+
+
+def load_knowledge_base(
+    max_chars: int = 800,
+    overlap: int = 150,
+    kb_dir: Path = KB_DIR,
+    verbose: bool = True,
+    workers: int = LOAD_WORKERS,
+) -> List[Dict]:
+    """
+    Read and chunk every *.txt in kb_dir on a worker pool. Chunks come back
+    in sorted file order regardless of which file finishes first.
+    verbose logs one line per file at INFO (otherwise DEBUG).
+    """
+    files = sorted(Path(kb_dir).glob("*.txt"))
     if not files:
-        print("⚠ No .txt files found!")
-        return chunks
-
-    for txt in files:
-        print(f"\nLoading: {txt.name}")
-        print("Full path:", txt.resolve())
-
-        try:
-            with open(txt, "r", encoding="utf-8") as f:
-                text = f.read()
-        except Exception as e:
-            print("ERROR reading file:", e)
-            continue
-
-        print("File size:", len(text), "characters")
-
-        # Chunk file text
-        text_chunks = chunk_text(text, txt.name)
-        print("->", len(text_chunks), "chunks created")
-
-        chunks.extend(text_chunks)
+        logger.warning("No .txt files found in %s", kb_dir)
+        return []
 
+    level = logging.INFO if verbose else logging.DEBUG
+    chunks: List[Dict] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(files))),
+                            thread_name_prefix="apexmind-ingest") as pool:
+        results = pool.map(lambda p: _load_file(p, max_chars, overlap), files)
+        for path, (file_chunks, size, error) in zip(files, results):
+            if error:
+                logger.error("Could not read %s: %s", path, error)
+                continue
+            logger.log(level, "%s: %d characters -> %d chunks", path.name, size, len(file_chunks))
+            chunks.extend(file_chunks)
+
+    logger.log(level, "Loaded %d chunks from %d files", len(chunks), len(files))
     return chunks
 
 
@@ -104,6 +133,12 @@ def load_knowledge_base() -> List[Dict]:
 # ======================================
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    print("\n=== PATH DEBUG ===")
+    print("BASE_DIR =", BASE_DIR)
+    print("KB_DIR =", KB_DIR)
+    print("Exists?", KB_DIR.exists())
+
     chunks = load_knowledge_base()
 
     print("\n=== SAMPLE CHUNKS (3) ===")
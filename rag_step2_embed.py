@@ -2,29 +2,14 @@
 
 import json
 from pathlib import Path
-from dotenv import load_dotenv
+from typing import Dict, List
 import os
 
+import numpy as np
+
 # Load chunk loader from Step 1
 from rag_step1_load_data import load_knowledge_base
 
-# FREE & LOCAL embedding model
-from sentence_transformers import SentenceTransformer
-
-
-# ======================================
-#           LOAD ENVIRONMENT
-# ======================================
-
-import streamlit as st
-
-API_KEY = st.secrets["GEMINI_API_KEY"]
-
-
-if not API_KEY:
-    print("⚠ INFO: GEMINI_API_KEY missing — embeddings do NOT use Gemini.")
-    print("         This is normal. SentenceTransformer runs offline.\n")
-
 
 # ======================================
 #              PATHS
@@ -34,51 +19,95 @@ BASE_DIR = Path(__file__).resolve().parent
 KB_DIR = BASE_DIR / "Knowledge_base"
 EMBED_FILE = KB_DIR / "embeddings.jsonl"
 
-
-# ======================================
-#        LOAD CHUNKS FROM STEP 1
-# ======================================
-
-print("\n=== Loading Knowledge Base Chunks ===")
-chunks = load_knowledge_base()
-print(f"Total chunks loaded: {len(chunks)}")
+EMBED_MODEL = "all-MiniLM-L6-v2"   # 384d embeddings
+EMBED_BATCH = 64
 
 
 # ======================================
 #          EMBEDDING MODEL
 # ======================================
 
-print("\n=== Loading Embedding Model (SentenceTransformer) ===")
-model = SentenceTransformer("all-MiniLM-L6-v2")   # 384d embeddings
-print("Embedding model loaded!\n")
-
-
-def embed_text(text: str):
-    """Create a vector embedding from text."""
-    return model.encode(text).tolist()
+def load_model(name: str = EMBED_MODEL):
+    # FREE & LOCAL embedding model
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name)
 
 
 # ======================================
 #      GENERATE + SAVE EMBEDDINGS
 # ======================================
 
-print("=== Generating Embeddings ===")
-
-with open(EMBED_FILE, "w", encoding="utf-8") as f:
-    for i, chunk in enumerate(chunks, start=1):
-        vector = embed_text(chunk["content"])
-
-        item = {
-            "id": i,
-            "source": chunk["source"],
-            "content": chunk["content"],
-            "embedding": vector,
-        }
-
-        f.write(json.dumps(item) + "\n")
-
-        print(f"Embedded chunk {i}/{len(chunks)}")
-
-
-print(f"\n🎉 DONE! Embeddings saved to:")
-print(EMBED_FILE)
+def write_embeddings(
+    chunks: List[Dict],
+    vectors: np.ndarray,
+    embed_file: Path = EMBED_FILE,
+    start_id: int = 1,
+    mode: str = "w",
+) -> None:
+    """Write chunk + vector pairs in the embeddings.jsonl format."""
+    with open(embed_file, mode, encoding="utf-8") as f:
+        for i, (chunk, vector) in enumerate(zip(chunks, vectors), start=start_id):
+            item = {
+                "id": i,
+                "source": chunk["source"],
+                "content": chunk["content"],
+                "embedding": [float(x) for x in vector],
+            }
+            f.write(json.dumps(item) + "\n")
+
+
+def embed_chunks(
+    chunks: List[Dict],
+    model=None,
+    embed_file: Path = EMBED_FILE,
+    batch_size: int = EMBED_BATCH,
+    verbose: bool = True,
+) -> int:
+    """Embed chunks in batches and save them to embed_file."""
+    model = model or load_model()
+
+    with open(embed_file, "w", encoding="utf-8"):
+        pass
+
+    for start in range(0, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        vectors = model.encode([c["content"] for c in batch], show_progress_bar=False)
+        write_embeddings(batch, vectors, embed_file, start_id=start + 1, mode="a")
+
+        if verbose:
+            print(f"Embedded chunk {start + len(batch)}/{len(chunks)}")
+
+    return len(chunks)
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+    from dotenv import load_dotenv
+    from kb_registry import DEFAULT_NAMESPACE, namespace_dir
+
+    parser = argparse.ArgumentParser(description="Embed knowledge base chunks")
+    parser.add_argument("--namespace", default=DEFAULT_NAMESPACE, help="knowledge base to embed")
+    args = parser.parse_args()
+    kb_dir = namespace_dir(args.namespace)
+    embed_file = kb_dir / EMBED_FILE.name
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    load_dotenv()
+    if not os.getenv("GEMINI_API_KEY"):
+        print("⚠ INFO: GEMINI_API_KEY missing — embeddings do NOT use Gemini.")
+        print("         This is normal. SentenceTransformer runs offline.\n")
+
+    print("\n=== Loading Knowledge Base Chunks ===")
+    chunks = load_knowledge_base(kb_dir=kb_dir)
+    print(f"Total chunks loaded: {len(chunks)}")
+
+    print("\n=== Loading Embedding Model (SentenceTransformer) ===")
+    model = load_model()
+    print("Embedding model loaded!\n")
+
+    print("=== Generating Embeddings ===")
+    embed_chunks(chunks, model, embed_file=embed_file)
+
+    print(f"\n🎉 DONE! Embeddings saved to:")
+    print(embed_file)
@@ -1,7 +1,13 @@
 # rag_step3_build_index.py
 
 import json
+import os
+import re
+import time
+import uuid
+import zlib
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 import faiss
@@ -16,81 +22,265 @@ KB_DIR = BASE_DIR / "Knowledge_base"
 EMBED_FILE = KB_DIR / "embeddings.jsonl"
 INDEX_FILE = KB_DIR / "faiss_index.bin"
 META_FILE = KB_DIR / "faiss_meta.jsonl"
+MANIFEST_NAME = "faiss_manifest.json"
 
-print("\n=== PATH DEBUG ===")
-print("BASE_DIR:", BASE_DIR)
-print("KB_DIR:", KB_DIR)
-print("EMBED_FILE exists?", EMBED_FILE.exists())
+# Optional dimensionality reduction. The projection is stored inside the
+# index (IndexPreTransform), so queries are projected by index.search itself.
+REDUCE_METHODS = {
+    "pca": "PCA{dim}",      # principal components (needs >= dim chunks)
+    "pcar": "PCAR{dim}",    # PCA followed by a random rotation
+    "random": "RR{dim}",    # random orthogonal projection, no training data needed
+}
+INDEX_DIM = int(os.getenv("APEXMIND_INDEX_DIM", "0")) or None
+INDEX_REDUCTION = os.getenv("APEXMIND_INDEX_REDUCTION", "pca")
+
+# A chunk whose word shingles are at least this contained in a larger chunk
+# is folded into it (0 disables). Chunk overlap makes the short tail chunk
+# of most files a full subset of the one before it.
+DEDUP_THRESHOLD = float(os.getenv("APEXMIND_DEDUP_THRESHOLD", "0.9"))
+SHINGLE_WORDS = 5
+# Shingles shared by more chunks than this are boilerplate; skipping them
+# keeps the overlap count near-linear
+SHINGLE_MAX_POSTINGS = 256
 
 
 # ======================================
 #      LOAD EMBEDDINGS + METADATA
 # ======================================
 
-embeddings = []
-metas = []
-
-print("\n=== Loading embeddings from JSONL ===")
+def load_embeddings(embed_file: Path = EMBED_FILE) -> Tuple[np.ndarray, List[Dict]]:
+    embeddings = []
+    metas = []
 
-with open(EMBED_FILE, "r", encoding="utf-8") as f:
-    for line in f:
-        line = line.strip()
-        if not line:
-            continue
+    with open(embed_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
 
-        obj = json.loads(line)
+            obj = json.loads(line)
 
-        emb = obj["embedding"]
-        embeddings.append(emb)
+            embeddings.append(obj["embedding"])
+            metas.append({
+                "id": obj["id"],
+                "source": obj["source"],
+                "content": obj["content"],
+            })
 
-        metas.append({
-            "id": obj["id"],
-            "source": obj["source"],
-            "content": obj["content"],
-        })
+    if not embeddings:
+        raise ValueError("❌ No embeddings found. Did you run rag_step2_embed.py?")
 
-print(f"Total vectors loaded: {len(embeddings)}")
+    emb_array = np.array(embeddings, dtype="float32")
 
-if not embeddings:
-    raise ValueError("❌ No embeddings found. Did you run rag_step2_embed.py?")
+    # Normalize for cosine similarity
+    norms = np.linalg.norm(emb_array, axis=1, keepdims=True) + 1e-12
+    return emb_array / norms, metas
 
 
 # ======================================
-#      CONVERT TO NUMPY ARRAY
+#      DEDUPLICATE NEAR-DUPLICATE CHUNKS
 # ======================================
 
-emb_array = np.array(embeddings, dtype="float32")
-print("Embedding matrix shape:", emb_array.shape)  # (N, D)
+def shingles(text: str, n: int = SHINGLE_WORDS) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {
+        zlib.crc32(" ".join(words[i:i + n]).encode("utf-8"))
+        for i in range(max(1, len(words) - n + 1))
+    }
+
+
+def dedup_chunks(
+    emb_array: np.ndarray,
+    metas: List[Dict],
+    threshold: float = DEDUP_THRESHOLD,
+) -> Tuple[np.ndarray, List[Dict], Dict[str, Any]]:
+    """
+    Fold each chunk whose shingles are >= threshold contained in a larger
+    kept chunk into that chunk. Larger chunks are visited first, so every
+    representative is the chunk holding the most text. Representatives
+    record what they absorbed in "duplicates". Every kept chunk gets
+    "sources" (its own source plus any folded in), so filters on it see
+    the whole index. Kept chunks stay in their original order.
+    """
+    n = len(metas)
+    stats = {"threshold": threshold, "chunks_before": n, "chunks_after": n, "removed": 0}
+    if not threshold or n < 2:
+        return emb_array, [dict(m, sources=[m["source"]]) for m in metas], stats
+
+    sets = [shingles(m["content"]) for m in metas]
+    postings: Dict[int, List[int]] = {}
+    rep_of = list(range(n))
+
+    for i in sorted(range(n), key=lambda i: (-len(sets[i]), i)):
+        overlap: Dict[int, int] = {}
+        for h in sets[i]:
+            for j in postings.get(h, ()):
+                overlap[j] = overlap.get(j, 0) + 1
+        if overlap:
+            j, shared = max(overlap.items(), key=lambda x: (x[1], -x[0]))
+            if shared >= threshold * len(sets[i]):
+                rep_of[i] = j
+                continue
+        for h in sets[i]:
+            posting = postings.setdefault(h, [])
+            if len(posting) < SHINGLE_MAX_POSTINGS:
+                posting.append(i)
 
-# Normalize for cosine similarity
-norms = np.linalg.norm(emb_array, axis=1, keepdims=True) + 1e-12
-emb_array = emb_array / norms
+    kept = [i for i in range(n) if rep_of[i] == i]
+    out = {i: dict(metas[i], sources=[metas[i]["source"]]) for i in kept}
+    for i in range(n):
+        j = rep_of[i]
+        if j != i:
+            rep = out[j]
+            rep.setdefault("duplicates", []).append({"id": metas[i]["id"], "source": metas[i]["source"]})
+            rep["sources"] = sorted({*rep["sources"], metas[i]["source"]})
+
+    stats.update(chunks_after=len(kept), removed=n - len(kept))
+    return emb_array[kept], [out[i] for i in kept], stats
 
 
 # ======================================
 #      BUILD FAISS INDEX (cosine via IP)
 # ======================================
 
-dim = emb_array.shape[1]
-print("Embedding dimension:", dim)
+def reduction_factory(dim: int, method: str = "pca") -> str:
+    # Re-normalize after projecting so inner product is still cosine
+    return f"{REDUCE_METHODS[method].format(dim=dim)},L2norm,Flat"
+
+
+def build_index(
+    emb_array: np.ndarray,
+    dim: Optional[int] = None,
+    method: str = "pca",
+):
+    n, d = emb_array.shape
+    if not dim or dim >= d:
+        index = faiss.IndexFlatIP(d)  # Inner product (after normalization = cosine)
+        index.add(emb_array)
+        return index
 
-index = faiss.IndexFlatIP(dim)  # Inner product (after normalization = cosine)
-index.add(emb_array)
+    if method not in REDUCE_METHODS:
+        raise ValueError(f"❌ Unknown reduction {method!r}; expected one of {list(REDUCE_METHODS)}")
+    if method in ("pca", "pcar") and n < dim:
+        raise ValueError(f"❌ PCA to {dim}d needs at least {dim} chunks (have {n}); use a smaller dim or --reduction random")
 
-print("FAISS index total vectors:", index.ntotal)
+    index = faiss.index_factory(d, reduction_factory(dim, method), faiss.METRIC_INNER_PRODUCT)
+    index.train(emb_array)
+    index.add(emb_array)
+    return index
 
 
 # ======================================
 #      SAVE INDEX + METADATA
 # ======================================
 
-faiss.write_index(index, str(INDEX_FILE))
-print("\n✅ Saved FAISS index to:", INDEX_FILE)
+def _file_sig(path: Path) -> List[int]:
+    st = path.stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def save_index(
+    index,
+    metas: List[Dict],
+    index_file: Path = INDEX_FILE,
+    meta_file: Path = META_FILE,
+    extra: Optional[Dict[str, Any]] = None,
+    before_publish: Optional[Callable[[], None]] = None,
+) -> str:
+    """
+    Write index + metadata (each via tmp file + rename), then the manifest
+    that running agents watch. Returns the new build id.
+    before_publish runs just ahead of the manifest, for files (e.g. arcs)
+    that must land in the same reload.
+    """
+    index_tmp = index_file.with_name(index_file.name + ".tmp")
+    faiss.write_index(index, str(index_tmp))
+
+    meta_tmp = meta_file.with_name(meta_file.name + ".tmp")
+    with open(meta_tmp, "w", encoding="utf-8") as f:
+        for m in metas:
+            f.write(json.dumps(m, ensure_ascii=False) + "\n")
+
+    os.replace(index_tmp, index_file)
+    os.replace(meta_tmp, meta_file)
+    if before_publish is not None:
+        before_publish()
+
+    build_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    manifest = {
+        "build_id": build_id,
+        "created_at": time.time(),
+        "ntotal": int(index.ntotal),
+        "dim": int(index.d),
+        "index_sig": _file_sig(index_file),
+        "meta_sig": _file_sig(meta_file),
+        **(extra or {}),
+    }
+    manifest_file = index_file.with_name(MANIFEST_NAME)
+    manifest_tmp = manifest_file.with_name(MANIFEST_NAME + ".tmp")
+    with open(manifest_tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_tmp, manifest_file)
+    return build_id
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the FAISS index from embeddings.jsonl")
+    parser.add_argument("--dim", type=int, default=INDEX_DIM, help="reduce vectors to this many dimensions")
+    parser.add_argument("--reduction", choices=list(REDUCE_METHODS), default=INDEX_REDUCTION)
+    parser.add_argument("--namespace", default="default", help="knowledge base to build")
+    parser.add_argument("--dedup", type=float, default=DEDUP_THRESHOLD,
+                        help="shingle containment that folds a chunk into a larger one (0 = keep all)")
+    parser.add_argument("--arcs", action="store_true",
+                        help="also build focus-arc centroids/candidates (loads the embedder)")
+    args = parser.parse_args()
+
+    from kb_registry import namespace_dir
+    kb_dir = namespace_dir(args.namespace)
+    embed_file, index_file, meta_file = (kb_dir / p.name for p in (EMBED_FILE, INDEX_FILE, META_FILE))
+
+    print("\n=== PATH DEBUG ===")
+    print("BASE_DIR:", BASE_DIR)
+    print("KB_DIR:", kb_dir)
+    print("EMBED_FILE exists?", embed_file.exists())
+
+    print("\n=== Loading embeddings from JSONL ===")
+    emb_array, metas = load_embeddings(embed_file)
+    print(f"Total vectors loaded: {len(metas)}")
+    print("Embedding matrix shape:", emb_array.shape)  # (N, D)
+
+    emb_array, metas, dedup = dedup_chunks(emb_array, metas, args.dedup)
+    stored_dim = min(args.dim or emb_array.shape[1], emb_array.shape[1])
+    if dedup["removed"]:
+        before, after = (dedup[k] * stored_dim * 4 / 1024 for k in ("chunks_before", "chunks_after"))
+        print(f"Dedup: {dedup['chunks_before']} -> {dedup['chunks_after']} chunks "
+              f"({dedup['removed']} near-duplicates folded), vectors {before:.1f}KB -> {after:.1f}KB")
+
+    index = build_index(emb_array, args.dim, args.reduction)
+    print("Embedding dimension:", emb_array.shape[1])
+    if args.dim and args.dim < emb_array.shape[1]:
+        print(f"Stored dimension: {args.dim} ({args.reduction}, projection saved in the index)")
+    print("FAISS index total vectors:", index.ntotal)
+
+    # Arcs are written just ahead of the manifest so agents reload both at once
+    before_publish = None
+    if args.arcs:
+        from apex_engine import TRAITS
+        from embedders import load_embedder
+        from focus_arcs import ARC_DESCRIPTIONS, ARCS_NAME, build_arcs, save_arcs
 
-with open(META_FILE, "w", encoding="utf-8") as f:
-    for m in metas:
-        f.write(json.dumps(m, ensure_ascii=False) + "\n")
+        desc = load_embedder().encode([ARC_DESCRIPTIONS[t] for t in TRAITS])
+        arcs = build_arcs(emb_array, desc)
+        before_publish = lambda: save_arcs(arcs, kb_dir, _file_sig(index_file))
 
-print("✅ Saved metadata to:", META_FILE)
+    build_id = save_index(index, metas, index_file, meta_file, extra={"dedup": dedup},
+                          before_publish=before_publish)
+    print("\n✅ Saved FAISS index to:", index_file)
+    print("✅ Saved metadata to:", meta_file)
+    if args.arcs:
+        print("✅ Saved focus arcs to:", kb_dir / ARCS_NAME)
+    print("✅ Build id:", build_id, "(running agents pick it up without a restart)")
 
-print("\n🎉 DONE: Vector index + metadata are ready.")
+    print("\n🎉 DONE: Vector index + metadata are ready.")
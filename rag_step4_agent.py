@@ -2,14 +2,10 @@
 
 import os
 import json
-from pathlib import Path
+import logging
 from dotenv import load_dotenv
 import google.generativeai as genai
 
-from sentence_transformers import SentenceTransformer
-import numpy as np
-import faiss
-
 from memory_system import (
     load_or_create_user,
     update_scores,
@@ -17,14 +13,32 @@ from memory_system import (
     log_interaction,
 )
 from scoring_engine import infer_scores
-from apex_engine import update_apex_state
+from apex_engine import determine_focus_arc, update_apex_state
+from persistence import UnitOfWork
+from conversation_memory import configure_encoder, search_memory, MEMORY_K
+from telemetry import span, trace, incr
+from embedders import EMBED_BACKEND, load_embedder
+from focus_arcs import ARC_MODE, arc_search
+from kb_registry import DEFAULT_NAMESPACE, get_kb, resolve_namespace, start_watcher
+from vector_filters import Filters
+from adaptive_k import K_MODE, trim
+from single_flight import SingleFlight, normalize_text
+
+logger = logging.getLogger("apexmind.agent")
 
 # ========================================
 #           SETUP KEYS + MODELS
 # ========================================
-import streamlit as st
+load_dotenv()
+API_KEY = os.getenv("GEMINI_API_KEY")
 
-API_KEY = st.secrets["GEMINI_API_KEY"]
+if not API_KEY:
+    # Streamlit deployments keep the key in .streamlit/secrets.toml
+    import streamlit as st
+    try:
+        API_KEY = st.secrets.get("GEMINI_API_KEY")
+    except Exception:
+        API_KEY = None
 
 
 if not API_KEY:
@@ -32,44 +46,81 @@ if not API_KEY:
 
 genai.configure(api_key=API_KEY)
 
-# Paths
-BASE_DIR = Path(__file__).resolve().parent
-KB_DIR = BASE_DIR / "Knowledge_base"
-INDEX_FILE = KB_DIR / "faiss_index.bin"
-META_FILE = KB_DIR / "faiss_meta.jsonl"
-
-print("Loading FAISS index…")
-index = faiss.read_index(str(INDEX_FILE))
-
-print("Loading metadata…")
-metadata = []
-with open(META_FILE, "r", encoding="utf-8") as f:
-    for line in f:
-        metadata.append(json.loads(line))
-
-print(f"Loaded {len(metadata)} metadata entries")
+# Knowledge bases are namespaced and loaded on first use (kb_registry);
+# the default one is loaded now so a missing index fails at startup
+print("Loading default knowledge base…")
+default_kb = get_kb(DEFAULT_NAMESPACE)
+print(f"Loaded {len(default_kb.metadata)} metadata entries")
+# New builds from rag_step3_build_index are loaded in the background and
+# swapped in; queries already running finish on the version they started on
+start_watcher()
 
-print("Loading embedding model (MiniLM)…")
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+print(f"Loading embedding model (MiniLM, {EMBED_BACKEND})…")
+embedder = load_embedder()
+configure_encoder(embedder.encode)
 
 
 # ========================================
 #              RETRIEVAL
 # ========================================
-def retrieve_context(query: str, k: int = 5):
-    """Retrieve top-k relevant chunks from the FAISS index."""
-    query_vec = embedder.encode([query]).astype("float32")
-    distances, indices = index.search(query_vec, k)
+# Chunks per query (an upper bound in adaptive k mode)
+RETRIEVE_K = 5
+
+
+def retrieve_context(
+    query: str,
+    k: int = RETRIEVE_K,
+    user_id: str | None = None,
+    memory_k: int = MEMORY_K,
+    namespace: str | None = None,
+    focus_trait: str | None = None,
+    arc_mode: str = ARC_MODE,
+    filters: Filters | None = None,
+    k_mode: str = K_MODE,
+):
+    """
+    Retrieve top-k relevant chunks from the FAISS index of `namespace`
+    (default knowledge base if None).
+    filters (e.g. {"source": ["discipline.txt"]}) are applied inside the
+    FAISS search, so up to k matching chunks come back, not k-then-filter.
+    With a focus_trait, the search leans toward that trait's arc using the
+    centroids/candidates precomputed at index time (see focus_arcs).
+    With k_mode="adaptive", k is an upper bound and weak or far-behind
+    chunks are dropped (see adaptive_k).
+    With a user_id, also pull up to memory_k relevant past interactions
+    from that user's conversational memory (same query embedding).
+    """
+    retrieved, _ = _retrieve(query, k, user_id, memory_k, namespace, focus_trait, arc_mode, filters, k_mode)
+    return retrieved
+
+
+def _retrieve(query, k, user_id, memory_k, namespace, focus_trait, arc_mode, filters, k_mode):
+    kb = get_kb(namespace)
+    with span("retrieve.embed"):
+        query_vec = embedder.encode([query]).astype("float32")
+    ids = kb.select(filters)
+    with span("retrieve.faiss_search", k=k, namespace=kb.namespace, arc=focus_trait,
+              filtered=ids is not None):
+        distances, indices = arc_search(kb.index, kb.arcs, query_vec, k, focus_trait, arc_mode, ids=ids)
 
     retrieved = []
     for score, idx in zip(distances[0], indices[0]):
         if idx == -1:
             continue
-        item = metadata[idx]
+        item = dict(kb.metadata[idx])
         item["score"] = float(score)
         retrieved.append(item)
 
-    return retrieved
+    retrieved, stats = trim(retrieved, k, k_mode)
+    incr("retrieval_chunks_total", stats["k"], mode=k_mode)
+    incr("retrieval_chunks_dropped_total", stats["dropped"], mode=k_mode)
+    incr("prompt_tokens_saved_est_total", stats["tokens_saved_est"])
+
+    if user_id is not None and memory_k > 0:
+        with span("retrieve.memory_search"):
+            retrieved.extend(search_memory(user_id, query_vec, k=memory_k))
+
+    return retrieved, stats
 
 
 # ========================================
@@ -99,10 +150,25 @@ Use the retrieved knowledge base context heavily in your reasoning.
 
 def generate_answer(user_query: str, retrieved_docs):
     """Generate the agent's final answer using Gemini + RAG context."""
+    with span("generate.prompt_build"):
+        final_prompt = _build_prompt(user_query, retrieved_docs)
+
+    with span("llm.generate"):
+        response = model.generate_content(final_prompt)
+    return response.text
+
+
+def _build_prompt(user_query: str, retrieved_docs) -> str:
     context_text = "\n\n".join(
         f"[{doc['source']}]: {doc['content']}"
         for doc in retrieved_docs
+        if doc.get("kind") != "memory"
     )
+    memory_text = "\n\n".join(
+        f"[{doc['source']}]: {doc['content']}"
+        for doc in retrieved_docs
+        if doc.get("kind") == "memory"
+    ) or "(none)"
 
     final_prompt = f"""
 {SYSTEM_PROMPT}
@@ -110,20 +176,43 @@ def generate_answer(user_query: str, retrieved_docs):
 ### KNOWLEDGE BASE CONTEXT:
 {context_text}
 
+### RELEVANT PAST SESSIONS WITH THIS USER:
+{memory_text}
+
 ### USER QUESTION:
 {user_query}
 
 ### FINAL ANSWER (psychological transformation, direct coaching):
 """
-
-    response = model.generate_content(final_prompt)
-    return response.text
+    return final_prompt
 
 
 # ========================================
 #            AGENT + MEMORY + APEX
 # ========================================
-def ask_agent(user_id: str, query: str):
+# Duplicate asks (double clicks, client retries) share one execution, so
+# the LLM, scoring and the session/EMA update run once
+_asks = SingleFlight("ask")
+
+
+def ask_agent(user_id: str, query: str, namespace: str | None = None, filters: Filters | None = None):
+    """
+    Traced entry point; see _ask_agent for the pipeline.
+    An identical ask (same user, namespace, filters and whitespace/case-
+    normalized text) in flight or just finished returns that result, marked
+    "coalesced".
+    """
+    key = (user_id, normalize_text(query), namespace, json.dumps(filters, sort_keys=True))
+
+    def run():
+        with trace("ask", user_id=user_id):
+            return _ask_agent(user_id, query, namespace, filters)
+
+    result, shared = _asks.do(key, run)
+    return dict(result, coalesced=shared)
+
+
+def _ask_agent(user_id: str, query: str, namespace: str | None = None, filters: Filters | None = None):
     """
     Main function:
     - Loads user profile
@@ -140,7 +229,16 @@ def ask_agent(user_id: str, query: str):
 
     # 2. Retrieve knowledge (RAG)
     print("\n=== Retrieving Knowledge ===")
-    retrieved = retrieve_context(query)
+    # Request override, else the user's program, else the default KB
+    namespace = resolve_namespace(profile, namespace)
+    # Lean retrieval toward the weakest trait once the user has been scored
+    focus_trait = None
+    if profile.get("sessions", 0) > 0:
+        focus_trait = determine_focus_arc(profile.get("scores", {}))["weak_trait"]
+    retrieved, retrieval = _retrieve(query, RETRIEVE_K, user_id, MEMORY_K, namespace, focus_trait,
+                                     ARC_MODE, filters, K_MODE)
+    logger.debug("Using %d/%d chunks (~%d prompt tokens saved)",
+                 retrieval["k"], retrieval["max_k"], retrieval["tokens_saved_est"])
 
     # 3. Generate agent answer
     print("\n=== Generating Final Answer ===")
@@ -154,24 +252,28 @@ def ask_agent(user_id: str, query: str):
         current_scores=current_scores,
     )
 
-    # 5. Update profile scores (EMA smoothing)
-    profile = update_scores(user_id, inferred_scores, weight=0.4)
-    progress = estimate_progress_level(profile)
-
-    # 6. Update Apex Engine (CSV + JSON meta)
-    apex = update_apex_state(user_id, profile["scores"])
-
-    # === SYNC APEX WITH PROFILE SESSION COUNT ===
-    # Ensure Apex's last_session matches the profile's session counter
-    apex["last_session"] = profile.get("sessions", 0)
-
-    # 7. Log interaction
-    log_interaction(
-        user_id=user_id,
-        user_input=query,
-        agent_response=answer,
-        scores_snapshot=profile["scores"],
-    )
+    # 5–7. Persist everything this request changed as one unit of work:
+    # nothing is written if any step fails, and all writes share one fsync
+    with UnitOfWork() as uow:
+        # 5. Update profile scores (EMA smoothing)
+        profile = update_scores(user_id, inferred_scores, weight=0.4, uow=uow)
+        progress = estimate_progress_level(profile)
+
+        # 6. Update Apex Engine (session store + JSON meta)
+        apex = update_apex_state(user_id, profile["scores"], uow=uow)
+
+        # === SYNC APEX WITH PROFILE SESSION COUNT ===
+        # Ensure Apex's last_session matches the profile's session counter
+        apex["last_session"] = profile.get("sessions", 0)
+
+        # 7. Log interaction
+        log_interaction(
+            user_id=user_id,
+            user_input=query,
+            agent_response=answer,
+            scores_snapshot=profile["scores"],
+            uow=uow,
+        )
 
     # 8. Return structured payload
     return {
@@ -180,6 +282,9 @@ def ask_agent(user_id: str, query: str):
         "progress": progress,
         "sessions": profile.get("sessions", 0),
         "apex": apex,
+        "context": retrieved,
+        "namespace": namespace,
+        "retrieval": retrieval,
     }
 
 
@@ -8,14 +8,23 @@ import google.generativeai as genai
 import os
 import json
 
+from telemetry import span, incr
+
 # ------------------------------
 # Setup Gemini
 # ------------------------------
 BASE_DIR = Path(__file__).resolve().parent
 
-import streamlit as st
+load_dotenv()
+API_KEY = os.getenv("GEMINI_API_KEY")
 
-API_KEY = st.secrets["GEMINI_API_KEY"]
+if not API_KEY:
+    # Streamlit deployments keep the key in .streamlit/secrets.toml
+    import streamlit as st
+    try:
+        API_KEY = st.secrets.get("GEMINI_API_KEY")
+    except Exception:
+        API_KEY = None
 
 
 if not API_KEY:
@@ -129,21 +138,24 @@ def infer_scores(
 {json.dumps(current_scores)}
 """
 
-    response = model.generate_content(prompt)
+    with span("llm.score"):
+        response = model.generate_content(prompt)
     raw = response.text.strip()
 
     # Try to parse JSON safely
     data: Dict[str, Any] = {}
     try:
-        # If model wrapped JSON in extra text, try to extract {...}
-        if not raw.startswith("{"):
-            start = raw.find("{")
-            end = raw.rfind("}")
-            if start != -1 and end != -1:
-                raw = raw[start : end + 1]
-        data = json.loads(raw)
+        with span("score.parse_json"):
+            # If model wrapped JSON in extra text, try to extract {...}
+            if not raw.startswith("{"):
+                start = raw.find("{")
+                end = raw.rfind("}")
+                if start != -1 and end != -1:
+                    raw = raw[start : end + 1]
+            data = json.loads(raw)
     except Exception:
         # Fallback: return current scores unchanged
+        incr("errors_total", stage="score_parse")
         return current_scores
 
     new_scores: Dict[str, float] = {}
@@ -0,0 +1,88 @@
+# single_flight.py — collapse duplicate in-flight calls into one execution
+
+from __future__ import annotations
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+import os
+import re
+import threading
+import time
+
+from telemetry import incr
+
+# A finished result is handed to duplicates for this long, so a retry that
+# arrives just after completion (double click, client timeout) reuses it
+ASK_COALESCE_WINDOW = float(os.getenv("APEXMIND_ASK_COALESCE_WINDOW", "30"))
+# Longest a duplicate waits for the leader before giving up (TimeoutError);
+# defaults to the API's own ask timeout
+ASK_WAIT_TIMEOUT = float(os.getenv("APEXMIND_ASK_WAIT_TIMEOUT",
+                                   os.getenv("APEXMIND_API_ASK_TIMEOUT", "120")))
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.finished_at = 0.0
+
+
+class SingleFlight:
+    """
+    do(key, fn): the first caller for a key runs fn; callers arriving while
+    it runs, or within `window` seconds after it succeeded, get its result.
+    Failures are shared with callers already waiting but never cached.
+    Waiting is bounded by `wait_timeout`, so a hung leader cannot pin
+    every retry.
+    """
+
+    def __init__(self, name: str, window: float = ASK_COALESCE_WINDOW,
+                 wait_timeout: float = ASK_WAIT_TIMEOUT):
+        self.name = name
+        self.window = window
+        self.wait_timeout = wait_timeout
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def _prune_locked(self, now: float) -> None:
+        expired = [k for k, c in self._calls.items()
+                   if c.done.is_set() and now - c.finished_at > self.window]
+        for k in expired:
+            del self._calls[k]
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Returns (result, shared): shared is True when another caller's
+        execution produced the result.
+        """
+        with self._lock:
+            self._prune_locked(time.monotonic())
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            incr("single_flight_shared_total", flight=self.name)
+            if not call.done.wait(self.wait_timeout):
+                incr("single_flight_wait_timeouts_total", flight=self.name)
+                raise TimeoutError(f"{self.name}: still running after {self.wait_timeout:.0f}s")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            raise
+        finally:
+            call.finished_at = time.monotonic()
+            call.done.set()
+        return call.result, False
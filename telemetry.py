@@ -0,0 +1,235 @@
+# telemetry.py — span timing, counters, Prometheus + JSONL trace export
+
+from __future__ import annotations
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+# Recent durations kept per span for quantiles
+SPAN_WINDOW = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_PREFIX = "apexmind"
+
+_trace_path: Optional[Path] = (
+    Path(os.environ["APEXMIND_TRACE_FILE"]) if os.getenv("APEXMIND_TRACE_FILE") else None
+)
+_trace_lock = threading.Lock()
+
+_current_trace: ContextVar[Optional[str]] = ContextVar("apexmind_trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("apexmind_span", default=None)
+
+
+class _SpanStats:
+    __slots__ = ("count", "total", "errors", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.recent: Deque[float] = deque(maxlen=SPAN_WINDOW)
+
+
+_lock = threading.Lock()
+_spans: Dict[str, _SpanStats] = {}
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+
+def configure(trace_path: Optional[str] = None) -> None:
+    """
+    Enable (or with None, disable) the JSONL span trace.
+    Also settable with the APEXMIND_TRACE_FILE environment variable.
+    """
+    global _trace_path
+    _trace_path = Path(trace_path) if trace_path else None
+
+
+def reset() -> None:
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+# ----------------------------
+# Recording
+# ----------------------------
+def incr(name: str, value: float = 1.0, **labels: str) -> None:
+    """
+    Bump a counter, e.g. incr("cache_hits_total", cache="conversation_memory").
+    """
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def _write_trace(record: Dict[str, Any]) -> None:
+    path = _trace_path
+    if path is None:
+        return
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    with _trace_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[None]:
+    """
+    Time a block. Durations feed the per-span summary; exceptions are
+    counted as errors and re-raised; nested spans share the trace id.
+    """
+    span_id = uuid.uuid4().hex[:16]
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+
+    start_wall = time.time()
+    t0 = time.perf_counter()
+    error: Optional[str] = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        _current_span.reset(token)
+
+        with _lock:
+            stats = _spans.get(name)
+            if stats is None:
+                stats = _spans[name] = _SpanStats()
+            stats.count += 1
+            stats.total += elapsed
+            stats.recent.append(elapsed)
+            if error is not None:
+                stats.errors += 1
+
+        if _trace_path is not None:
+            _write_trace({
+                "trace_id": _current_trace.get(),
+                "span_id": span_id,
+                "parent_id": parent_id,
+                "name": name,
+                "start": start_wall,
+                "duration_ms": elapsed * 1000.0,
+                "error": error,
+                **attrs,
+            })
+
+
+@contextmanager
+def trace(name: str, **attrs: Any) -> Iterator[str]:
+    """
+    Root span for one request: every span opened inside it carries the
+    same trace id in the JSONL trace.
+    """
+    trace_id = uuid.uuid4().hex
+    token = _current_trace.set(trace_id)
+    try:
+        with span(name, **attrs):
+            yield trace_id
+    finally:
+        _current_trace.reset(token)
+
+
+# ----------------------------
+# Export
+# ----------------------------
+def _quantile(sorted_vals, q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    pos = (len(sorted_vals) - 1) * q
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (pos - lo)
+
+
+def snapshot() -> Dict[str, Any]:
+    """
+    Current span summaries (ms) and counters as plain dicts.
+    """
+    with _lock:
+        spans = {
+            name: (s.count, s.total, s.errors, sorted(s.recent))
+            for name, s in _spans.items()
+        }
+        counters = dict(_counters)
+
+    out_spans = {}
+    for name, (count, total, errors, recent) in sorted(spans.items()):
+        out_spans[name] = {
+            "count": count,
+            "errors": errors,
+            "mean_ms": total / count * 1000.0 if count else 0.0,
+            **{f"p{int(q * 100)}_ms": _quantile(recent, q) * 1000.0 for q in QUANTILES},
+        }
+
+    out_counters = {}
+    for (name, labels), value in sorted(counters.items()):
+        label_str = ",".join(f"{k}={v}" for k, v in labels)
+        out_counters[f"{name}{{{label_str}}}" if label_str else name] = value
+
+    return {"spans": out_spans, "counters": out_counters}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text() -> str:
+    """
+    Render spans as a summary and counters in Prometheus text format.
+    """
+    with _lock:
+        spans = {
+            name: (s.count, s.total, s.errors, sorted(s.recent))
+            for name, s in _spans.items()
+        }
+        counters = dict(_counters)
+
+    metric = f"{METRIC_PREFIX}_span_duration_seconds"
+    lines = [
+        f"# HELP {metric} Duration of instrumented stages.",
+        f"# TYPE {metric} summary",
+    ]
+    for name, (count, total, _errors, recent) in sorted(spans.items()):
+        label = f'span="{_escape(name)}"'
+        for q in QUANTILES:
+            lines.append(f'{metric}{{{label},quantile="{q}"}} {_quantile(recent, q):.6f}')
+        lines.append(f"{metric}_sum{{{label}}} {total:.6f}")
+        lines.append(f"{metric}_count{{{label}}} {count}")
+
+    err_metric = f"{METRIC_PREFIX}_span_errors_total"
+    lines += [
+        f"# HELP {err_metric} Instrumented stages that raised.",
+        f"# TYPE {err_metric} counter",
+    ]
+    for name, (_count, _total, errors, _recent) in sorted(spans.items()):
+        lines.append(f'{err_metric}{{span="{_escape(name)}"}} {errors}')
+
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        full = f"{METRIC_PREFIX}_{name}"
+        if full not in seen:
+            lines.append(f"# TYPE {full} counter")
+            seen.add(full)
+        label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+        lines.append(f"{full}{{{label_str}}} {value:g}" if label_str else f"{full} {value:g}")
+
+    return "\n".join(lines) + "\n"
+
+
+def export_prometheus(path: str) -> None:
+    """
+    Write the Prometheus text to a file (e.g. for node_exporter textfiles).
+    """
+    target = Path(path)
+    tmp = target.with_name(target.name + ".tmp")
+    tmp.write_text(prometheus_text(), encoding="utf-8")
+    os.replace(tmp, target)
@@ -0,0 +1,22 @@
+# conftest.py — make the flat root modules importable from tests/
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import persistence  # noqa: E402
+
+
+@pytest.fixture
+def committer(tmp_path, monkeypatch):
+    """
+    A committer journaling under tmp_path, installed as the process-wide
+    one. Long interval: checkpoints only happen when a test asks for one.
+    """
+    c = persistence._GroupCommitter(tmp_path / "_journal", interval=3600.0)
+    monkeypatch.setattr(persistence, "_committer", c)
+    yield c
+    c.close()
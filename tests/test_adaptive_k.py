@@ -0,0 +1,18 @@
+# test_adaptive_k.py
+
+from adaptive_k import choose_k, trim
+
+
+def test_min_k_never_keeps_chunks_below_min_score():
+    assert choose_k([0.9, 0.2, 0.1], max_k=5, min_k=2, min_score=0.25) == 1
+    assert choose_k([0.2, 0.1], max_k=5, min_k=2, min_score=0.25) == 0
+
+
+def test_min_k_overrides_relative_cut():
+    assert choose_k([0.9, 0.5, 0.45], max_k=5, min_k=2, min_score=0.25, rel_score=0.75) == 2
+
+
+def test_fixed_mode_keeps_all():
+    items = [{"score": s, "content": "x" * 40} for s in (0.9, 0.1)]
+    kept, stats = trim(items, 5, "fixed")
+    assert len(kept) == 2 and stats["dropped"] == 0
@@ -0,0 +1,46 @@
+# test_apex_analytics.py
+
+import numpy as np
+import pytest
+
+import apex_analytics
+import apex_engine
+from apex_engine import TRAITS
+
+
+@pytest.fixture
+def user_dir(tmp_path, monkeypatch, committer):
+    monkeypatch.setattr(apex_engine, "USER_DIR", tmp_path)
+    monkeypatch.setattr(apex_analytics, "USER_DIR", tmp_path)
+    return tmp_path
+
+
+def test_fleet_metrics_match_scalar_versions(user_dir):
+    rng = np.random.default_rng(1)
+    for user_id, n in (("long", 40), ("short", 3), ("one", 1)):
+        for i in range(1, n + 1):
+            apex_engine.append_session_row(user_id, i, dict(zip(TRAITS, rng.uniform(0, 100, 6))))
+
+    fleet = apex_analytics.compute_fleet_metrics()
+    _, scores, _, _ = apex_analytics.load_session_tensor()
+    assert scores.shape == (3, apex_engine.MOMENTUM_WINDOW, len(TRAITS))
+
+    for row, user_id in enumerate(fleet["user_ids"]):
+        sessions = apex_engine.load_sessions(user_id)
+        assert fleet["sessions"][row] == len(sessions)
+        assert fleet["momentum"][row] == pytest.approx(apex_engine.compute_momentum(sessions), abs=1e-6)
+        assert fleet["volatility"][row] == pytest.approx(apex_engine.compute_volatility(sessions), abs=1e-6)
+        assert fleet["dominance_index"][row] == pytest.approx(
+            apex_engine.compute_dominance_index(sessions[-1]), abs=1e-6)
+
+
+def test_fleet_metrics_for_user_without_sessions(user_dir):
+    apex_engine.append_session_row("u", 1, dict(zip(TRAITS, [50.0] * len(TRAITS))))
+
+    fleet = apex_analytics.compute_fleet_metrics(["u", "none"])
+    assert fleet["sessions"].tolist() == [1, 0]
+    assert fleet["dominance_index"][0] == pytest.approx(apex_engine.compute_dominance_index(
+        apex_engine.load_sessions("u")[-1]), abs=1e-6)
+    assert fleet["dominance_index"][1] == apex_engine.compute_dominance_index({})
+    assert fleet["momentum"][1] == apex_engine.compute_momentum([])
+    assert fleet["volatility"][1] == apex_engine.compute_volatility([])
@@ -0,0 +1,59 @@
+# test_apex_engine.py
+
+import pytest
+
+import apex_engine
+from persistence import UnitOfWork
+
+
+@pytest.fixture
+def user_dir(tmp_path, monkeypatch, committer):
+    monkeypatch.setattr(apex_engine, "USER_DIR", tmp_path)
+    return tmp_path
+
+
+def test_append_after_torn_record_stays_aligned(user_dir):
+    apex_engine.append_session_row("u", 1, {"discipline": 10.0})
+    # Crash mid-append: half a record at the end of the file
+    with open(user_dir / "u_sessions.bin", "ab") as f:
+        f.write(b"\x07" * (apex_engine.SESSION_DTYPE.itemsize // 2))
+    apex_engine.append_session_row("u", 2, {"discipline": 20.0})
+
+    records = apex_engine.load_session_array("u")
+    assert records["session"].tolist() == [1, 2]
+    assert records["traits"][:, 0].tolist() == [10.0, 20.0]
+
+
+def _write_csv(path, rows):
+    header = "session,timestamp," + ",".join(apex_engine.TRAITS)
+    lines = [header] + [f"{n},2024-01-0{n}T00:00:00Z," + ",".join([str(v)] * len(apex_engine.TRAITS))
+                        for n, v in rows]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def test_reads_parse_legacy_csv_without_writing(user_dir):
+    csv_path = user_dir / "u_sessions.csv"
+    _write_csv(csv_path, [(2, 20.0), (1, 10.0)])
+    before = sorted(p.name for p in user_dir.iterdir())
+
+    assert apex_engine.session_count("u") == 2
+    assert apex_engine.load_session_array("u")["session"].tolist() == [1, 2]
+    assert sorted(p.name for p in user_dir.iterdir()) == before
+
+
+def test_append_migrates_legacy_csv_in_callers_unit(user_dir):
+    _write_csv(user_dir / "u_sessions.csv", [(1, 10.0)])
+
+    with pytest.raises(RuntimeError):
+        with UnitOfWork() as uow:
+            apex_engine.append_session_row("u", 2, {"discipline": 20.0}, uow=uow)
+            raise RuntimeError("request failed")
+    assert (user_dir / "u_sessions.csv").exists()
+    assert not (user_dir / "u_sessions.bin").exists()
+
+    with UnitOfWork() as uow:
+        apex_engine.append_session_row("u", 2, {"discipline": 20.0}, uow=uow)
+    assert not (user_dir / "u_sessions.csv").exists()
+    records = apex_engine.load_session_array("u")
+    assert records["session"].tolist() == [1, 2]
+    assert records["traits"][:, 0].tolist() == [10.0, 20.0]
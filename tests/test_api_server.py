@@ -0,0 +1,42 @@
+# test_api_server.py
+
+import threading
+
+import pytest
+
+import api_server
+
+
+class _SlowAgent:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def ask_agent(self, user_id, query, namespace, filters):
+        self.release.wait(5)
+        return {"answer": "ok"}
+
+
+def test_timed_out_ask_keeps_its_slot_until_done(monkeypatch):
+    agent = _SlowAgent()
+    monkeypatch.setattr(api_server, "_agent", agent)
+    monkeypatch.setattr(api_server, "API_ASK_TIMEOUT", 0.05)
+    monkeypatch.setattr(api_server, "_slots", threading.BoundedSemaphore(1))
+
+    with pytest.raises(TimeoutError):
+        api_server.handle_ask({"user_id": "u", "query": "q"})
+    # Still running in the pool, so the only slot is taken
+    with pytest.raises(api_server.ApiError) as e:
+        api_server.handle_ask({"user_id": "u", "query": "q"})
+    assert e.value.status == 503
+
+    agent.release.set()
+    api_server._pool.submit(lambda: None).result()
+    assert api_server._slots.acquire(timeout=1)
+
+
+@pytest.mark.parametrize("k", ["five", None, 2.5, [1]])
+def test_retrieve_rejects_non_integer_k(monkeypatch, k):
+    monkeypatch.setattr(api_server, "_agent", object())
+    with pytest.raises(api_server.ApiError) as e:
+        api_server.handle_retrieve({"query": "q", "k": k})
+    assert e.value.status == 400
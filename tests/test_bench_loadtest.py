@@ -0,0 +1,40 @@
+# test_bench_loadtest.py
+
+import ast
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from bench_loadtest import STAGES, StageTimer, check_stages, instrument
+
+AGENT_PATH = Path(__file__).resolve().parent.parent / "rag_step4_agent.py"
+
+
+def _called_names(path, function):
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    fn = next(n for n in tree.body if isinstance(n, ast.FunctionDef) and n.name == function)
+    return {n.func.id for n in ast.walk(fn) if isinstance(n, ast.Call) and isinstance(n.func, ast.Name)}
+
+
+def test_every_stage_is_called_by_ask_agent():
+    # Importing the agent needs the Gemini SDK; its source is enough here
+    called = _called_names(AGENT_PATH, "_ask_agent")
+    assert set(STAGES.values()) <= called
+
+
+def test_every_stage_records_a_sample():
+    uow = type("UnitOfWork", (), {"commit": lambda self: None})
+    agent = SimpleNamespace(UnitOfWork=uow, **{attr: (lambda *a, **kw: None) for attr in STAGES.values()})
+    timer = StageTimer()
+    instrument(agent, timer)
+
+    with pytest.raises(RuntimeError, match="retrieval"):
+        for stage, attr in STAGES.items():
+            if stage != "retrieval":
+                getattr(agent, attr)()
+        check_stages(timer)
+
+    agent._retrieve()
+    check_stages(timer)
+    assert all(len(timer.samples[stage]) == 1 for stage in STAGES)
@@ -0,0 +1,78 @@
+# test_cohort_stats.py
+
+import json
+
+import pytest
+
+import cohort_stats
+from apex_engine import TRAITS
+from persistence import UnitOfWork
+
+
+@pytest.fixture
+def cohort(tmp_path, monkeypatch, committer):
+    monkeypatch.setattr(cohort_stats, "USER_DIR", tmp_path)
+    monkeypatch.setattr(cohort_stats, "COHORT_PATH", tmp_path / "_cohort.json")
+    monkeypatch.setattr(cohort_stats, "COHORT_LOCK_PATH", tmp_path / "_cohort.lock")
+    monkeypatch.setattr(cohort_stats, "COHORT_FLUSH_INTERVAL", 0.0)
+    for name, value in (("_hists", None), ("_pending", []), ("_generation", 0),
+                        ("_registered", False), ("_last_sync", 0.0)):
+        monkeypatch.setattr(cohort_stats, name, value)
+    return tmp_path
+
+
+def _scores(v):
+    return {t: float(v) for t in TRAITS}
+
+
+def _profile(path, v):
+    path.write_text(json.dumps({"sessions": 1, "scores": _scores(v)}), encoding="utf-8")
+
+
+def test_sync_merges_other_writers(cohort):
+    cohort_stats.record_scores(None, _scores(50))
+
+    # Another process adds a user to the shared file meanwhile
+    data = json.loads(cohort_stats.COHORT_PATH.read_text())
+    data["metrics"]["avg_score"][cohort_stats._bin(90)] += 1
+    data["users"] += 1
+    cohort_stats.COHORT_PATH.write_text(json.dumps(data))
+
+    cohort_stats.record_scores(None, _scores(20))
+    data = json.loads(cohort_stats.COHORT_PATH.read_text())
+    assert sum(data["metrics"]["avg_score"]) == 3
+    assert cohort_stats.rank(_scores(100))["avg_score_percentile"] == 100.0
+
+
+def test_dead_writer_triggers_rebuild(cohort):
+    _profile(cohort / "a_profile.json", 40)
+    _profile(cohort / "b_profile.json", 60)
+    # Left by a crashed process: missing b, writer pid no longer exists
+    stale = {
+        "bins": cohort_stats.COHORT_BINS, "users": 1, "generation": 3,
+        "writers": [2 ** 22 + 12345],
+        "metrics": {m: [0] * cohort_stats.COHORT_BINS for m in cohort_stats.METRICS},
+    }
+    stale["metrics"]["avg_score"][cohort_stats._bin(40)] = 1
+    cohort_stats.COHORT_PATH.write_text(json.dumps(stale))
+
+    assert cohort_stats.rank(_scores(50))["cohort_size"] == 2
+    data = json.loads(cohort_stats.COHORT_PATH.read_text())
+    assert data["generation"] == 4 and data["writers"] == []
+
+
+def test_rank_counts_staged_update(cohort):
+    cohort_stats.record_scores(None, _scores(10))
+    with UnitOfWork() as uow:
+        cohort_stats.record_scores(None, _scores(80), uow=uow)
+        ranked = cohort_stats.rank(_scores(80), uow=uow)
+    assert ranked["cohort_size"] == 2
+    assert ranked["avg_score_percentile"] == 75.0
+    assert cohort_stats.rank(_scores(80)) == ranked
+
+
+def test_flush_deregisters_writer(cohort):
+    cohort_stats.record_scores(None, _scores(10))
+    assert json.loads(cohort_stats.COHORT_PATH.read_text())["writers"]
+    cohort_stats.flush()
+    assert json.loads(cohort_stats.COHORT_PATH.read_text())["writers"] == []
@@ -0,0 +1,46 @@
+# test_conversation_memory.py
+
+import numpy as np
+import pytest
+
+import conversation_memory
+import memory_system
+
+WORDS = ["sleep", "deadlift", "focus", "budget", "sprint", "journal"]
+
+
+def _encode(texts):
+    # Bag of known words: enough to tell which interaction a query matches
+    return np.array([[t.lower().count(w) for w in WORDS] for t in texts], dtype="float32") + 1e-3
+
+
+@pytest.fixture
+def user_dir(tmp_path, monkeypatch, committer):
+    monkeypatch.setattr(memory_system, "USER_DIR", tmp_path)
+    monkeypatch.setattr(conversation_memory, "USER_DIR", tmp_path)
+    monkeypatch.setattr(conversation_memory, "_cache", conversation_memory.OrderedDict())
+    return tmp_path
+
+
+def test_answer_text_is_searchable(user_dir, monkeypatch):
+    monkeypatch.setattr(conversation_memory, "_encoder", _encode)
+    memory_system.log_interaction("u", "How do I get stronger?", "Train the deadlift twice a week.")
+
+    hits = conversation_memory.search_memory("u", _encode(["deadlift"]))
+    assert len(hits) == 1 and "deadlift" in hits[0]["content"]
+
+
+def test_history_is_backfilled_on_next_interaction(user_dir, monkeypatch):
+    monkeypatch.setattr(conversation_memory, "_encoder", None)
+    memory_system.log_interaction("u", "My sleep is bad", "Fix the sleep schedule first.")
+    memory_system.log_interaction("u", "Money is tight", "Write a budget.")
+    (user_dir / "u_memory.f32").write_bytes(b"\0" * 24)  # input-only format
+
+    monkeypatch.setattr(conversation_memory, "_encoder", _encode)
+    assert conversation_memory.search_memory("u", _encode(["sleep"])) == []
+    memory_system.log_interaction("u", "Plan my sprint", "Sprint on one goal.")
+
+    assert not (user_dir / "u_memory.f32").exists()
+    contents = [h["content"] for h in conversation_memory.search_memory("u", _encode(["budget"]), k=3)]
+    assert "budget" in contents[0]
+    assert len(conversation_memory._load("u", len(WORDS)).entries) == 3
@@ -0,0 +1,88 @@
+# test_memory_system.py
+
+import pytest
+
+import memory_system
+import persistence
+from persistence import UnitOfWork
+
+
+@pytest.fixture
+def user_dir(tmp_path, monkeypatch, committer):
+    monkeypatch.setattr(memory_system, "USER_DIR", tmp_path)
+    return tmp_path
+
+
+def test_rotation_waits_for_commit(user_dir, monkeypatch):
+    memory_system.log_interaction("u", "first", "a")
+    monkeypatch.setattr(memory_system, "LOG_SEGMENT_MAX_BYTES", 1)
+
+    with pytest.raises(RuntimeError):
+        with UnitOfWork() as uow:
+            memory_system.log_interaction("u", "second", "b", uow=uow)
+            raise RuntimeError("request failed")
+
+    # Nothing rotated: the index still names the plain segment, which exists
+    log_dir = user_dir / "u_log"
+    assert (log_dir / "000001.jsonl").exists()
+    assert not (log_dir / "000001.jsonl.gz").exists()
+    assert [r["user_input"] for r in memory_system.load_recent_history("u")] == ["first"]
+
+    memory_system.log_interaction("u", "second", "b")
+    assert not (log_dir / "000001.jsonl").exists()
+    assert [r["user_input"] for r in memory_system.load_recent_history("u")] == ["first", "second"]
+
+
+def test_history_range_compares_datetimes(user_dir):
+    log_dir = user_dir / "u_log"
+    memory_system.log_interaction("u", "x", "y")
+    # isoformat() drops the fraction when microseconds == 0
+    lines = [
+        '{"timestamp": "2026-01-01T10:00:05Z", "user_input": "a"}',
+        '{"timestamp": "2026-01-01T10:00:05.500000Z", "user_input": "b"}',
+    ]
+    (log_dir / "000001.jsonl").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    index = memory_system._load_log_index("u")
+    index["segments"][0].update(start=None, end=None, count=2)
+    persistence.write_json(log_dir / "index.json", index)
+
+    got = memory_system.iter_history("u", start="2026-01-01T10:00:05.100000Z")
+    assert [r["user_input"] for r in got] == ["b"]
+    got = memory_system.iter_history("u", end="2026-01-01T10:00:05Z")
+    assert [r["user_input"] for r in got] == ["a"]
+
+
+def test_legacy_log_read_without_side_effects(user_dir):
+    legacy = user_dir / "u_log.jsonl"
+    legacy.write_text(
+        '{"user_input": "no timestamp"}\n'
+        '{"timestamp": "2026-01-01T10:00:00Z", "user_input": "old"}\n',
+        encoding="utf-8",
+    )
+
+    assert [r["user_input"] for r in memory_system.iter_history("u")] == ["no timestamp", "old"]
+    got = memory_system.iter_history("u", start="2025-12-31T00:00:00Z")
+    assert [r["user_input"] for r in got] == ["old"]
+    assert legacy.exists() and not (user_dir / "u_log").exists()
+
+    memory_system.log_interaction("u", "new", "r")
+    assert not legacy.exists()
+    assert [r["user_input"] for r in memory_system.load_recent_history("u")] == ["no timestamp", "old", "new"]
+
+
+def test_concurrent_writers_keep_every_line(user_dir):
+    import threading
+
+    def write(n):
+        for i in range(10):
+            memory_system.log_interaction("u", f"{n}-{i}", "r")
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    index = memory_system._load_log_index("u")
+    assert sum(s["count"] for s in index["segments"]) == 40
+    assert len(list(memory_system.iter_history("u"))) == 40
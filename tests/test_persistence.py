@@ -0,0 +1,313 @@
+# test_persistence.py
+
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+import persistence
+from persistence import PersistError, UnitOfWork, _Op, recover
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def _orphan_journal(journal_dir, *units, applied=(), boot=None, torn=None):
+    """
+    Write the journal a crashed process would leave: units are (seq, ops).
+    """
+    journal_dir.mkdir(exist_ok=True)
+    lines = [json.dumps({"boot": persistence._BOOT_ID if boot is None else boot, "pid": 1})]
+    lines += [json.dumps({"seq": seq, "ops": [op.to_json() for op in ops]}) for seq, ops in units]
+    if applied:
+        lines.append(json.dumps({"applied": list(applied)}))
+    text = "\n".join(lines) + "\n" + (torn or "")
+    path = journal_dir / "1-0.log"
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+def _run_child(tmp_path, body, wait=True):
+    script = textwrap.dedent(f"""
+        import sys
+        sys.path.insert(0, {str(REPO)!r})
+        from pathlib import Path
+        import persistence
+        tmp = Path({str(tmp_path)!r})
+        persistence._committer = persistence._GroupCommitter(tmp / "_journal", interval=3600.0)
+    """) + textwrap.dedent(body)
+    proc = subprocess.Popen([sys.executable, "-c", script], stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, text=True)
+    if wait:
+        proc.communicate(timeout=60)
+    return proc
+
+
+# -----------------------------
+# Recovery
+# -----------------------------
+def test_recover_replays_unapplied_unit(tmp_path):
+    journal_dir = tmp_path / "_journal"
+    target, log = tmp_path / "profile.json", tmp_path / "log.jsonl"
+    log.write_bytes(b"one\n")
+    orphan = _orphan_journal(journal_dir, (1, [
+        _Op("put", target, b'{"v": 2}'),
+        _Op("append", log, b"two\n", offset=4),
+    ]))
+
+    assert recover(journal_dir) == 1
+    assert target.read_bytes() == b'{"v": 2}'
+    assert log.read_bytes() == b"one\ntwo\n"
+    assert not orphan.exists()
+
+
+def test_recover_skips_applied_units_after_process_crash(tmp_path):
+    journal_dir = tmp_path / "_journal"
+    target = tmp_path / "profile.json"
+    target.write_bytes(b"newer, from a live process")
+    _orphan_journal(journal_dir, (1, [_Op("put", target, b"old")]), applied=[1])
+
+    assert recover(journal_dir) == 0
+    assert target.read_bytes() == b"newer, from a live process"
+
+
+def test_recover_replays_everything_after_reboot(tmp_path):
+    journal_dir = tmp_path / "_journal"
+    target = tmp_path / "profile.json"
+    target.write_bytes(b"lost by the crash")
+    _orphan_journal(journal_dir, (2, [_Op("put", target, b"2")]), (1, [_Op("put", target, b"1")]),
+                    applied=[1, 2], boot="previous-boot")
+
+    assert recover(journal_dir) == 2
+    assert target.read_bytes() == b"2"   # seq order, not file order
+
+
+def test_reboot_replay_does_not_revert_checkpointed_write(committer, tmp_path):
+    # Another process journaled seq 1 and never checkpointed; we then wrote
+    # the same file and checkpointed. After a reboot seq 1 must not win.
+    target = tmp_path / "profile.json"
+    with committer._lock as state:
+        state["seq"] = 1
+        state["journals"]["1-0.log"] = 1
+        committer._lock.save(state)
+    persistence.write_json(target, {"v": "newer"})
+    committer._checkpoint()
+
+    _orphan_journal(committer.journal_dir, (1, [_Op("put", target, b'{"v": "older"}')]),
+                    boot="previous-boot")
+    recover(committer.journal_dir)
+    assert json.loads(target.read_text()) == {"v": "newer"}
+
+
+def test_recover_is_idempotent_for_applied_appends(tmp_path):
+    journal_dir = tmp_path / "_journal"
+    log = tmp_path / "log.jsonl"
+    log.write_bytes(b"one\ntwo\nthree\n")
+    # Already applied, and later appends followed: must not truncate them
+    _orphan_journal(journal_dir, (1, [_Op("append", log, b"two\n", offset=4)]))
+
+    recover(journal_dir)
+    assert log.read_bytes() == b"one\ntwo\nthree\n"
+
+
+def test_recover_completes_torn_append(tmp_path):
+    journal_dir = tmp_path / "_journal"
+    log = tmp_path / "log.jsonl"
+    log.write_bytes(b"one\ntw")
+    _orphan_journal(journal_dir, (1, [_Op("append", log, b"two\n", offset=4)]))
+
+    recover(journal_dir)
+    assert log.read_bytes() == b"one\ntwo\n"
+
+
+def test_recover_drops_torn_final_line(tmp_path):
+    journal_dir = tmp_path / "_journal"
+    a, b = tmp_path / "a", tmp_path / "b"
+    torn = json.dumps({"seq": 2, "ops": [_Op("put", b, b"B").to_json()]})[:20]
+    _orphan_journal(journal_dir, (1, [_Op("put", a, b"A")]), torn=torn)
+
+    assert recover(journal_dir) == 1
+    assert a.read_bytes() == b"A"
+    assert not b.exists()
+
+
+def test_recover_replays_deletes(tmp_path):
+    journal_dir = tmp_path / "_journal"
+    seg, gz = tmp_path / "000001.jsonl", tmp_path / "000001.jsonl.gz"
+    seg.write_bytes(b"x\n")
+    _orphan_journal(journal_dir, (1, [_Op("put", gz, b"zz"), _Op("delete", seg)]))
+
+    recover(journal_dir)
+    assert gz.read_bytes() == b"zz" and not seg.exists()
+
+
+def test_recover_skips_removed_directories(tmp_path):
+    journal_dir = tmp_path / "_journal"
+    _orphan_journal(journal_dir, (1, [_Op("put", tmp_path / "gone" / "index.json", b"{}")]))
+    assert recover(journal_dir) == 1
+    assert not (tmp_path / "gone").exists()
+
+
+def test_recover_leaves_live_journals_alone(committer, tmp_path):
+    with UnitOfWork() as uow:
+        uow.put(tmp_path / "state.json", b"1")
+    before = committer.journal_path.read_bytes()
+
+    assert recover(committer.journal_dir) == 0
+    assert committer.journal_path.read_bytes() == before
+
+
+# -----------------------------
+# Group commit
+# -----------------------------
+def test_commit_applies_without_checkpoint(committer, tmp_path):
+    target = tmp_path / "state.json"
+    with UnitOfWork() as uow:
+        uow.put(target, b"1")
+
+    assert target.read_bytes() == b"1"
+    # Idle commits leave the journal for the size/interval checkpoint
+    assert b"state.json" in committer.journal_path.read_bytes()
+
+
+def test_checkpoint_truncates_journal(committer, tmp_path):
+    with UnitOfWork() as uow:
+        uow.put(tmp_path / "state.json", b"1")
+    committer._checkpoint()
+    assert b"state.json" not in committer.journal_path.read_bytes()
+
+
+def test_failed_uow_writes_nothing(committer, tmp_path):
+    target = tmp_path / "state.json"
+    with pytest.raises(RuntimeError):
+        with UnitOfWork() as uow:
+            uow.put(target, b"1")
+            raise RuntimeError("boom")
+    assert not target.exists()
+
+
+def test_failed_apply_keeps_journal_and_reapplies(committer, tmp_path):
+    target = tmp_path / "state.json"
+    target.mkdir()  # os.replace onto a directory fails
+
+    with pytest.raises(PersistError):
+        with UnitOfWork() as uow:
+            uow.put(target, b"1")
+
+    # The checkpoint re-applies instead of truncating; still failing, so
+    # the journal keeps the unit
+    committer._checkpoint()
+    assert committer._failed
+    assert b"state.json" in committer.journal_path.read_bytes()
+
+    target.rmdir()
+    committer._checkpoint()
+    assert target.read_bytes() == b"1"
+    assert not committer._failed
+    assert b"state.json" not in committer.journal_path.read_bytes()
+
+
+def test_plain_append_is_ordered_with_units(committer, tmp_path):
+    log = tmp_path / "log.jsonl"
+    with UnitOfWork() as uow:
+        uow.append(log, b"a\n")
+    persistence.append_bytes(log, b"b\n")
+    with UnitOfWork() as uow:
+        uow.append(log, b"c\n")
+    assert log.read_bytes() == b"a\nb\nc\n"
+
+
+def test_append_after_put_in_same_unit(committer, tmp_path):
+    log = tmp_path / "log.jsonl"
+    log.write_bytes(b"stale stale stale\n")
+    with UnitOfWork() as uow:
+        uow.put(log, b"a\n")
+        uow.append(log, b"b\n")
+        uow.delete(tmp_path / "other")
+    assert log.read_bytes() == b"a\nb\n"
+
+
+def test_aligned_append_overwrites_torn_record(committer, tmp_path):
+    store = tmp_path / "sessions.bin"
+    store.write_bytes(b"AAAA" + b"BB")  # one whole record + a torn one
+    persistence.append_bytes(store, b"CCCC", align=4)
+    assert store.read_bytes() == b"AAAACCCC"
+
+
+def test_close_removes_checkpointed_journal(tmp_path):
+    c = persistence._GroupCommitter(tmp_path / "_journal", interval=3600.0)
+    path = c.journal_path
+    c.submit([_Op("put", tmp_path / "x", b"1")])
+    c.close()
+    assert not path.exists()
+
+
+def test_lock_is_held_until_unit_closes(committer, tmp_path):
+    lock = persistence.FileLock(tmp_path / "x.lock")
+    with UnitOfWork() as uow:
+        lock.hold(uow)
+        assert lock._state.depth == 1
+    assert lock._state.depth == 0
+    assert os.path.exists(tmp_path / "x.lock")
+
+
+# -----------------------------
+# Several processes
+# -----------------------------
+def test_two_processes_append_to_one_file(committer, tmp_path):
+    log = tmp_path / "shared.log"
+    child = _run_child(tmp_path, f"""
+        for i in range(200):
+            persistence.append_bytes(Path({str(log)!r}), b"child %03d\\n" % i)
+        persistence._committer.close()
+    """, wait=False)
+    for i in range(200):
+        persistence.append_bytes(log, b"parent %03d\n" % i)
+    child.communicate(timeout=60)
+
+    lines = log.read_bytes().splitlines()
+    assert len(lines) == 400
+    assert sorted(lines) == sorted([b"child %03d" % i for i in range(200)]
+                                   + [b"parent %03d" % i for i in range(200)])
+
+
+def test_live_process_journal_survives_other_process_start(committer, tmp_path):
+    target = tmp_path / "profile.json"
+    child = _run_child(tmp_path, f"""
+        persistence.write_json(Path({str(target)!r}), {{"v": "child"}})
+        print("written", flush=True)
+        sys.stdin.readline()
+    """, wait=False)
+    assert child.stdout.readline().strip() == "written"
+
+    # Newer write here, then a process start's recovery: the child's
+    # uncheckpointed unit must not be replayed over it
+    persistence.write_json(target, {"v": "parent"})
+    assert recover(committer.journal_dir) == 0
+    assert json.loads(target.read_text()) == {"v": "parent"}
+
+    child.communicate("\n", timeout=60)
+
+
+def test_crash_mid_commit_is_finished_before_next_commit(committer, tmp_path):
+    done, lost = tmp_path / "done.json", tmp_path / "lost.json"
+    _run_child(tmp_path, f"""
+        import os
+        persistence.write_json(Path({str(done)!r}), {{"v": 1}})
+        real_apply = persistence._apply
+        def crash(op):
+            if op.path.name == "lost.json":
+                os._exit(1)   # journaled, lock held, not applied
+            real_apply(op)
+        persistence._apply = crash
+        persistence.write_json(Path({str(lost)!r}), {{"v": 1}})
+    """)
+    assert not lost.exists()
+
+    persistence.write_json(done, {"v": 2})
+    assert json.loads(lost.read_text()) == {"v": 1}
+    assert json.loads(done.read_text()) == {"v": 2}
+    assert [p.name for p in committer.journal_dir.glob("*.log")] == [committer.journal_path.name]
@@ -0,0 +1,34 @@
+# test_single_flight.py
+
+import threading
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_duplicates_share_one_execution():
+    flight = SingleFlight("t", window=10)
+    calls = []
+    assert flight.do("k", lambda: calls.append(1) or "r") == ("r", False)
+    assert flight.do("k", lambda: calls.append(1) or "r") == ("r", True)
+    assert len(calls) == 1
+
+
+def test_duplicate_wait_is_bounded():
+    flight = SingleFlight("t", window=10, wait_timeout=0.05)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "r"
+
+    leader = threading.Thread(target=flight.do, args=("k", slow))
+    leader.start()
+    started.wait(5)
+    with pytest.raises(TimeoutError):
+        flight.do("k", lambda: "unused")
+    release.set()
+    leader.join()
+    assert flight.do("k", lambda: "unused") == ("r", True)
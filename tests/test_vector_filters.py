@@ -0,0 +1,62 @@
+# test_vector_filters.py
+
+import faiss
+import numpy as np
+import pytest
+
+from vector_filters import MetadataPostings, filtered_search
+
+
+def _data(n=400, d=32, seed=0):
+    x = np.random.default_rng(seed).standard_normal((n, d)).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+@pytest.mark.parametrize("factory", ["Flat", "HNSW8", "PCA16,HNSW8", "PCA16,Flat"])
+def test_filtered_search_returns_only_subset(factory):
+    x = _data()
+    index = faiss.index_factory(x.shape[1], factory, faiss.METRIC_INNER_PRODUCT)
+    index.train(x)
+    index.add(x)
+
+    ids = np.array([3, 77, 150, 299], dtype="int64")
+    scores, found = filtered_search(index, x[:1], 10, ids)
+    assert sorted(found[0].tolist()) == ids.tolist()
+    assert np.all(np.diff(scores[0]) <= 1e-6)
+
+
+def test_reduced_index_short_result_falls_back_to_exact():
+    x = _data()
+    index = faiss.index_factory(x.shape[1], "PCA16,HNSW8", faiss.METRIC_INNER_PRODUCT)
+    index.train(x)
+    index.add(x)
+    faiss.downcast_index(index.index).hnsw.efSearch = 1
+
+    # Far from the query, so the graph walk comes back short
+    ids = np.argsort(x @ x[0])[:5].astype("int64")
+    scores, found = filtered_search(index, x[:1], 5, ids)
+    assert sorted(found[0].tolist()) == sorted(ids.tolist())
+
+    projected = index.chain.at(0).apply_py(x[:1])
+    stored = faiss.downcast_index(index.index).reconstruct_batch(found[0])
+    np.testing.assert_allclose(scores[0], stored @ projected[0], rtol=1e-5)
+
+
+def test_postings_match_list_fields():
+    postings = MetadataPostings([
+        {"source": "a.txt", "sources": ["a.txt"]},
+        {"source": "b.txt", "sources": ["b.txt", "a.txt"]},
+        {"source": "c.txt", "sources": ["c.txt"]},
+    ])
+    assert postings.select({"sources": "a.txt"}).tolist() == [0, 1]
+    assert postings.select({"source": ["b.txt", "c.txt"]}).tolist() == [1, 2]
+
+
+def test_source_filters_see_folded_sources_and_old_indexes():
+    postings = MetadataPostings([
+        {"source": "a.txt", "sources": ["a.txt", "b.txt"]},
+        {"source": "c.txt"},  # built before dedup recorded sources
+    ])
+    assert postings.select({"source": "b.txt"}).tolist() == [0]
+    assert postings.select({"sources": "c.txt"}).tolist() == [1]
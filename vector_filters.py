@@ -0,0 +1,130 @@
+# vector_filters.py — metadata predicates evaluated inside the FAISS search
+
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple, Union
+import threading
+
+import numpy as np
+import faiss
+
+from telemetry import span
+
+# {"source": ["discipline.txt", "strategy.txt"], ...}: any listed value
+# matches within a field, every field must match
+Filters = Dict[str, Union[str, List[str]]]
+
+# Both match any source a chunk's text appears in: "sources" when the index
+# was deduplicated (rag_step3_build_index.dedup_chunks), else "source"
+SOURCE_FIELDS = ("source", "sources")
+
+
+# ======================================
+#        METADATA POSTINGS
+# ======================================
+class MetadataPostings:
+    """
+    Sorted id arrays per (field, value), built lazily per field on first
+    use, so a filter resolves to ids without touching every chunk.
+    """
+
+    def __init__(self, metadata: List[Dict[str, Any]]):
+        self._metadata = metadata
+        self._fields: Dict[str, Dict[str, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def _field(self, field: str) -> Dict[str, np.ndarray]:
+        with self._lock:
+            postings = self._fields.get(field)
+            if postings is None:
+                lists: Dict[str, List[int]] = {}
+                for i, meta in enumerate(self._metadata):
+                    value = meta.get(field)
+                    if field in SOURCE_FIELDS:
+                        # Deduplicated chunks list every source they cover
+                        value = meta.get("sources") or meta.get("source")
+                    # List fields (e.g. "sources" on deduplicated chunks)
+                    # match on any element
+                    for v in value if isinstance(value, list) else [value]:
+                        if v is not None:
+                            lists.setdefault(str(v), []).append(i)
+                postings = {v: np.array(ids, dtype="int64") for v, ids in lists.items()}
+                self._fields[field] = postings
+        return postings
+
+    def values(self, field: str) -> List[str]:
+        return sorted(self._field(field))
+
+    def select(self, filters: Filters) -> np.ndarray:
+        ids: Optional[np.ndarray] = None
+        for field, wanted in filters.items():
+            wanted = [wanted] if isinstance(wanted, str) else list(wanted)
+            postings = self._field(field)
+            parts = [postings[v] for v in wanted if v in postings]
+            field_ids = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype="int64")
+            ids = field_ids if ids is None else np.intersect1d(ids, field_ids, assume_unique=True)
+        return ids if ids is not None else np.empty(0, dtype="int64")
+
+
+# ======================================
+#          FILTERED SEARCH
+# ======================================
+def _search_params(index, selector, probe_all: bool = False):
+    if isinstance(index, faiss.IndexPreTransform):
+        params = faiss.SearchParametersPreTransform()
+        params.index_params = _search_params(faiss.downcast_index(index.index), selector, probe_all)
+        return params
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nlist if probe_all else ivf.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def _exact_on_subset(index, query_vec: np.ndarray, k: int, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Scores stored vectors of the subset directly; cost is O(len(ids)).
+    # A reduced index stores projected vectors, so the query is projected
+    # through the same chain and scored in that space.
+    q = np.ascontiguousarray(query_vec, dtype="float32")
+    while isinstance(index, faiss.IndexPreTransform):
+        for i in range(index.chain.size()):
+            q = index.chain.at(i).apply_py(q)
+        index = faiss.downcast_index(index.index)
+
+    vecs = index.reconstruct_batch(ids)
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        scores = vecs @ q[0]
+        top = np.argsort(-scores)[:k]
+    else:
+        scores = ((vecs - q[0]) ** 2).sum(axis=1)
+        top = np.argsort(scores)[:k]
+    return scores[top][None, :].astype("float32"), ids[top][None, :]
+
+
+def filtered_search(index, query_vec: np.ndarray, k: int, ids: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    index.search restricted to `ids` (None = no filter). Returns
+    min(k, len(ids)) results: the selector is applied during the search,
+    and an approximate index that comes back short (the subset sits outside
+    the probed IVF lists / HNSW neighbourhood) is retried exhaustively.
+    """
+    if ids is None:
+        return index.search(query_vec, k)
+    if len(ids) == 0:
+        return np.empty((1, 0), dtype="float32"), np.empty((1, 0), dtype="int64")
+
+    want = min(k, len(ids))
+    with span("retrieve.filtered_search", subset=len(ids)):
+        selector = faiss.IDSelectorBatch(ids)
+        distances, indices = index.search(query_vec, want, params=_search_params(index, selector))
+
+        if (indices[0] >= 0).sum() < want:
+            if faiss.try_extract_index_ivf(index) is not None:
+                # Every list, but the selector still skips ids outside the subset
+                distances, indices = index.search(
+                    query_vec, want, params=_search_params(index, selector, probe_all=True))
+            else:
+                distances, indices = _exact_on_subset(index, query_vec, want, ids)
+    keep = indices[0] >= 0
+    return distances[:, keep], indices[:, keep]